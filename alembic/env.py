@@ -8,6 +8,10 @@ from alembic import context
 from db.models import Base  # Import your Base model here
 from db.models.users import *
 from db.models.books import *
+from db.models.outbox import *
+from db.models.catalog_load import *
+from db.models.tokens import *
+from db.models.catalog_change import *
 
 
 import sys
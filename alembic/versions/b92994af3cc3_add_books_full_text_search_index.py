@@ -0,0 +1,29 @@
+"""Add books full text search index
+
+Revision ID: b92994af3cc3
+Revises: 5ad8d21867c7
+Create Date: 2026-10-18 09:12:41.503218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from db.fts import create_search_index, drop_search_index
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b92994af3cc3'
+down_revision: Union[str, Sequence[str], None] = '5ad8d21867c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    create_search_index(op.get_bind())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_search_index(op.get_bind())
@@ -1,87 +1,77 @@
 import os
-import csv
-from fastapi import BackgroundTasks, APIRouter
+from fastapi import APIRouter
 from fastapi import UploadFile, File
-from db import get_session
-from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException
+from db import get_async_session, get_read_session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Body, Depends, HTTPException
 from services.auth import confirm_staff_token, get_current_staff_user
 from schema.users import LoggedInStaffUser
-from schema.books import BookCreate, Rental, RentalRequest
-from db.models.books import RentalModel, BookModel, WishlistModel, RentalStatusEnum
+from schema.books import Rental, RentalRequest
+from db.models.books import RentalModel, BookModel
 from db.models.users import UserModel
-from services.email import send_email
+from services.outbox import enqueue_email
 from datetime import timedelta, datetime, timezone
-from fastapi import status
+from fastapi import status, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from services.reports import rental_report_statement, report_row, iter_csv, iter_ndjson
+from services.importer import import_books, DuplicateMode, IMPORT_BATCH_SIZE
+from services.http_cache import catalog_cache
+from services.rentals import rent_books, return_books, RentalConflict, RENTAL_BATCH_MAX
+from typing import List, Literal, Optional
 
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 BOOK_RENTAL_DUE_DAYS = os.environ.get("BOOK_RENTAL_DUE_DAYS", 30) # Default rental period in days
+REPORT_PAGE_SIZE = int(os.environ.get("REPORT_PAGE_SIZE", 500))
+REPORT_MAX_PAGE_SIZE = int(os.environ.get("REPORT_MAX_PAGE_SIZE", 5000))
+REPORT_STREAM_BATCH_SIZE = 1000
 
 @router.get("/confirm-staff-access")
-def confirm_staff_access(token: str, db: Session = Depends(get_session)):
+async def confirm_staff_access(token: str, db: AsyncSession = Depends(get_async_session)):
     try:
-        user = confirm_staff_token(token, db)
+        user = await confirm_staff_token(token, db)
     except HTTPException as e:
         raise HTTPException(status_code=e.status_code, detail=e.detail)
     return {"msg": "Email confirmed. You can now log in."}
 
 @router.post("/rental/return")
-def return_rental(
+async def return_rental(
     data: RentalRequest,
-    background_tasks: BackgroundTasks,
     staff_user: LoggedInStaffUser = Depends(get_current_staff_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     if not staff_user.is_staff:
         raise HTTPException(status_code=403, detail="Not authorized: staff only")
-    user_id = data.user
-    book_id = data.books
-    # Find and delete the rental record
-    rental = db.query(RentalModel).filter_by(user_id=user_id, book_id=book_id).first()
-    if not rental:
+    # Deleting the rental is the transition: a concurrent return of the same
+    # rental finds nothing to delete.
+    [result] = await return_books(db, [data])
+    if result["status"] != "returned":
         raise HTTPException(status_code=404, detail="Rental record not found for this user and book")
-    db.delete(rental)
-    # Mark the book as available
-    book = db.query(BookModel).filter(BookModel.id == book_id).first()
-    if book:
-        book.rental_status = RentalStatusEnum.available.value
-    db.commit()
-    # List all users who have wishlisted this book
-    wishlists = db.query(WishlistModel).filter(WishlistModel.books.any(id=book_id)).all()
-    users = []
-    for wishlist in wishlists:
-        user = db.query(UserModel).filter(UserModel.id == wishlist.user_id).first()
-        if user and hasattr(user, 'email'):
-            users.append(user.email)
-    if users:
-        subject = f"Book '{book.title}' is now available"
-        body = f"The book '{book.title}' is now available for rental. You can rent it from the library."
-        for email in users:
-            background_tasks.add_task(send_email, subject=subject, body=body, to=email)
+    await db.commit()
+    catalog_cache.bump()
     return {
         "message": "Rental returned, book marked as available.",
     }
 
 @router.post("/rental/extend")
-def extend_rental(
+async def extend_rental(
     data: RentalRequest,
-    background_tasks: BackgroundTasks,
     staff_user: LoggedInStaffUser = Depends(get_current_staff_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
     if not staff_user.is_staff:
         raise HTTPException(status_code=403, detail="Not authorized: staff only")
     user_id = data.user
     book_id = data.books
-    rental = db.query(RentalModel).filter_by(user_id=user_id, book_id=book_id).first()
+    rental = await db.scalar(select(RentalModel).filter_by(user_id=user_id, book_id=book_id))
     if not rental:
         raise HTTPException(status_code=404, detail="Rental record not found for this user and book")
     due_days = int(os.environ.get("BOOK_RENTAL_DUE_DAYS", 30))
     new_due_date = rental.rental_date + timedelta(days=due_days)
-    user = db.query(UserModel).filter(UserModel.id == user_id).first()
-    book = db.query(BookModel).filter(BookModel.id == book_id).first()
+    user = await db.get(UserModel, user_id)
+    book = await db.get(BookModel, book_id)
     if not user or not book:
         raise HTTPException(status_code=404, detail="User or Book not found")
     subject = f"Book Rental Extended: {book.title}"
@@ -90,145 +80,147 @@ def extend_rental(
         f"Your rental for the book '{book.title}' (ID: {book.id}) has been extended.\n"
         f"New due date: {new_due_date.strftime('%Y-%m-%d')}.\n\nHappy reading!"
     )
-    background_tasks.add_task(send_email, subject=subject, body=body, to=str(user.email))
+    enqueue_email(db, subject=subject, body=body, to=str(user.email))
+    await db.commit()
     return {"message": "Rental due date extension notification sent.", "new_due_date": new_due_date.strftime('%Y-%m-%d')}
 
-@router.get("/rental/report")
-async def rental_report(staff_user: LoggedInStaffUser = Depends(get_current_staff_user), db :Session = Depends(get_session),username: int | None = None):
-    """
-    Generate a rental report for an admin.
-    """
-    # Placeholder for actual implementation
-    if username:
-        return {"message": f"Rental report for user {username}"}
-    return {"message": "Rental report generated successfully"}
+async def _stream_report(bind, stmt, format: str):
+    # The request's session is closed before a streaming body is sent, so the
+    # stream owns its session and walks a server-side cursor in small batches.
+    async with AsyncSession(bind=bind) as session:
+        result = await session.stream(stmt.execution_options(yield_per=REPORT_STREAM_BATCH_SIZE))
+        if format == "csv":
+            yield "".join(iter_csv([]))
+        async for rows in result.partitions():
+            yield "".join(iter_csv(rows, header=False) if format == "csv" else iter_ndjson(rows))
+
 
 @router.get("/rental/report")
-def rental_report_all(
+async def rental_report_all(
+    request: Request,
+    response: Response,
     staff_user: LoggedInStaffUser = Depends(get_current_staff_user),
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_read_session),
+    overdue: bool = Query(False, description="Only books that are past their due date"),
+    user_id: Optional[int] = Query(None, description="Only books rented by this user id"),
+    username: Optional[str] = Query(None, description="Only books rented by this username"),
+    language: Optional[str] = Query(None, description="Only books in this language"),
+    limit: Optional[int] = Query(None, ge=1, description=f"Page size (default {REPORT_PAGE_SIZE}, max {REPORT_MAX_PAGE_SIZE}); unlimited when streaming"),
+    after: Optional[int] = Query(None, description="Id of the last book of the previous page"),
+    format: Literal["json", "csv", "ndjson"] = Query("json", description="'csv' and 'ndjson' stream the whole report"),
 ):
+    """
+    Generate a rental report for an admin.
+    """
     if not staff_user.is_staff:
         raise HTTPException(status_code=403, detail="Not authorized: staff only")
-    due_days = int(BOOK_RENTAL_DUE_DAYS)
-    report = []
-    books = db.query(BookModel).all()
-    for book in books:
-        rental = db.query(RentalModel).filter(RentalModel.book_id == book.id).first()
-        if rental:
-            user = db.query(UserModel).filter(UserModel.id == rental.user_id).first()
-            rented_on = rental.rental_date
-            if hasattr(rented_on, 'to_pydatetime'):
-                rented_on = rented_on.to_pydatetime()
-            due_date = rented_on + timedelta(days=due_days)
-            today = datetime.now(timezone.utc)
-            if hasattr(due_date, 'to_pydatetime'):
-                due_date = due_date.to_pydatetime()
-            # Ensure both are Python datetime objects
-            from datetime import datetime as dt
-            if isinstance(today, dt) and isinstance(due_date, dt):
-                past_due_days = (today - due_date).days if today > due_date else 0
-            else:
-                past_due_days = None
-            report.append({
-                "book_id": book.id,
-                "title": book.title,
-                "rental_status": book.rental_status.value if hasattr(book.rental_status, 'value') else book.rental_status,
-                "rentee": user.username if user else None,
-                "rented_on": rented_on.strftime('%Y-%m-%d'),
-                "due_date": due_date.strftime('%Y-%m-%d'),
-                "past_due_days": past_due_days
-            })
-        else:
-            report.append({
-                "book_id": book.id,
-                "title": book.title,
-                "rental_status": book.rental_status.value if hasattr(book.rental_status, 'value') else book.rental_status,
-                "rentee": None,
-                "rented_on": None,
-                "due_date": None,
-                "past_due_days": None
-            })
+    filters = dict(
+        due_days=int(BOOK_RENTAL_DUE_DAYS),
+        overdue_only=overdue,
+        user_id=user_id,
+        username=username,
+        language=language,
+        after=after,
+    )
+    dialect = db.bind.dialect.name
+    if format != "json":
+        stmt = rental_report_statement(dialect, limit=limit, **filters)
+        media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+        return StreamingResponse(_stream_report(db.bind, stmt, format), media_type=media_type)
+
+    limit = min(limit or REPORT_PAGE_SIZE, REPORT_MAX_PAGE_SIZE)
+    report = [report_row(row) for row in await db.execute(rental_report_statement(dialect, limit=limit, **filters))]
+    if len(report) == limit:
+        next_url = request.url.include_query_params(after=report[-1]["book_id"], limit=limit)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
     return {"report": report}
 
 @router.post("/books/bulk-create")
 async def bulk_upload(
     staff_user: LoggedInStaffUser = Depends(get_current_staff_user),
-    db: Session = Depends(get_session),
-    file: UploadFile = File(...)
+    db: AsyncSession = Depends(get_async_session),
+    file: UploadFile = File(...),
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=50000, description="Rows validated and inserted per batch"),
+    on_duplicate: DuplicateMode = Query("insert", description="Rows whose ISBN exists: 'insert' anyway, 'skip' them or 'update' the existing book"),
 ):
+    """
+    Import books from a CSV upload of any size, streaming it in batches.
+    Returns counts, throughput and the rows that were rejected.
+    """
     if not staff_user.is_staff:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
     if file.content_type not in ["text/csv", "application/vnd.ms-excel"]:
         raise HTTPException(status_code=400, detail="File must be a CSV")
-    contents = await file.read()
-    if len(contents) > 10 * 1024 * 1024: # Max !0 MB
-        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
-    decoded = contents.decode("utf-8")
-    reader = csv.DictReader(decoded.splitlines())
-    created = 0
-    for row in reader:
-        try:
-            book_data = BookCreate(
-                isbn=row["ISBN"],
-                authors=row["Authors"],
-                publication_year=int(row["Publication Year"]),
-                title=row["Title"],
-                language=row["Language"],
-                rental_status="available"
-            )
-            book = BookModel(
-                isbn=book_data.isbn,
-                authors=book_data.authors,
-                publication_year=book_data.publication_year,
-                title=book_data.title,
-                language=book_data.language,
-                rental_status=book_data.rental_status
-            )
-            db.add(book)
-            created += 1
-        except Exception as e:
-            continue  # skip invalid rows
-    db.commit()
-    return {"message": f"Bulk upload completed successfully. {created} books added."}
+    try:
+        report = await import_books(db, file.file, batch_size=batch_size, on_duplicate=on_duplicate)
+    finally:
+        # Batches commit as they go, so even a failed import may have changed the catalog.
+        catalog_cache.bump()
+    return {"message": f"Bulk upload completed. {report.created} books added.", **report.as_dict()}
 
 
 
 @router.post("/rental")
-def rent_book(
+async def rent_book(
     data: RentalRequest,
-    background_tasks: BackgroundTasks,
     staff_user: LoggedInStaffUser = Depends(get_current_staff_user),
-    db: Session = Depends(get_session),
+    db: AsyncSession = Depends(get_async_session),
     
 ):
     if not staff_user.is_staff:
         raise HTTPException(status_code=403, detail="Not authorized: staff only")
-    user_id = data.user
-    book_id = data.books
-    if not user_id or not book_id:
+    if not data.user or not data.books:
         raise HTTPException(status_code=400, detail="Missing user or book id")
-    user = db.query(UserModel).filter(UserModel.id == user_id).first()
-    book = db.query(BookModel).filter(BookModel.id == book_id).first()
-    if not user or not book:
+    # Only the request whose conditional update flips the book to borrowed
+    # gets to rent it; the others fail fast with a 409.
+    [result] = await rent_books(db, [data])
+    if result["status"] == "not_found":
         raise HTTPException(status_code=404, detail="User or Book not found")
-    rental = RentalModel(user_id=user_id, book_id=book_id)
-    db.add(rental)
-    book.rental_status = RentalStatusEnum.borrowed
-    db.commit()
-    db.refresh(rental)
-    # Email details
-    rental_date = rental.rental_date
-    due_days = int(os.environ.get("BOOK_RENTAL_DUE_DAYS", 30))
-    due_date = rental_date + timedelta(days=due_days)
-    subject = f"Book Rental Confirmation: {book.title}"
-    body = (
-        f"Dear {user.username},\n\n"
-        f"You have rented the book '{book.title}' (ID: {book.id}) on {rental_date.strftime('%Y-%m-%d')}.\n"
-        f"Your due date is {due_date.strftime('%Y-%m-%d')}.\n\nHappy reading!"
-    )
-    background_tasks.add_task(send_email, subject=subject, body=body, to=str(user.email))
-    return {"message": "Book rented successfully", "rental_id": rental.id}
+    if result["status"] == "unavailable":
+        raise RentalConflict()
+    await db.commit()
+    catalog_cache.bump()
+    return {"message": "Book rented successfully", "rental_id": result["rental_id"]}
+
+
+def _batch_summary(results: list, done: str) -> dict:
+    applied = sum(result["status"] == done for result in results)
+    return {"message": f"{applied} of {len(results)} books {done}.", done: applied, "results": results}
+
+@router.post("/rental/batch")
+async def rent_books_batch(
+    data: List[RentalRequest] = Body(..., min_length=1, max_length=RENTAL_BATCH_MAX),
+    staff_user: LoggedInStaffUser = Depends(get_current_staff_user),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Rent many books in one transaction, e.g. a patron's whole checkout.
+    Unavailable or unknown books are reported per item and skipped; each
+    patron gets one confirmation email.
+    """
+    if not staff_user.is_staff:
+        raise HTTPException(status_code=403, detail="Not authorized: staff only")
+    results = await rent_books(db, data)
+    await db.commit()
+    catalog_cache.bump()
+    return _batch_summary(results, "rented")
+
+@router.post("/rental/return/batch")
+async def return_rentals_batch(
+    data: List[RentalRequest] = Body(..., min_length=1, max_length=RENTAL_BATCH_MAX),
+    staff_user: LoggedInStaffUser = Depends(get_current_staff_user),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    Return many rentals in one transaction. Users waiting for any of the
+    books get one email listing all of them.
+    """
+    if not staff_user.is_staff:
+        raise HTTPException(status_code=403, detail="Not authorized: staff only")
+    results = await return_books(db, data)
+    await db.commit()
+    catalog_cache.bump()
+    return _batch_summary(results, "returned")
 
 
 
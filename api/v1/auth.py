@@ -1,20 +1,20 @@
 import os
 import asyncio
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from db import get_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_session
 from schema.users import UserCreate
-from services.auth import register_user, generate_confirmation_token, confirm_email_token, resend_confirmation_token, authenticate_user
-from services.email import send_email
-from schema.auth import ResendTokenRequest, Token
+from services.auth import register_user, generate_confirmation_token, confirm_email_token, resend_confirmation_token, authenticate_user, refresh_tokens, revoke_refresh_token
+from services.outbox import enqueue_email
+from schema.auth import ResendTokenRequest, Token, RefreshRequest
 
 
 router = APIRouter(prefix="/auth")
 
 @router.post('/login', summary="Create access and refresh tokens for user", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_session)):
-    access_token, refresh_token = authenticate_user(
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_session)):
+    access_token, refresh_token = await authenticate_user(
         username=form_data.username,
         password=form_data.password,
         session=db
@@ -29,36 +29,53 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     }
 
 
+@router.post('/refresh', summary="Exchange a refresh token for new access and refresh tokens", response_model=Token)
+async def refresh(data: RefreshRequest, db: AsyncSession = Depends(get_async_session)):
+    access_token, refresh_token = await refresh_tokens(data.refresh_token, db)
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer"
+    }
+
+
+@router.post('/logout', summary="Revoke a refresh token")
+async def logout(data: RefreshRequest, db: AsyncSession = Depends(get_async_session)):
+    await revoke_refresh_token(data.refresh_token, db)
+    return {"message": "Refresh token revoked."}
+
+
 @router.get("/confirm-email")
-def confirm_email_route(token: str, db: Session = Depends(get_session)):
+async def confirm_email_route(token: str, db: AsyncSession = Depends(get_async_session)):
     try:
-        user = confirm_email_token(token, db)
+        user = await confirm_email_token(token, db)
     except HTTPException as e:
         raise HTTPException(status_code=e.status_code, detail=e.detail)
     return {"msg": "Email confirmed. You can now log in."}
 
 
 @router.post("/register")
-def register(user: UserCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_session)):
-    registered_user = register_user(user, db)
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_session)):
+    registered_user = await register_user(user, db)
     if not register_user:
         raise HTTPException(status_code=400, detail="User registration failed.")
     token = generate_confirmation_token(str(registered_user.email))
     subject = "Confirm your email"
     body = f"Please confirm your email by clicking the link: {os.getenv('HOST')}: {os.getenv('PORT')}/api/v1/auth/confirm-email?token={token}"
-    background_tasks.add_task(send_email, subject=subject, body=body, to=str(registered_user.email))
+    enqueue_email(db, subject=subject, body=body, to=str(registered_user.email))
+    await db.commit()
     return {"message": f"User {registered_user.username} registered successfully. Please check your email for confirmation."}
 
 
 @router.post("/resend-confirmation")
-def resend_confirmation_token_request(
+async def resend_confirmation_token_request(
     resend_request: ResendTokenRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
-    token = resend_confirmation_token(username=resend_request.username, password=resend_request.password, email=str(resend_request.email), session=db)
+    token = await resend_confirmation_token(username=resend_request.username, password=resend_request.password, email=str(resend_request.email), session=db)
     subject = "Confirm your email"
     body = f"Please confirm your email by clicking the link: {os.getenv('HOST')}: {os.getenv('PORT')}/api/v1/auth/confirm-email?token={token}"
-    background_tasks.add_task(send_email, subject=subject, body=body, to=str(resend_request.email))
+    enqueue_email(db, subject=subject, body=body, to=str(resend_request.email))
+    await db.commit()
     return {"message": f"Confirmation email sent to {resend_request.email}. Please check your inbox."}
     
\ No newline at end of file
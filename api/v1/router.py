@@ -1,7 +1,17 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from .auth import router as auth_router
 from .users import router as users_router
 from .admin import router as rentals_router
+from db import database_status, get_async_session
+from services.outbox import outbox_dispatcher
+from services.principal_cache import principal_cache
+from services.hashing import password_hasher
+from services.auth import access_token_verifier
+from services.http_cache import catalog_cache
+from services.catalog_snapshot import catalog_snapshot
+from services.metrics import registry, refresh_outbox_pending
 
 v1_router = APIRouter(prefix="/api/v1")
 
@@ -24,4 +34,23 @@ async def health_check():
     """
     Health check endpoint to verify the API is running.
     """
-    return {"status": "ok", "message": "API is running"}
+    return {
+        "status": "ok",
+        "message": "API is running",
+        "database": database_status(),
+        "email": outbox_dispatcher.engine.stats(),
+        "principal_cache": principal_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "access_tokens": access_token_verifier.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "catalog_snapshot": catalog_snapshot.stats(),
+    }
+
+
+@v1_router.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+async def metrics(db: AsyncSession = Depends(get_async_session)):
+    """
+    Prometheus scrape endpoint.
+    """
+    await refresh_outbox_pending(db)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,93 +1,175 @@
-from fastapi import APIRouter, status
-from services.email import send_email 
-from fastapi import  Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from db import get_session
+from fastapi import APIRouter, status, Query, Request
+from fastapi.responses import StreamingResponse
+from services.outbox import enqueue_email
+from fastapi import  Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_session, get_read_session
+from db.routing import reads_from_replica, DATABASE_MAX_REPLICA_LAG
 from schema.users import LoggedInUser
 import os
-from db.models.books import WishlistModel, BookModel
-from schema.books import Wishlist, BookBase
+from db.models.books import BookModel
+from schema.books import Wishlist, WishlistBooks, BookBase, Book
 from services.auth import generate_confirmation_token, get_current_user
-from typing import List, Optional
+from services.search import filter_key, search_books_statement
+from services.http_cache import catalog_cache
+from services.catalog_snapshot import catalog_snapshot
+from services.wishlist import wishlist_id, wishlist_book_ids, existing_book_ids, add_books, remove_books
+from typing import List, Literal, Optional
+from pydantic import TypeAdapter
 
 router = APIRouter(prefix="/user")
 
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", 50))
+SEARCH_MAX_PAGE_SIZE = int(os.environ.get("SEARCH_MAX_PAGE_SIZE", 500))
+SEARCH_STREAM_BATCH_SIZE = 500
+
+_books_adapter = TypeAdapter(List[BookBase])
+
 
 @router.get("/wishlist", response_model=Wishlist)
-def get_user_wislist(user: LoggedInUser = Depends(get_current_user), db: Session = Depends(get_session)):
-    wishlist = db.query(WishlistModel).filter(WishlistModel.user_id == user.id).first()
-    if not wishlist:
+async def get_user_wislist(user: LoggedInUser = Depends(get_current_user), db: AsyncSession = Depends(get_read_session)):
+    wishlist = await wishlist_id(db, user.id)
+    if wishlist is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wishlist not found for user")
-    book_ids = [book.id for book in wishlist.books]
-    return Wishlist(
-        id=wishlist.__dict__["id"],
-        user_id=wishlist.__dict__["user_id"],
-        book_ids=book_ids
-    )
+    return Wishlist(id=wishlist, user_id=user.id, book_ids=await wishlist_book_ids(db, wishlist))
 
 @router.post("/wishlist")
-def add_to_wishlist(book_id: int, user: LoggedInUser = Depends(get_current_user), db: Session = Depends(get_session)):
-    book = db.query(BookModel).filter(BookModel.id == book_id).first()
-    if not book:
+async def add_to_wishlist(book_id: int, user: LoggedInUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_session)):
+    if not await existing_book_ids(db, [book_id]):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-    wishlist = db.query(WishlistModel).filter(WishlistModel.user_id == user.id).first()
-    if not wishlist:
-        wishlist = WishlistModel(user_id=user.id, books=[])
-        db.add(wishlist)
-        db.commit()
-        db.refresh(wishlist)
-    if book not in wishlist.books:
-        wishlist.books.append(book)
-        db.commit()
+    await add_books(db, await wishlist_id(db, user.id, create=True), [book_id])
+    await db.commit()
     return {"message": "Book added to wishlist successfully"}
 
 @router.delete("/wishlist/{book_id}")
-def remove_from_wishlist(book_id: int, user: LoggedInUser = Depends(get_current_user), db: Session = Depends(get_session)):
-    wishlist = db.query(WishlistModel).filter(WishlistModel.user_id == user.id).first()
-    if not wishlist:
+async def remove_from_wishlist(book_id: int, user: LoggedInUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_session)):
+    wishlist = await wishlist_id(db, user.id)
+    if wishlist is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wishlist not found for user")
-    book = db.query(BookModel).filter(BookModel.id == book_id).first()
-    if not book:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
-    if book in wishlist.books:
-        wishlist.books.remove(book)
-        db.commit()
+    if await remove_books(db, wishlist, [book_id]):
+        await db.commit()
         return {"message": "Book removed from wishlist successfully"}
-    else:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not in wishlist")
+    if not await existing_book_ids(db, [book_id]):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found")
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not in wishlist")
+
+@router.post("/wishlist/bulk-add")
+async def bulk_add_to_wishlist(request: WishlistBooks, user: LoggedInUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_session)):
+    """
+    Add many books in one transaction; either all of them exist and are
+    added, or nothing changes.
+    """
+    missing = set(request.book_ids) - await existing_book_ids(db, request.book_ids)
+    if missing:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Books not found: {sorted(missing)}")
+    added = await add_books(db, await wishlist_id(db, user.id, create=True), request.book_ids)
+    await db.commit()
+    return {"message": f"{added} books added to wishlist", "added": added, "already_in_wishlist": len(set(request.book_ids)) - added}
+
+@router.post("/wishlist/bulk-remove")
+async def bulk_remove_from_wishlist(request: WishlistBooks, user: LoggedInUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_session)):
+    wishlist = await wishlist_id(db, user.id)
+    if wishlist is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wishlist not found for user")
+    removed = await remove_books(db, wishlist, request.book_ids)
+    await db.commit()
+    return {
+        "message": f"{len(removed)} books removed from wishlist",
+        "removed": removed,
+        "not_in_wishlist": sorted(set(request.book_ids) - set(removed)),
+    }
+
+def _book_out(book: BookModel, schema=BookBase):
+    rental_status = str(getattr(book.rental_status, 'value', book.rental_status))
+    if rental_status not in ("available", "borrowed"):
+        rental_status = "available"
+    fields = dict(
+        isbn=getattr(book, "isbn"),
+        authors=getattr(book, "authors"),
+        publication_year=getattr(book, "publication_year"),
+        title=getattr(book, "title"),
+        language=getattr(book, "language"),
+        rental_status=rental_status  # type: ignore
+    )
+    if schema is Book:
+        fields["id"] = book.id
+    return schema(**fields)
+
+
+async def _stream_books_ndjson(bind, stmt):
+    # The request's session is closed before a streaming body is sent, so the
+    # stream owns its session and walks a server-side cursor in small batches.
+    async with AsyncSession(bind=bind) as session:
+        books = await session.stream_scalars(stmt.execution_options(yield_per=SEARCH_STREAM_BATCH_SIZE))
+        async for book in books:
+            yield _book_out(book, Book).model_dump_json() + "\n"
+
+
+async def _search_page(db: AsyncSession, stmt) -> list[tuple[int, BookBase]]:
+    if not catalog_snapshot.loaded:
+        return [(book.id, _book_out(book)) for book in (await db.scalars(stmt)).all()]
+    # The database picks and orders the matches; the snapshot renders them.
+    await catalog_snapshot.refresh(db)
+    ids = (await db.scalars(stmt.with_only_columns(BookModel.id))).all()
+    found = catalog_snapshot.books(ids)
+    missing = [book_id for book_id in ids if book_id not in found]
+    if missing:  # committed after the refresh
+        for book in await db.scalars(select(BookModel).where(BookModel.id.in_(missing))):
+            found[book.id] = _book_out(book, Book).model_dump()
+    return [(book_id, BookBase.model_construct(**found[book_id])) for book_id in ids if book_id in found]
+
 
 @router.get("/search", response_model=List[BookBase], tags=["search"])
-def search_books(
+async def search_books(
+    request: Request,
     author: Optional[str] = None,
     title: Optional[str] = None,
-    db: Session = Depends(get_session)
+    limit: Optional[int] = Query(None, ge=1, description=f"Page size (default {SEARCH_PAGE_SIZE}, max {SEARCH_MAX_PAGE_SIZE}); unlimited when streaming"),
+    after: Optional[int] = Query(None, description="Id of the last book of the previous page"),
+    format: Literal["json", "ndjson"] = Query("json", description="'ndjson' streams one book (with its id) per line"),
+    db: AsyncSession = Depends(get_read_session)
 ):
-    query = db.query(BookModel)
-    if author:
-        query = query.filter(BookModel.authors.ilike(f"%{author}%"))
-    if title:
-        query = query.filter(BookModel.title.ilike(f"%{title}%"))
-    books = query.all()
-    result = []
-    for book in books:
-        rental_status = str(getattr(book.rental_status, 'value', book.rental_status))
-        if rental_status not in ("available", "borrowed"):
-            rental_status = "available"
-        result.append(BookBase(
-            isbn=getattr(book, "isbn"),
-            authors=getattr(book, "authors"),
-            publication_year=getattr(book, "publication_year"),
-            title=getattr(book, "title"),
-            language=getattr(book, "language"),
-            rental_status=rental_status  # type: ignore
-        ))
-    return result
+    dialect = db.bind.dialect.name
+    if format == "ndjson":
+        stmt = search_books_statement(dialect, author=author, title=title, after=after, limit=limit)
+        return StreamingResponse(_stream_books_ndjson(db.bind, stmt), media_type="application/x-ndjson")
+
+    limit = min(limit or SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE)
+    # Filters that run the same query share an entry.
+    key = catalog_cache.key("search", author=filter_key(dialect, author), title=filter_key(dialect, title), after=after, limit=limit)
+    cached = catalog_cache.get(key)
+    if cached is not None:
+        return catalog_cache.respond(request, cached)
+
+    version = catalog_cache.version
+    stmt = search_books_statement(dialect, author=author, title=title, after=after, limit=limit)
+    books = await _search_page(db, stmt)
+    headers = {}
+    if len(books) == limit:
+        next_url = request.url.include_query_params(after=books[-1][0], limit=limit)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    body = _books_adapter.dump_json([book for _, book in books])
+    ttl = DATABASE_MAX_REPLICA_LAG if reads_from_replica(db) else None
+    return catalog_cache.respond(request, catalog_cache.set(key, version, body, headers, ttl=ttl))
+
+
+@router.get("/books/isbn/{isbn}", response_model=List[Book], tags=["search"])
+async def get_books_by_isbn(isbn: str, db: AsyncSession = Depends(get_read_session)):
+    if catalog_snapshot.loaded:
+        await catalog_snapshot.refresh(db)
+        books = [Book.model_construct(**book) for book in catalog_snapshot.by_isbn(isbn)]
+    else:
+        books = [_book_out(book, Book) for book in await db.scalars(select(BookModel).where(BookModel.isbn == isbn).order_by(BookModel.id))]
+    if not books:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No book with this ISBN")
+    return books
 
 
 @router.post("/request-staff-access")
-def request_staff_access(
-    background_tasks: BackgroundTasks,
-    user: LoggedInUser = Depends(get_current_user)
+async def request_staff_access(
+    user: LoggedInUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session)
 ):
     if not user:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
@@ -95,5 +177,6 @@ def request_staff_access(
     token = generate_confirmation_token(user.email)
     subject = "Staff Access Request"
     body = f"User {user.username} has requested staff access. Please review their request at {os.getenv('HOST')}:{os.getenv('PORT')}/api/v1/admin/confirm-staff-access?token={token}."
-    background_tasks.add_task(send_email, subject=subject, body=body, to=os.getenv("ADMIN_EMAIL"))
+    enqueue_email(db, subject=subject, body=body, to=os.getenv("ADMIN_EMAIL", "admin@library.com"))
+    await db.commit()
     return {"message": f"Staff access request for {user.username} has been sent."}
@@ -0,0 +1,9 @@
+"""
+Load tests for the v1 API.
+
+``python -m bench.seed`` builds the schema from the models (as the test
+fixtures do) and fills it with a catalog, patrons, staff, rentals and
+wishlists; ``python -m bench.load`` boots the app against it (with the
+bundled SMTP sink) and drives a traffic mix, printing throughput, latency
+percentiles and queries per request as JSON.
+"""
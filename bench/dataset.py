@@ -0,0 +1,378 @@
+"""
+Deterministic synthetic datasets at catalog scale.
+
+The catalog is modelled on ``books.csv``: author first and last names, title
+words and lengths, the language mix, the publication years and the share of
+co-authored books are sampled from their frequencies there. Authors have
+power-law productivity (a few write many books). Patrons wishlist books with
+power-law popularity, and a share of the catalog is on loan, some of it
+overdue as of ``as_of``.
+
+Every table draws from its own ``random.Random`` stream derived from
+``--seed``, so a seed always produces the same rows. The output is written
+either straight to a database with bulk inserts, with indexes deferred as in
+the catalog loader, or to CSV files (books in the ``books.csv`` layout)::
+
+    python -m bench.dataset --books 1000000 --users 100000 --database-url sqlite:///big.db
+    python -m bench.dataset --books 1000000 --users 100000 --csv dataset/
+"""
+import argparse
+import bisect
+import csv
+import itertools
+import json
+import math
+import os
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Iterable, Iterator, Optional
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.engine import Engine
+from db.models.books import BookModel, RentalModel, RentalStatusEnum, WishlistModel, wishlist_books
+from db.models.users import UserModel
+from services.catalog_loader import deferred_indexes
+from passlib.hash import bcrypt
+from services.hashing import MIN_ROUNDS, password_hasher
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOOKS_CSV = os.path.join(ROOT, "books.csv")
+BENCH_PASSWORD = "bench-password"
+BENCH_SALT = "benchbenchbenchbench.."  # fixed, so generated files are byte-identical
+CHUNK_SIZE = 5000
+_TITLE_WORD = re.compile(r"[^\s(),#:]+")
+
+
+def reader_email(n: int) -> str:
+    return f"reader{n}@bench.example.com"
+
+
+def staff_email(n: int) -> str:
+    return f"staff{n}@bench.example.com"
+
+
+def bench_password_hash() -> str:
+    return bcrypt.using(rounds=password_hasher.rounds or MIN_ROUNDS, salt=BENCH_SALT).hash(BENCH_PASSWORD)
+
+
+def isbn10(n: int) -> str:
+    """
+    A valid ISBN-10 for book number ``n``.
+    """
+    body = f"{n % 10 ** 9:09d}"
+    check = (11 - sum((10 - position) * int(digit) for position, digit in enumerate(body)) % 11) % 11
+    return body + ("X" if check == 10 else str(check))
+
+
+class Distribution:
+    """
+    Sample values with their observed frequencies.
+    """
+
+    def __init__(self, counts: Counter):
+        self.values = list(counts)
+        self.cumulative = list(itertools.accumulate(counts.values()))
+
+    def sample(self, rng: random.Random):
+        return self.values[bisect.bisect_right(self.cumulative, rng.random() * self.cumulative[-1])]
+
+
+def power_law_rank(rng: random.Random, n: int, skew: float) -> int:
+    """
+    A rank in ``[0, n)`` with probability roughly proportional to
+    ``(rank + 1) ** -skew``, by inverting the continuous CDF.
+    """
+    u = rng.random()
+    if abs(skew - 1.0) < 1e-9:
+        x = n ** u
+    else:
+        x = ((n ** (1 - skew) - 1) * u + 1) ** (1 / (1 - skew))
+    return min(int(x), n) - 1
+
+
+def scatter(n: int) -> int:
+    """
+    A multiplier coprime to ``n``: ``rank * m % n`` permutes ``[0, n)``, so
+    popular ranks land on ids spread over the whole catalog.
+    """
+    multiplier = max(int(n * 0.6180339887), 1)  # golden ratio: neighbours in rank end up far apart
+    while math.gcd(multiplier, n) != 1:
+        multiplier += 1
+    return multiplier
+
+
+@dataclass
+class CatalogModel:
+    first_names: Distribution
+    last_names: Distribution
+    title_words: Distribution
+    title_lengths: Distribution
+    languages: Distribution
+    years: Distribution
+    coauthor_rate: float
+
+    @classmethod
+    def from_csv(cls, path: str = BOOKS_CSV) -> "CatalogModel":
+        first_names, last_names, words, lengths, languages, years = (Counter() for _ in range(6))
+        books = coauthored = 0
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                books += 1
+                authors = [name.strip() for name in row["Authors"].split(",") if name.strip()]
+                coauthored += len(authors) > 1
+                for name in authors:
+                    *first, last = name.split()
+                    first_names[" ".join(first) or last] += 1
+                    last_names[last] += 1
+                title = _TITLE_WORD.findall(row["Title"])
+                words.update(title)
+                lengths[len(title)] += 1
+                languages[row["Language"] or "eng"] += 1
+                if row["Publication Year"]:
+                    years[int(float(row["Publication Year"]))] += 1
+        return cls(
+            Distribution(first_names), Distribution(last_names), Distribution(words), Distribution(lengths),
+            Distribution(languages), Distribution(years), coauthored / books,
+        )
+
+
+class DatasetGenerator:
+    """
+    Rows for every table, generated lazily; ids run from 1 so rows of one
+    table can refer to another without reading it back.
+    """
+
+    def __init__(
+        self,
+        model: CatalogModel,
+        books: int,
+        users: int,
+        staff: int = 5,
+        seed: int = 0,
+        authors: Optional[int] = None,
+        author_skew: float = 0.6,
+        reader_skew: float = 0.6,
+        popularity_skew: float = 1.1,
+        wishlist_rate: float = 0.3,
+        wishlist_mean: float = 8,
+        rental_rate: float = 0.08,
+        overdue_rate: float = 0.25,
+        due_days: int = int(os.environ.get("BOOK_RENTAL_DUE_DAYS", 30)),
+        as_of: Optional[datetime] = None,
+    ):
+        self.model = model
+        self.book_count = books
+        self.user_count = users
+        self.staff_count = staff
+        self.seed = seed
+        self.author_count = authors or max(books // 8, 1)
+        self.author_skew = author_skew
+        self.reader_skew = reader_skew
+        self.popularity_skew = popularity_skew
+        self.wishlist_rate = wishlist_rate
+        self.wishlist_mean = wishlist_mean
+        self.rental_rate = rental_rate
+        self.overdue_rate = overdue_rate
+        self.due_days = due_days
+        # Midnight today by default, so runs on the same day match exactly.
+        self.as_of = as_of or datetime.combine(date.today(), dt_time())
+        self._rentals: Optional[dict] = None
+
+    def rng(self, table: str) -> random.Random:
+        return random.Random(f"{self.seed}:{table}")
+
+    def popular_book(self, rng: random.Random, multiplier: int) -> int:
+        return power_law_rank(rng, self.book_count, self.popularity_skew) * multiplier % self.book_count + 1
+
+    def author_names(self) -> list[str]:
+        rng = self.rng("authors")
+        return [f"{self.model.first_names.sample(rng)} {self.model.last_names.sample(rng)}" for _ in range(self.author_count)]
+
+    def title(self, rng: random.Random) -> str:
+        words = [self.model.title_words.sample(rng) for _ in range(max(self.model.title_lengths.sample(rng), 1))]
+        return " ".join([words[0][:1].upper() + words[0][1:], *words[1:]])
+
+    def year(self, rng: random.Random) -> int:
+        year = self.model.years.sample(rng)
+        if year >= 1900:
+            year = min(year + rng.randint(-5, 5), self.as_of.year)
+        return year
+
+    def rentals(self) -> dict[int, tuple[int, datetime]]:
+        """
+        Active rentals: book id -> (user id, rental date). Heavy readers
+        (power-law over patrons) hold most of them.
+        """
+        if self._rentals is None:
+            rng = self.rng("rentals")
+            self._rentals = {}
+            for book_id in sorted(rng.sample(range(1, self.book_count + 1), int(self.book_count * self.rental_rate))):
+                user_id = power_law_rank(rng, self.user_count, self.reader_skew) + 1
+                if rng.random() < self.overdue_rate:
+                    days = rng.uniform(self.due_days + 1, self.due_days + 90)
+                else:
+                    days = rng.uniform(0, self.due_days)
+                self._rentals[book_id] = (user_id, self.as_of - timedelta(days=days))
+        return self._rentals
+
+    def books(self) -> Iterator[dict]:
+        rng = self.rng("books")
+        authors = self.author_names()
+        rented = self.rentals()
+        for book_id in range(1, self.book_count + 1):
+            names = [authors[power_law_rank(rng, len(authors), self.author_skew)]]
+            if rng.random() < self.model.coauthor_rate:
+                names.append(authors[rng.randrange(len(authors))])
+            yield {
+                "id": book_id,
+                "isbn": isbn10(book_id),
+                "authors": ", ".join(dict.fromkeys(names)),
+                "publication_year": self.year(rng),
+                "title": self.title(rng),
+                "language": self.model.languages.sample(rng),
+                "rental_status": RentalStatusEnum.borrowed if book_id in rented else RentalStatusEnum.available,
+            }
+
+    def users(self, password_hash: str) -> Iterator[dict]:
+        for n in range(1, self.user_count + 1):
+            yield {"id": n, "username": f"reader{n}", "email": reader_email(n), "password": password_hash, "is_active": True, "is_staff": False}
+        for n in range(1, self.staff_count + 1):
+            yield {"id": self.user_count + n, "username": f"staff{n}", "email": staff_email(n), "password": password_hash, "is_active": True, "is_staff": True}
+
+    def rental_rows(self) -> Iterator[dict]:
+        for book_id, (user_id, rental_date) in self.rentals().items():
+            yield {"user_id": user_id, "book_id": book_id, "rental_date": rental_date}
+
+    def wishlist_owners(self) -> list[int]:
+        return sorted(self.rng("wishlists").sample(range(1, self.user_count + 1), int(self.user_count * self.wishlist_rate)))
+
+    def wishlists(self) -> Iterator[dict]:
+        for wishlist_id, user_id in enumerate(self.wishlist_owners(), 1):
+            yield {"id": wishlist_id, "user_id": user_id}
+
+    def wishlist_entries(self) -> Iterator[dict]:
+        rng = self.rng("wishlist_books")
+        multiplier = scatter(self.book_count)
+        for wishlist_id in range(1, len(self.wishlist_owners()) + 1):
+            size = min(1 + int(rng.expovariate(1 / max(self.wishlist_mean - 1, 1e-9))), self.book_count)
+            chosen = set()
+            for _ in range(size * 10):
+                chosen.add(self.popular_book(rng, multiplier))
+                if len(chosen) == size:
+                    break
+            for book_id in sorted(chosen):
+                yield {"wishlist_id": wishlist_id, "book_id": book_id}
+
+
+def chunks(rows: Iterable[dict], size: int = CHUNK_SIZE) -> Iterator[list[dict]]:
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _insert_all(engine: Engine, table, rows: Iterable[dict]) -> int:
+    count = 0
+    for chunk in chunks(rows):
+        with engine.begin() as connection:
+            connection.execute(insert(table), chunk)
+        count += len(chunk)
+    return count
+
+
+def write_database(generator: DatasetGenerator, engine: Engine, password_hash: str) -> dict:
+    """
+    Bulk-insert the dataset into an empty database. Books indexes and
+    triggers are rebuilt once at the end.
+    """
+    counts = {}
+    started = time.perf_counter()
+    with deferred_indexes(engine):
+        counts["books"] = _insert_all(engine, BookModel.__table__, generator.books())
+        logger.info(f"Inserted {counts['books']} books in {time.perf_counter() - started:.1f}s")
+    counts["users"] = _insert_all(engine, UserModel.__table__, generator.users(password_hash))
+    counts["rentals"] = _insert_all(engine, RentalModel.__table__, generator.rental_rows())
+    counts["wishlists"] = _insert_all(engine, WishlistModel.__table__, generator.wishlists())
+    counts["wishlist_books"] = _insert_all(engine, wishlist_books, generator.wishlist_entries())
+    if engine.dialect.name == "postgresql":
+        # Explicit ids leave the sequences behind; rows the app adds later would collide.
+        with engine.begin() as connection:
+            for table in ("books", "users", "wishlists"):
+                connection.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 1)) FROM {table}"))
+    return counts
+
+
+def _write_csv(path: str, fieldnames: list[str], rows: Iterable[dict]) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_csv(generator: DatasetGenerator, directory: str, password_hash: str) -> dict:
+    """
+    One CSV file per table. ``books.csv`` uses the catalog layout, so it
+    loads with ``python -m services.catalog_loader --keep-ids``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    catalog = (
+        {"Id": book["id"], "ISBN": book["isbn"], "Authors": book["authors"], "Publication Year": book["publication_year"], "Title": book["title"], "Language": book["language"]}
+        for book in generator.books()
+    )
+    return {
+        "books": _write_csv(os.path.join(directory, "books.csv"), ["Id", "ISBN", "Authors", "Publication Year", "Title", "Language"], catalog),
+        "users": _write_csv(os.path.join(directory, "users.csv"), ["id", "username", "email", "password", "is_active", "is_staff"], generator.users(password_hash)),
+        "rentals": _write_csv(os.path.join(directory, "rentals.csv"), ["user_id", "book_id", "rental_date"], generator.rental_rows()),
+        "wishlists": _write_csv(os.path.join(directory, "wishlists.csv"), ["id", "user_id"], generator.wishlists()),
+        "wishlist_books": _write_csv(os.path.join(directory, "wishlist_books.csv"), ["wishlist_id", "book_id"], generator.wishlist_entries()),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic library dataset.")
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--staff", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--popularity-skew", type=float, default=1.1, help="Power-law exponent of wishlist popularity")
+    parser.add_argument("--rental-rate", type=float, default=0.08, help="Share of the catalog on loan")
+    parser.add_argument("--overdue-rate", type=float, default=0.25, help="Share of loans that are overdue")
+    parser.add_argument("--as-of", type=date.fromisoformat, help="Date the loans are relative to (default: today)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--database-url", help="An empty database with the schema (see bench.seed.create_schema)")
+    target.add_argument("--csv", help="Directory to write one CSV file per table to")
+    args = parser.parse_args(argv)
+
+    generator = DatasetGenerator(
+        CatalogModel.from_csv(),
+        books=args.books,
+        users=args.users,
+        staff=args.staff,
+        seed=args.seed,
+        popularity_skew=args.popularity_skew,
+        rental_rate=args.rental_rate,
+        overdue_rate=args.overdue_rate,
+        as_of=datetime.combine(args.as_of, dt_time()) if args.as_of else None,
+    )
+    password_hash = bench_password_hash()
+    started = time.perf_counter()
+    if args.csv:
+        counts = write_csv(generator, args.csv, password_hash)
+    else:
+        engine = create_engine(args.database_url)
+        counts = write_database(generator, engine, password_hash)
+        engine.dispose()
+    print(json.dumps({**counts, "seed": args.seed, "seconds": round(time.perf_counter() - started, 1)}))
+
+
+if __name__ == "__main__":
+    main()
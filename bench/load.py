@@ -0,0 +1,287 @@
+"""
+Drive a traffic mix against the API and report throughput as JSON.
+
+By default the app is booted with ``python main.py`` (which also runs the
+bundled SMTP sink and the embedded outbox dispatcher) against a freshly
+seeded SQLite database in a temporary directory. ``--database-url`` seeds
+an empty database of your own (e.g. PostgreSQL) instead, and ``--base-url``
+targets a server that is already running on a ``bench.seed`` database::
+
+    python -m bench.load --mix mixed --duration 30 --concurrency 32 --output results.json
+
+Mixes:
+
+- ``search``: catalog searches by author and title, and ISBN lookups;
+- ``checkout``: desk bursts renting several books to a patron, then
+  returning them;
+- ``login``: password logins, bound by bcrypt;
+- ``report``: staff pulling pages of the rental report;
+- ``mixed``: mostly searches with some of everything else.
+
+Each operation reports requests, errors, requests per second, latency
+percentiles and the database queries and time per request, read from the
+``Server-Timing`` header.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+import httpx
+from bench.dataset import BENCH_PASSWORD, ROOT, isbn10, reader_email, staff_email
+from bench.seed import create_schema, seed
+
+SEARCH_TERMS = ("rowling", "tolkien", "collins", "austen", "orwell", "king", "harry", "ring", "games", "pride")
+SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+MIXES = {
+    "search": {"search": 8, "isbn": 2},
+    "checkout": {"checkout": 1},
+    "login": {"login": 1},
+    "report": {"report": 1},
+    "mixed": {"search": 70, "isbn": 10, "checkout": 8, "login": 7, "report": 5},
+}
+
+
+@dataclass
+class Sample:
+    seconds: float
+    status: int
+    queries: Optional[int] = None
+    db_ms: Optional[float] = None
+
+
+@dataclass
+class Context:
+    client: httpx.AsyncClient
+    rng: random.Random
+    books: int
+    users: int
+    staff_headers: dict
+    isbns: list = field(default_factory=list)
+    samples: dict = field(default_factory=lambda: defaultdict(list))
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.samples[name].append(Sample(time.perf_counter() - started, 0))
+            raise
+        sample = Sample(time.perf_counter() - started, response.status_code)
+        timing = SERVER_TIMING.search(response.headers.get("server-timing", ""))
+        if timing:
+            sample.db_ms, sample.queries = float(timing.group(1)), int(timing.group(2))
+        self.samples[name].append(sample)
+        return response
+
+
+async def search(ctx: Context) -> None:
+    field_name = ctx.rng.choice(("author", "title"))
+    await ctx.request("search", "GET", "/api/v1/user/search", params={field_name: ctx.rng.choice(SEARCH_TERMS), "limit": 20})
+
+
+async def isbn(ctx: Context) -> None:
+    await ctx.request("isbn", "GET", f"/api/v1/user/books/isbn/{ctx.rng.choice(ctx.isbns)}")
+
+
+async def checkout(ctx: Context) -> None:
+    patron = ctx.rng.randint(1, ctx.users)
+    items = [{"user": patron, "books": ctx.rng.randint(1, ctx.books)} for _ in range(ctx.rng.randint(1, 5))]
+    response = await ctx.request("rent_batch", "POST", "/api/v1/admin/rental/batch", json=items, headers=ctx.staff_headers)
+    if response.status_code != 200:
+        return
+    rented = [{"user": item["user"], "books": item["book"]} for item in response.json()["results"] if item["status"] == "rented"]
+    if rented:
+        await ctx.request("return_batch", "POST", "/api/v1/admin/rental/return/batch", json=rented, headers=ctx.staff_headers)
+
+
+async def login(ctx: Context) -> None:
+    await ctx.request("login", "POST", "/api/v1/auth/login", data={"username": reader_email(ctx.rng.randint(1, ctx.users)), "password": BENCH_PASSWORD})
+
+
+async def report(ctx: Context) -> None:
+    after = ctx.rng.randint(0, max(ctx.books - 500, 0))
+    await ctx.request("report", "GET", "/api/v1/admin/rental/report", params={"limit": 500, "after": after}, headers=ctx.staff_headers)
+
+
+OPERATIONS: dict[str, Callable[[Context], Awaitable[None]]] = {
+    "search": search,
+    "isbn": isbn,
+    "checkout": checkout,
+    "login": login,
+    "report": report,
+}
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(samples: list[Sample], seconds: float) -> dict:
+    latencies = sorted(sample.seconds * 1000 for sample in samples)
+    timed = [sample for sample in samples if sample.queries is not None]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if not 200 <= sample.status < 400),
+        "rps": round(len(samples) / seconds, 1),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2),
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p90": round(percentile(latencies, 0.90), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(latencies[-1], 2),
+        },
+        "queries_per_request": round(sum(sample.queries for sample in timed) / len(timed), 2) if timed else None,
+        "db_ms_per_request": round(sum(sample.db_ms for sample in timed) / len(timed), 2) if timed else None,
+    }
+
+
+async def run_load(base_url: str, mix: str, duration: float, concurrency: int, books: int, users: int, seed_value: int = 0) -> dict:
+    weights = MIXES[mix]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        response = await client.post("/api/v1/auth/login", data={"username": staff_email(1), "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        staff_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        isbns = [isbn10(n) for n in range(1, min(books, 1000) + 1)]
+
+        contexts = [
+            Context(client, random.Random(seed_value * 1000 + worker), books, users, staff_headers, isbns)
+            for worker in range(concurrency)
+        ]
+        deadline = time.perf_counter() + duration
+
+        async def worker(ctx: Context) -> None:
+            names, counts = list(weights), list(weights.values())
+            while time.perf_counter() < deadline:
+                try:
+                    await OPERATIONS[ctx.rng.choices(names, counts)[0]](ctx)
+                except httpx.HTTPError:
+                    pass
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(ctx) for ctx in contexts))
+        elapsed = time.perf_counter() - started
+
+    merged = defaultdict(list)
+    for ctx in contexts:
+        for name, samples in ctx.samples.items():
+            merged[name].extend(samples)
+    return {
+        "duration_s": round(elapsed, 2),
+        "total": summarize([sample for samples in merged.values() for sample in samples], elapsed),
+        "operations": {name: summarize(samples, elapsed) for name, samples in sorted(merged.items())},
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Server:
+    """
+    ``python main.py`` in a subprocess, with its own SMTP sink port.
+    """
+
+    def __init__(self, database_url: str, workdir: str, env: Optional[dict] = None):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.log_path = os.path.join(workdir, "server.log")
+        self.env = {
+            **os.environ,
+            "DATABASE_URL": database_url,
+            "DB_PROFILE": os.environ.get("DB_PROFILE", "prod-postgres" if database_url.startswith("postgresql") else "prod-sqlite"),
+            "HOST": "127.0.0.1",
+            "PORT": str(self.port),
+            "EMAIL_HOST": "127.0.0.1",
+            "EMAIL_PORT": str(free_port()),
+            **(env or {}),
+        }
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "Server":
+        self._log = open(self.log_path, "wb")
+        self.process = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=self.env, stdout=self._log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with {self.process.returncode}; see {self.log_path}")
+            try:
+                if httpx.get(f"{self.base_url}/api/v1/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f"Server did not start; see {self.log_path}")
+
+    def __exit__(self, *exc) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Load-test the v1 API and print the results as JSON.")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load per run")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent virtual clients")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database-url", help="An empty database to seed instead of a temporary SQLite file")
+    parser.add_argument("--base-url", help="Target a running server seeded by bench.seed with the same --books/--users")
+    parser.add_argument("--output", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    result = {
+        "commit": _git_commit(),
+        "mix": args.mix,
+        "concurrency": args.concurrency,
+        "books": args.books,
+        "users": args.users,
+    }
+
+    def load(base_url: str) -> dict:
+        return asyncio.run(run_load(base_url, args.mix, args.duration, args.concurrency, args.books, args.users, args.seed))
+
+    if args.base_url:
+        result.update(target=args.base_url, **load(args.base_url))
+    else:
+        with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+            database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+            create_schema(database_url)
+            seed(database_url, books=args.books, users=args.users, seed=args.seed)
+            with Server(database_url, workdir) as server:
+                result.update(database=database_url.split(":", 1)[0], **load(server.base_url))
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
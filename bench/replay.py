@@ -0,0 +1,136 @@
+"""
+Replay captured traffic against another instance.
+
+Requests from ``TRAFFIC_CAPTURE`` files are re-issued with their original
+spacing, divided by ``--speed`` (``--speed 0`` sends them back to back,
+``--concurrency`` at a time), and the results are compared per route with
+what the capture recorded::
+
+    python -m bench.replay logs/traffic.jsonl* --base-url http://localhost:8000 --speed 4 --login staff@example.com:secret
+
+Captured credentials are redacted, so requests that carried an
+``Authorization`` header are sent with the token from ``--token`` or
+``--login``. Requests whose body was not captured, or whose body still
+contains redacted fields, cannot be reproduced and are counted as skipped.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+from typing import Optional
+import httpx
+from bench.load import percentile
+from services.traffic import REDACTED, read_capture
+
+
+def replayable(record: dict) -> bool:
+    if not record["body_bytes"]:
+        return True
+    return record.get("body") is not None and REDACTED not in record["body"]
+
+
+def summarize(results: list[dict]) -> dict:
+    captured = sorted(result["captured_ms"] for result in results)
+    replayed = sorted(result["replayed_ms"] for result in results)
+    summary = {"requests": len(results)}
+    for name, latencies in (("captured_ms", captured), ("replayed_ms", replayed)):
+        summary[name] = {"p50": round(percentile(latencies, 0.5), 2), "p99": round(percentile(latencies, 0.99), 2)}
+    summary["p50_change"] = round(summary["replayed_ms"]["p50"] / summary["captured_ms"]["p50"] - 1, 3) if summary["captured_ms"]["p50"] else None
+    summary["captured_errors"] = sum(1 for result in results if result["captured_status"] >= 500)
+    summary["replayed_errors"] = sum(1 for result in results if result["replayed_status"] == 0 or result["replayed_status"] >= 500)
+    summary["status_mismatches"] = sum(1 for result in results if result["captured_status"] != result["replayed_status"])
+    return summary
+
+
+async def replay(
+    records: list[dict],
+    base_url: str,
+    speed: float = 1.0,
+    concurrency: int = 64,
+    token: Optional[str] = None,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> list[dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def issue(client: httpx.AsyncClient, record: dict, delay: float) -> None:
+        await asyncio.sleep(delay)
+        headers = {}
+        if record["content_type"]:
+            headers["Content-Type"] = record["content_type"]
+        if record["auth"] and token:
+            headers["Authorization"] = f"Bearer {token}"
+        url = record["path"] + (f"?{record['query']}" if record["query"] else "")
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(record["method"], url, content=record.get("body"), headers=headers)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            elapsed = (time.perf_counter() - started) * 1000
+        results.append({
+            "route": f"{record['method']} {record['route']}",
+            "captured_status": record["status"],
+            "captured_ms": record["duration_ms"],
+            "replayed_status": status,
+            "replayed_ms": elapsed,
+        })
+
+    origin = records[0]["ts"] if records else 0
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=httpx.Limits(max_connections=concurrency), transport=transport) as client:
+        await asyncio.gather(*(
+            issue(client, record, (record["ts"] - origin) / speed if speed else 0)
+            for record in records
+        ))
+    return results
+
+
+async def login(base_url: str, credentials: str) -> str:
+    username, password = credentials.split(":", 1)
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        response = await client.post("/api/v1/auth/login", data={"username": username, "password": password})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare latency and errors.")
+    parser.add_argument("paths", nargs="+", help="Capture files, rotated ones included")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time compression factor; 0 sends as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=64, help="Maximum requests in flight")
+    parser.add_argument("--token", help="Bearer token for requests that were authenticated")
+    parser.add_argument("--login", help="email:password to obtain that token instead")
+    parser.add_argument("--output", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    records = read_capture(args.paths)
+    playable = [record for record in records if replayable(record)]
+    token = args.token or (asyncio.run(login(args.base_url, args.login)) if args.login else None)
+    started = time.perf_counter()
+    results = asyncio.run(replay(playable, args.base_url, args.speed, args.concurrency, token))
+    elapsed = time.perf_counter() - started
+
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[result["route"]].append(result)
+    report = {
+        "captured": len(records),
+        "skipped": len(records) - len(playable),
+        "speed": args.speed,
+        "captured_span_s": round(records[-1]["ts"] - records[0]["ts"], 2) if records else 0,
+        "replay_s": round(elapsed, 2),
+        "total": summarize(results) if results else None,
+        "routes": {route: summarize(route_results) for route, route_results in sorted(by_route.items())},
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Create and seed a database for load tests.
+
+The schema is built from the models like the test fixtures build it, with
+the search index and the catalog change triggers; the rows come from
+:mod:`bench.dataset`. Every patron and staff member shares the password
+``BENCH_PASSWORD``::
+
+    python -m bench.seed --database-url sqlite:///bench.db --books 100000 --users 5000
+"""
+import argparse
+import json
+from sqlalchemy import create_engine
+from bench.dataset import CatalogModel, DatasetGenerator, bench_password_hash, write_database
+from db.fts import create_search_index
+from db.models import Base
+from db.models.users import UserModel  # noqa: F401 - registers the users table
+from db.models.books import BookModel  # noqa: F401 - registers the books tables
+from db.models.outbox import OutboxModel  # noqa: F401 - registers the outbox table
+from db.models.catalog_load import CatalogLoadModel  # noqa: F401 - registers the loader checkpoints
+from db.models.tokens import RevokedTokenModel  # noqa: F401 - registers the token denylist
+from db.models.catalog_change import CatalogChangeModel  # noqa: F401 - registers the catalog change log
+
+
+def create_schema(url: str) -> None:
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        create_search_index(connection)
+    engine.dispose()
+
+
+def seed(url: str, books: int = 10000, users: int = 1000, staff: int = 5, seed: int = 0) -> dict:
+    """
+    Fill an empty database with a generated dataset.
+    """
+    generator = DatasetGenerator(CatalogModel.from_csv(), books=books, users=users, staff=staff, seed=seed)
+    engine = create_engine(url)
+    try:
+        return write_database(generator, engine, bench_password_hash())
+    finally:
+        engine.dispose()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Create and seed a database for load tests.")
+    parser.add_argument("--database-url", required=True, help="An empty database, e.g. sqlite:///bench.db")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--staff", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    create_schema(args.database_url)
+    print(json.dumps(seed(args.database_url, books=args.books, users=args.users, staff=args.staff, seed=args.seed)))
+
+
+if __name__ == "__main__":
+    main()
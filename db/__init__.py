@@ -1,16 +1,98 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
 from functools import lru_cache
 import os
+from db.profiles import get_profile
+from db.routing import ReplicaSet, RoutingSession
+from fastapi import Depends
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./library.db")
-engine = create_engine(DATABASE_URL, echo=True)
+# Comma-separated read replicas of DATABASE_URL, e.g. a streaming standby or a SQLite file copy.
+DATABASE_READ_URLS = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+
+profile = get_profile()
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def async_database_url(url: str) -> str:
+    """
+    Map a DATABASE_URL to the async driver of its backend
+    (``sqlite://`` -> aiosqlite, ``postgresql://`` -> asyncpg).
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+# Synchronous engine, used by migrations, the outbox dispatcher and offline tools.
+engine = create_engine(DATABASE_URL, **profile.engine_options(DATABASE_URL))
+profile.install(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Asynchronous engine used by the API.
+async_engine = create_async_engine(async_database_url(DATABASE_URL), **profile.engine_options(async_database_url(DATABASE_URL)))
+profile.install(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+def _create_read_engine(url: str):
+    url = async_database_url(url)
+    read_engine = create_async_engine(url, **profile.engine_options(url))
+    profile.install(read_engine.sync_engine)
+    return read_engine
+
+
+read_replicas = ReplicaSet([_create_read_engine(url) for url in DATABASE_READ_URLS])
+
 def get_session():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_session():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_read_session(primary: AsyncSession = Depends(get_async_session)):
+    """
+    A session for read-only routes, reading from a replica when one is usable.
+    It shares the request's primary session, and follows it to the primary
+    once the request has written anything.
+    """
+    replica = await read_replicas.choose()
+    if replica is None:
+        yield primary
+        return
+    async with AsyncSession(
+        bind=replica,
+        sync_session_class=RoutingSession,
+        info={"primary": primary.sync_session},
+        autoflush=False,
+        expire_on_commit=False,
+    ) as db:
+        yield db
+
+
+def database_status() -> dict:
+    """
+    The active engine profile and the API pool's current usage.
+    """
+    pool = async_engine.pool
+    status = {**profile.describe(), "dialect": async_engine.dialect.name, "driver": async_engine.driver}
+    if hasattr(pool, "checkedout"):
+        status["pool_checked_out"] = pool.checkedout()
+    if read_replicas.engines:
+        status["read_replicas"] = read_replicas.stats()
+    return status
@@ -0,0 +1,73 @@
+"""
+Change counter for the ``books`` table.
+
+Triggers append the id of every inserted, updated or deleted book to
+``catalog_changes``, so readers that keep a copy of the catalog (see
+:mod:`services.catalog_snapshot`) can catch up by reading the log past the
+last id they applied. Like the full-text triggers in :mod:`db.fts`, they are
+maintained by the database, so every write path is covered.
+"""
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.engine import Connection
+from db.models.catalog_change import CatalogChangeModel
+
+SQLITE_TRIGGERS = {
+    "catalog_changes_ai": "CREATE TRIGGER IF NOT EXISTS catalog_changes_ai AFTER INSERT ON books BEGIN INSERT INTO catalog_changes(book_id) VALUES (new.id); END",
+    "catalog_changes_au": "CREATE TRIGGER IF NOT EXISTS catalog_changes_au AFTER UPDATE ON books BEGIN INSERT INTO catalog_changes(book_id) VALUES (new.id); END",
+    "catalog_changes_ad": "CREATE TRIGGER IF NOT EXISTS catalog_changes_ad AFTER DELETE ON books BEGIN INSERT INTO catalog_changes(book_id) VALUES (old.id); END",
+}
+
+PG_FUNCTION = """
+    CREATE OR REPLACE FUNCTION record_catalog_change() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO catalog_changes(book_id) VALUES (COALESCE(NEW.id, OLD.id));
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+PG_TRIGGER = "catalog_changes_trg"
+
+
+def create_change_triggers(connection: Connection) -> None:
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        for ddl in SQLITE_TRIGGERS.values():
+            connection.execute(text(ddl))
+    elif dialect == "postgresql":
+        connection.execute(text(PG_FUNCTION))
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {PG_TRIGGER} ON books"))
+        connection.execute(text(
+            f"CREATE TRIGGER {PG_TRIGGER} AFTER INSERT OR UPDATE OR DELETE ON books "
+            "FOR EACH ROW EXECUTE FUNCTION record_catalog_change()"
+        ))
+    else:
+        raise NotImplementedError(f"Catalog change tracking is not supported on {dialect}")
+
+
+def drop_change_triggers(connection: Connection) -> None:
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        for name in SQLITE_TRIGGERS:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    elif dialect == "postgresql":
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {PG_TRIGGER} ON books"))
+        connection.execute(text("DROP FUNCTION IF EXISTS record_catalog_change()"))
+
+
+def record_full_change(connection: Connection) -> None:
+    """
+    Tell readers to reload the whole catalog, after writes that bypassed the
+    triggers.
+    """
+    connection.execute(insert(CatalogChangeModel).values(book_id=None))
+
+
+def prune_changes(connection: Connection, keep: int) -> int:
+    """
+    Delete all but the last ``keep`` log entries. Readers that fell further
+    behind notice the gap and reload everything.
+    """
+    last = connection.execute(select(func.max(CatalogChangeModel.id))).scalar()
+    if last is None or last <= keep:
+        return 0
+    return connection.execute(delete(CatalogChangeModel).where(CatalogChangeModel.id <= last - keep)).rowcount
@@ -0,0 +1,16 @@
+"""
+Dialect-specific INSERT constructs for the backends the project supports.
+"""
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql, sqlite
+
+INSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def dialect_insert(dialect: str, table: Table):
+    """
+    An INSERT supporting ``on_conflict_do_nothing`` / ``on_conflict_do_update``.
+    """
+    if dialect not in INSERT_DIALECTS:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    return INSERT_DIALECTS[dialect](table)
@@ -0,0 +1,93 @@
+"""
+Full-text search index DDL for the ``books`` table.
+
+SQLite gets an external-content FTS5 table (``books_fts``) kept in sync by
+triggers; PostgreSQL gets a weighted ``tsvector`` generated column with a GIN
+index. Both are maintained by the database itself, so every write path
+(bulk upload, rentals, returns, ad-hoc SQL) keeps the index current.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+FTS_TABLE = "books_fts"
+PG_SEARCH_COLUMN = "search_vector"
+PG_SEARCH_INDEX = "ix_books_search_vector"
+
+# Only title/authors changes touch the index; rental status flips do not.
+SQLITE_TRIGGERS = {
+    "books_fts_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, authors) VALUES (new.id, new.title, new.authors);
+        END
+    """,
+    "books_fts_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, authors) VALUES ('delete', old.id, old.title, old.authors);
+        END
+    """,
+    "books_fts_au": f"""
+        CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, authors ON books BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, authors) VALUES ('delete', old.id, old.title, old.authors);
+            INSERT INTO {FTS_TABLE}(rowid, title, authors) VALUES (new.id, new.title, new.authors);
+        END
+    """,
+}
+
+
+def create_search_index(connection: Connection) -> None:
+    """
+    Create the full-text index for the connection's dialect and backfill it.
+    """
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title, authors, content='books', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+        create_sync_triggers(connection)
+        rebuild_search_index(connection)
+    elif dialect == "postgresql":
+        connection.execute(text(
+            f"ALTER TABLE books ADD COLUMN IF NOT EXISTS {PG_SEARCH_COLUMN} tsvector "
+            "GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(authors, '')), 'B')"
+            ") STORED"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {PG_SEARCH_INDEX} ON books USING gin ({PG_SEARCH_COLUMN})"
+        ))
+    else:
+        raise NotImplementedError(f"Full-text search is not supported on {dialect}")
+
+
+def drop_search_index(connection: Connection) -> None:
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        drop_sync_triggers(connection)
+        connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+    elif dialect == "postgresql":
+        connection.execute(text(f"DROP INDEX IF EXISTS {PG_SEARCH_INDEX}"))
+        connection.execute(text(f"ALTER TABLE books DROP COLUMN IF EXISTS {PG_SEARCH_COLUMN}"))
+
+
+def create_sync_triggers(connection: Connection) -> None:
+    if connection.dialect.name == "sqlite":
+        for ddl in SQLITE_TRIGGERS.values():
+            connection.execute(text(ddl))
+
+
+def drop_sync_triggers(connection: Connection) -> None:
+    if connection.dialect.name == "sqlite":
+        for name in SQLITE_TRIGGERS:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+
+def rebuild_search_index(connection: Connection) -> None:
+    """
+    Re-read every row of ``books`` into the index (SQLite only; the
+    PostgreSQL generated column never drifts).
+    """
+    if connection.dialect.name == "sqlite":
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
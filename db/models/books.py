@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, Table, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Enum, Table, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 import enum
 from db.models import Base
@@ -46,5 +46,8 @@ class RentalModel(Base):
     book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
     rental_date = Column(DateTime, default=datetime.utcnow, nullable=False)
 
+    # Rows are deleted on return, so this allows one active rental per book.
+    __table_args__ = (Index('uq_rentals_book_id', 'book_id', unique=True),)
+
     def __repr__(self):
         return f"<Rental(id={self.id}, user_id={self.user_id}, book_id={self.book_id}, rental_date={self.rental_date})>"
\ No newline at end of file
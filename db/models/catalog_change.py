@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, BigInteger
+from db.models import Base
+
+
+class CatalogChangeModel(Base):
+    """
+    Append-only log of changed book ids, written by triggers on ``books``
+    (see :mod:`db.changes`). ``book_id`` NULL means "everything changed",
+    e.g. after an offline load that ran with the triggers off.
+    """
+    __tablename__ = 'catalog_changes'
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    book_id = Column(Integer, nullable=True)
+
+    def __repr__(self):
+        return f"<CatalogChange(id={self.id}, book_id={self.book_id})>"
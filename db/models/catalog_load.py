@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime
+from db.models import Base
+from datetime import datetime
+
+class CatalogLoadModel(Base):
+    """
+    Progress of an offline catalog load, committed with each chunk of rows so
+    an interrupted load resumes after the last chunk it wrote.
+    """
+    __tablename__ = 'catalog_loads'
+
+    source = Column(String(1024), primary_key=True)
+    file_size = Column(BigInteger, nullable=False)
+    byte_offset = Column(BigInteger, nullable=False, default=0)
+    line = Column(Integer, nullable=False, default=1)
+    rows_loaded = Column(Integer, nullable=False, default=0)
+    rows_rejected = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, nullable=False, default=False)
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<CatalogLoad(source={self.source}, byte_offset={self.byte_offset}, rows_loaded={self.rows_loaded}, completed={self.completed})>"
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, Text, Enum, DateTime, Index
+import enum
+from db.models import Base
+from datetime import datetime
+
+class OutboxStatusEnum(str, enum.Enum):
+    pending = "pending"
+    sending = "sending"
+    sent = "sent"
+    failed = "failed"
+
+class OutboxModel(Base):
+    __tablename__ = 'outbox'
+
+    id = Column(Integer, primary_key=True, index=True)
+    recipient = Column(String(100), nullable=False)
+    subject = Column(String(255), nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(Enum(OutboxStatusEnum), nullable=False, default=OutboxStatusEnum.pending)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_outbox_status_available_at', 'status', 'available_at'),
+    )
+
+    def __repr__(self):
+        return f"<Outbox(id={self.id}, recipient={self.recipient}, status={self.status}, attempts={self.attempts})>"
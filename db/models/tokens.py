@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, DateTime
+from db.models import Base
+
+
+class RevokedTokenModel(Base):
+    __tablename__ = 'revoked_tokens'
+
+    jti = Column(String(36), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<RevokedToken(jti={self.jti}, expires_at={self.expires_at})>"
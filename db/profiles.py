@@ -0,0 +1,129 @@
+"""
+Engine profiles: the engine, pool and connection settings for each deployment.
+
+``DB_PROFILE`` selects one of :data:`PROFILES`:
+
+- ``dev``: statement logging, SQLAlchemy defaults otherwise.
+- ``prod-sqlite``: WAL journal so readers don't wait for the writer,
+  ``synchronous=NORMAL``, memory-mapped I/O, a larger page cache and a busy
+  timeout instead of immediate "database is locked" errors.
+- ``prod-postgres``: sized pool with pre-ping and recycling, and larger
+  compiled/prepared statement caches.
+
+``DB_ECHO``, ``DB_POOL_SIZE`` and ``DB_MAX_OVERFLOW`` override the profile.
+"""
+import os
+from dataclasses import dataclass, field, replace
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+DB_PROFILE = os.environ.get("DB_PROFILE", "dev")
+
+
+@dataclass(frozen=True)
+class EngineProfile:
+    name: str
+    backend: Optional[str] = None  # the only backend the profile applies to
+    echo: bool = False
+    pragmas: dict = field(default_factory=dict)  # SQLite only, run on every new connection
+    pool_size: Optional[int] = None
+    max_overflow: Optional[int] = None
+    pool_timeout: Optional[float] = None
+    pool_pre_ping: bool = False
+    pool_recycle: int = -1
+    query_cache_size: int = 500  # SQLAlchemy's compiled statement cache
+    prepared_statement_cache_size: Optional[int] = None  # asyncpg's per-connection cache
+
+    def engine_options(self, url: str) -> dict:
+        """
+        Keyword arguments for ``create_engine`` / ``create_async_engine``.
+        """
+        parsed = make_url(url)
+        if self.backend and parsed.get_backend_name() != self.backend:
+            raise ValueError(f"Database profile {self.name!r} is for {self.backend}, not {parsed.get_backend_name()}")
+        options = dict(
+            echo=self.echo,
+            pool_pre_ping=self.pool_pre_ping,
+            pool_recycle=self.pool_recycle,
+            query_cache_size=self.query_cache_size,
+        )
+        for key in ("pool_size", "max_overflow", "pool_timeout"):
+            if getattr(self, key) is not None:
+                options[key] = getattr(self, key)
+        if self.prepared_statement_cache_size is not None and parsed.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"prepared_statement_cache_size": self.prepared_statement_cache_size}
+        return options
+
+    def install(self, engine: Engine) -> None:
+        """
+        Run the profile's pragmas on every connection ``engine`` opens.
+        Pass ``async_engine.sync_engine`` for an async engine.
+        """
+        if not self.pragmas or engine.dialect.name != "sqlite":
+            return
+
+        @event.listens_for(engine, "connect")
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in self.pragmas.items():
+                cursor.execute(f"PRAGMA {pragma}={value}")
+            cursor.close()
+
+    def describe(self) -> dict:
+        return {
+            "profile": self.name,
+            "echo": self.echo,
+            "pragmas": self.pragmas,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_pre_ping": self.pool_pre_ping,
+            "query_cache_size": self.query_cache_size,
+        }
+
+
+PROFILES = {
+    "dev": EngineProfile(name="dev", echo=True),
+    "prod-sqlite": EngineProfile(
+        name="prod-sqlite",
+        backend="sqlite",
+        pragmas={
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64 * 1024,  # negative: KiB, so 64 MiB
+            "busy_timeout": 5000,  # ms
+            "temp_store": "MEMORY",
+        },
+        pool_size=5,
+        max_overflow=5,
+        pool_timeout=30,
+        pool_pre_ping=False,
+        query_cache_size=1000,
+    ),
+    "prod-postgres": EngineProfile(
+        name="prod-postgres",
+        backend="postgresql",
+        pool_size=10,
+        max_overflow=20,
+        pool_timeout=30,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        query_cache_size=1000,
+        prepared_statement_cache_size=500,
+    ),
+}
+
+
+def get_profile(name: Optional[str] = None) -> EngineProfile:
+    name = name or DB_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {name!r}; expected one of {', '.join(PROFILES)}")
+    profile = PROFILES[name]
+    overrides = {}
+    if "DB_ECHO" in os.environ:
+        overrides["echo"] = os.environ["DB_ECHO"].lower() in ("1", "true", "yes")
+    for key in ("pool_size", "max_overflow"):
+        if f"DB_{key.upper()}" in os.environ:
+            overrides[key] = int(os.environ[f"DB_{key.upper()}"])
+    return replace(profile, **overrides)
@@ -0,0 +1,140 @@
+"""
+Read/write routing between the primary database and read replicas.
+
+Read-only routes take a session from ``db.get_read_session``. Its queries go to
+a replica chosen by :class:`ReplicaSet`, which skips replicas that are
+unreachable or lag the primary by more than ``DATABASE_MAX_REPLICA_LAG``
+seconds. Once the request has written through its primary session, or the
+read session itself flushes or executes DML, every further statement goes to
+the primary so the request always reads its own writes.
+"""
+import asyncio
+import itertools
+import math
+import os
+import time
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DATABASE_MAX_REPLICA_LAG = float(os.environ.get("DATABASE_MAX_REPLICA_LAG", 5))  # seconds
+DATABASE_REPLICA_CHECK_INTERVAL = float(os.environ.get("DATABASE_REPLICA_CHECK_INTERVAL", 5))  # seconds
+
+# Seconds a replica is behind its primary. SQLite copies have no replication
+# stream, so the probe only checks that the file can be read.
+LAG_QUERIES = {
+    "postgresql": (
+        "SELECT CASE WHEN pg_is_in_recovery() "
+        "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+        "ELSE 0 END"
+    ),
+    "sqlite": "SELECT 0",
+}
+
+
+async def measure_lag(engine: AsyncEngine) -> float:
+    async with engine.connect() as connection:
+        return float((await connection.execute(text(LAG_QUERIES[engine.dialect.name]))).scalar() or 0)
+
+
+class ReplicaSet:
+    """
+    Round-robin over the replicas whose last measured lag is acceptable.
+    Lag is re-measured lazily, at most every ``check_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        engines: list[AsyncEngine],
+        max_lag: float = DATABASE_MAX_REPLICA_LAG,
+        check_interval: float = DATABASE_REPLICA_CHECK_INTERVAL,
+        lag_probe: Callable[[AsyncEngine], Awaitable[float]] = measure_lag,
+    ):
+        self.engines = engines
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag_probe = lag_probe
+        self._lag = {engine: 0.0 for engine in engines}
+        self._checked_at: Optional[float] = None
+        self._cycle = itertools.cycle(engines)
+        self._counters = {"replica_reads": 0, "primary_fallbacks": 0}
+
+    async def refresh(self) -> None:
+        lags = await asyncio.gather(*(self.lag_probe(engine) for engine in self.engines), return_exceptions=True)
+        for engine, lag in zip(self.engines, lags):
+            if isinstance(lag, BaseException):
+                logger.warning(f"Read replica {engine.url.render_as_string()} is unavailable: {lag}")
+                lag = math.inf
+            self._lag[engine] = lag
+        self._checked_at = time.monotonic()
+
+    async def choose(self) -> Optional[AsyncEngine]:
+        """
+        The next usable replica, or None when reads should go to the primary.
+        """
+        if not self.engines:
+            return None
+        if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+            await self.refresh()
+        for _ in range(len(self.engines)):
+            engine = next(self._cycle)
+            if self._lag[engine] <= self.max_lag:
+                self._counters["replica_reads"] += 1
+                return engine
+        self._counters["primary_fallbacks"] += 1
+        return None
+
+    async def dispose(self) -> None:
+        for engine in self.engines:
+            await engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": [
+                {"url": engine.url.render_as_string(), "lag": None if math.isinf(lag) else round(lag, 3)}
+                for engine, lag in self._lag.items()
+            ],
+            "max_lag": self.max_lag,
+            **self._counters,
+        }
+
+
+def has_written(session: Session) -> bool:
+    return bool(session.info.get("wrote_primary"))
+
+
+def reads_from_replica(session) -> bool:
+    """
+    Whether ``session`` is a routing session from :func:`db.get_read_session`,
+    i.e. its reads may lag the primary by up to ``DATABASE_MAX_REPLICA_LAG``.
+    """
+    return "primary" in session.info
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session, flush_context):
+    session.info["wrote_primary"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote_primary"] = True
+
+
+class RoutingSession(Session):
+    """
+    A session bound to a replica that switches to the primary for writes and
+    for everything after a write. ``info["primary"]`` is the request's primary
+    session, whose writes make this session sticky as well.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        primary = self.info["primary"]
+        if self._flushing or has_written(self) or has_written(primary) or getattr(clause, "is_dml", False):
+            return primary.get_bind(mapper, clause=clause, **kw)
+        return super().get_bind(mapper, clause=clause, **kw)
@@ -1,12 +1,54 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api.v1.router import v1_router
 from services.smtpd import SMTPConsoleServer
+from services.outbox import outbox_dispatcher
+from services.hashing import password_hasher
+from db import AsyncSessionLocal, async_engine, read_replicas, database_status
+from db.changes import prune_changes
+from services.catalog_snapshot import catalog_snapshot, CATALOG_SNAPSHOT, CATALOG_CHANGES_KEEP
+from services.logger import RequestIdMiddleware, setup_logger, start_logging, stop_logging
+from services.metrics import MetricsMiddleware, METRICS_ENABLED
+from services.query_stats import QueryStatsMiddleware, QUERY_STATS_ENABLED
+from services.traffic import TrafficCaptureMiddleware, TRAFFIC_CAPTURE
 import uvicorn
 
+logger = setup_logger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_logging()
+    logger.info(f"Database engine profile: {database_status()}")
+    await password_hasher.start()
+    logger.info(f"Password hashing: {password_hasher.workers} workers, bcrypt cost {password_hasher.rounds}")
+    if CATALOG_SNAPSHOT and not catalog_snapshot.loaded:
+        try:
+            async with async_engine.begin() as connection:
+                await connection.run_sync(prune_changes, CATALOG_CHANGES_KEEP)
+            async with AsyncSessionLocal() as session:
+                await catalog_snapshot.load(session)
+        except Exception:
+            logger.exception("Catalog snapshot disabled: could not load it (are migrations applied?)")
+    # Emails are normally delivered by a separate `python -m services.outbox`
+    # process; for local development the dispatcher can run inside the app.
+    dispatcher_task = None
+    if os.getenv("OUTBOX_DISPATCHER_EMBEDDED", "false").lower() in ("1", "true", "yes"):
+        dispatcher_task = asyncio.create_task(outbox_dispatcher.run())
+    yield
+    if dispatcher_task:
+        outbox_dispatcher.stop()
+        await dispatcher_task
+    password_hasher.stop()
+    await async_engine.dispose()
+    await read_replicas.dispose()
+    stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +57,14 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all methods
     allow_headers=["*"],  # Allow all headers
 )
+if TRAFFIC_CAPTURE:
+    app.add_middleware(TrafficCaptureMiddleware)
+if QUERY_STATS_ENABLED:
+    app.add_middleware(QueryStatsMiddleware)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+# Outermost, so every log line of a request carries its id
+app.add_middleware(RequestIdMiddleware)
 
 # Include the API router
 app.include_router(v1_router)
@@ -26,6 +76,7 @@ if __name__ == "__main__":
     # Load environment variables from .env file
     from dotenv import load_dotenv
     load_dotenv()
+    os.environ.setdefault("OUTBOX_DISPATCHER_EMBEDDED", "true")
     # Host and port configuration
     host = os.getenv("HOST", "localhost")
     port = int(os.getenv("PORT", 8000))
@@ -14,3 +14,6 @@ class ResendTokenRequest(BaseModel):
     email: EmailStr = Field(..., description="The email address to resend the token to")
     username: str = Field(..., description="The username of the user requesting the token resend")
     password: str = Field(..., min_length=8, description="The user's password for verification")
+
+class RefreshRequest(BaseModel):
+    refresh_token: str = Field(..., description="A refresh token issued by /auth/login or /auth/refresh")
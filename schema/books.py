@@ -1,7 +1,10 @@
+import os
 from pydantic import BaseModel, Field
 from typing import List, Literal
 from datetime import datetime
 
+WISHLIST_BULK_MAX = int(os.environ.get("WISHLIST_BULK_MAX", 1000))
+
 class BookBase(BaseModel):
     isbn: str = Field(..., description="ISBN number")
     authors: str = Field(..., description="Authors of the book")
@@ -28,6 +31,9 @@ class Wishlist(WishlistBase):
     class Config:
         orm_mode = True
 
+class WishlistBooks(BaseModel):
+    book_ids: List[int] = Field(..., min_length=1, max_length=WISHLIST_BULK_MAX, description="IDs of the books to add or remove")
+
 class RentalBase(BaseModel):
     user_id: int = Field(..., description="ID of the user")
     book_id: int = Field(..., description="ID of the book")
@@ -1,21 +1,23 @@
 import os
+import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Union, Any
 from jose import jwt
 from jose.exceptions import JWTError
 from itsdangerous import URLSafeTimedSerializer
 from fastapi import HTTPException, Depends
-from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from schema.users import UserCreate
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from db import get_session
+from db import get_async_session
 from db.models.users import UserModel
-from schema.auth import TokenPayload
 from schema.users import LoggedInUser, LoggedInStaffUser
-from pydantic import ValidationError
 from services.logger import setup_logger
+from services.principal_cache import principal_cache
+from services.hashing import password_hasher
+from services.token_denylist import token_denylist
+from services.tokens import TokenVerifier
 
 
 logger = setup_logger(__name__)
@@ -34,26 +36,29 @@ JWT_REFRESH_SECRET_KEY = os.environ.get("JWT_REFRESH_SECRET_KEY", "default-jwt-r
 REFRESH_TOKEN_EXPIRE_MINUTES = os.environ.get("REFRESH_TOKEN_EXPIRE_MINUTES", 3000)
 JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 
-bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+access_token_verifier = TokenVerifier(JWT_SECRET_KEY, [JWT_ALGORITHM])
+
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
 
 def hash_password(password: str) -> str:
     """
-    Hash a password using bcrypt.
+    Hash a password using bcrypt, in the calling thread. Request handlers use
+    the process pool in :mod:`services.hashing` instead.
     """
-    return bcrypt_context.hash(password)
+    return password_hasher.context.hash(password)
 
-def register_user(user: UserCreate, session: Session):
-    existing_user = session.query(UserModel).filter(UserModel.email == user.email).first()
+async def register_user(user: UserCreate, session: AsyncSession):
+    existing_user = await session.scalar(select(UserModel).where(UserModel.email == user.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    user.password = hash_password(user.password)
+    user.password = await password_hasher.hash(user.password)
     new_user = UserModel(**user.model_dump())
 
+    # Flushed, not committed: the caller commits together with the confirmation email.
     session.add(new_user)
-    session.commit()
+    await session.flush()
     return new_user
 
 
@@ -66,26 +71,27 @@ def confirm_token(token: str, expiration=3600) -> str:
     return serializer.loads(token, salt=SALTPASSWORD)
 
 
-def confirm_email_token(token: str, session: Session):
+async def confirm_email_token(token: str, session: AsyncSession):
     try:
         email = confirm_token(token)
     except Exception as e:
         raise HTTPException(status_code=400, detail="Invalid or expired token")
 
-    user = session.query(UserModel).filter(UserModel.email == email).first()
+    user = await session.scalar(select(UserModel).where(UserModel.email == email))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     setattr(user, "is_active", True)
     session.add(user)
-    session.commit()
+    await session.commit()
+    principal_cache.invalidate(email)
     return user
 
-def resend_confirmation_token(username: str, email: str, password: str, session: Session):
-    user = session.query(UserModel).filter(
+async def resend_confirmation_token(username: str, email: str, password: str, session: AsyncSession):
+    user = await session.scalar(select(UserModel).where(
         UserModel.username == username,
         UserModel.email == email
-    ).first()
+    ))
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -93,27 +99,28 @@ def resend_confirmation_token(username: str, email: str, password: str, session:
     if getattr(user, "is_active", False):
         raise HTTPException(status_code=400, detail="Email already confirmed")
     
-    if not bcrypt_context.verify(password, getattr(user, "password", "")):
+    if not await password_hasher.verify(password, getattr(user, "password", "")):
         raise HTTPException(status_code=400, detail="Incorrect password")
 
     token = generate_confirmation_token(getattr(user, "email"))
-    logger.debug(f"Resend token: {token}")  # For debugging purposes, remove in production
+    logger.debug("Resend token: %s", token)  # For debugging purposes, remove in production
     return token
 
 
-def confirm_staff_token(token: str, session: Session):
+async def confirm_staff_token(token: str, session: AsyncSession):
     try:
         email = confirm_token(token)
     except Exception as e:
         raise HTTPException(status_code=400, detail="Invalid or expired token")
 
-    user = session.query(UserModel).filter(UserModel.email == email).first()
+    user = await session.scalar(select(UserModel).where(UserModel.email == email))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     setattr(user, "is_staff", True)  # Fixed typo in is_staff
     session.add(user)
-    session.commit()
+    await session.commit()
+    principal_cache.invalidate(email)
     return user
 
 
@@ -125,94 +132,111 @@ def create_access_token(subject: Union[str, Any], expires_delta: int = int(ACCES
 
 def create_refresh_token(subject: Union[str, Any], expires_delta: int = int(REFRESH_TOKEN_EXPIRE_MINUTES)) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=expires_delta)
-    to_encode = {"exp": expire, "sub": str(subject)}
+    # jti identifies the token in the revocation denylist.
+    to_encode = {"exp": expire, "sub": str(subject), "jti": uuid.uuid4().hex, "type": "refresh"}
     encoded_jwt = jwt.encode(to_encode, JWT_REFRESH_SECRET_KEY, JWT_ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(username: str, password: str, session: Session):
-    logger.info(f"Authenticating user: {username}")
-    logger.info(f"Password provided: {password}")  # For debugging purposes, remove in production
-    user = session.query(UserModel).filter(UserModel.email == username).first()
-    
-    if not user or not bcrypt_context.verify(password, getattr(user, "password")):
+def decode_refresh_token(token: str) -> dict:
+    invalid = HTTPException(
+        status_code=401,
+        detail="Invalid or expired refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        claims = jwt.decode(token, JWT_REFRESH_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except JWTError:
+        raise invalid
+    if claims.get("type") != "refresh" or not claims.get("jti") or not claims.get("sub"):
+        raise invalid
+    return claims
+
+async def refresh_tokens(refresh_token: str, session: AsyncSession):
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+    The presented token is revoked, so each refresh token works once; no
+    password hashing is involved.
+    """
+    claims = decode_refresh_token(refresh_token)
+    if token_denylist.is_revoked(claims["jti"]):
+        raise HTTPException(status_code=401, detail="Refresh token has been revoked", headers={"WWW-Authenticate": "Bearer"})
+    principal = await load_principal(claims["sub"], session)
+    if principal is None or not principal.is_active:
+        raise HTTPException(status_code=401, detail="Could not find user", headers={"WWW-Authenticate": "Bearer"})
+    if not await token_denylist.revoke(session, claims["jti"], claims["exp"]):
+        raise HTTPException(status_code=401, detail="Refresh token has been revoked", headers={"WWW-Authenticate": "Bearer"})
+    await session.commit()
+    return create_access_token(subject=principal.email), create_refresh_token(subject=principal.email)
+
+async def revoke_refresh_token(refresh_token: str, session: AsyncSession) -> None:
+    claims = decode_refresh_token(refresh_token)
+    await token_denylist.revoke(session, claims["jti"], claims["exp"])
+    await session.commit()
+
+async def authenticate_user(username: str, password: str, session: AsyncSession):
+    logger.info("Authenticating user: %s", username)
+    user = await session.scalar(select(UserModel).where(UserModel.email == username))
+    if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    
+
+    valid, new_hash = await password_hasher.verify_and_update(password, getattr(user, "password"))
+    if not valid:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    if new_hash:
+        # Stored with an older, cheaper cost: upgrade it now that we have the password.
+        user.password = new_hash
+        await session.commit()
+
     if not getattr(user, "is_active", False):
         raise HTTPException(status_code=400, detail="Email not confirmed")
 
     access_token = create_access_token(subject=user.email)
     refresh_token = create_refresh_token(subject=user.email)
 
-    logger.debug(f"User {user.email} logged in successfully.")
+    logger.debug("User %s logged in successfully.", user.email)
     # For debugging purposes, remove in production
     return access_token, refresh_token
 
-def get_current_user(token: str = Depends(reuseable_oauth), session: Session = Depends(get_session)) -> LoggedInUser:
-    try:
-        payload = jwt.decode(
-            token, key=JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
-
-        if datetime.fromtimestamp(token_data.exp) < datetime.now():
-            raise HTTPException(
-                status_code = 401,
-                detail="Token expired",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    except(JWTError, ValidationError):
-        raise HTTPException(
-            status_code=403,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    user = session.query(UserModel).filter(UserModel.email == token_data.sub).first()
+async def load_principal(email: str | None, session: AsyncSession) -> LoggedInStaffUser | None:
+    """
+    Resolve a token subject to its user, from the principal cache when possible.
+    """
+    if not email:
+        return None
+    principal = principal_cache.get(email)
+    if principal is not None:
+        return principal
+    user = await session.scalar(select(UserModel).where(UserModel.email == email))
     if user is None:
-        raise HTTPException(
-            status_code=404,
-            detail="Could not find user",
-        )
-    logged_in_user = LoggedInUser(
-    id=int(user.id),
-    username=str(user.username),
-    email=str(user.email),
-    is_active=bool(user.is_active)  
+        return None
+    principal = LoggedInStaffUser(
+        id=int(user.id),
+        username=str(user.username),
+        email=str(user.email),
+        is_active=bool(user.is_active),
+        is_staff=bool(user.is_staff)
     )
-    return logged_in_user
+    principal_cache.set(principal)
+    return principal
 
-def get_current_staff_user(token: str = Depends(reuseable_oauth), session: Session = Depends(get_session)) -> LoggedInStaffUser:
-    try:
-        payload = jwt.decode(
-            token, JWT_SECRET_KEY, algorithms=[ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
-
-        if datetime.fromtimestamp(token_data.exp) < datetime.now():
-            raise HTTPException(
-                status_code=401,
-                detail="Token expired",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    except (JWTError, ValidationError):
+async def _verified_principal(token: str, session: AsyncSession) -> LoggedInStaffUser | None:
+    token_data = access_token_verifier.verify(token)
+    return await load_principal(token_data.sub, session)
+
+async def get_current_user(token: str = Depends(reuseable_oauth), session: AsyncSession = Depends(get_async_session)) -> LoggedInUser:
+    principal = await _verified_principal(token, session)
+    if principal is None:
         raise HTTPException(
-            status_code=403,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
+            status_code=404,
+            detail="Could not find user",
         )
+    return LoggedInUser(**principal.model_dump(exclude={"is_staff"}))
 
-    user = session.query(UserModel).filter(UserModel.email == token_data.sub).first()
-    if user is None or not getattr(user, "is_staff", False):
+async def get_current_staff_user(token: str = Depends(reuseable_oauth), session: AsyncSession = Depends(get_async_session)) -> LoggedInStaffUser:
+    principal = await _verified_principal(token, session)
+    if principal is None or not principal.is_staff:
         raise HTTPException(
             status_code=404,
             detail="Could not find staff user",
         )
-    logged_in_user = LoggedInStaffUser(
-    id=int(user.id),
-    username=str(user.username),
-    email=str(user.email),
-    is_active=bool(user.is_active),
-    is_staff=bool(user.is_staff)
-    )
-    return logged_in_user
-
+    return principal
@@ -0,0 +1,304 @@
+"""
+Offline catalog loader for ``books.csv``-format dumps
+(``Id,ISBN,Authors,Publication Year,Title,Language``)::
+
+    python -m services.catalog_loader books.csv [more.csv ...] [--workers 8] [--chunk-mb 16]
+        [--keep-ids] [--errors rejected.csv] [--restart]
+
+Files are split into byte ranges on record boundaries and parsed and validated
+in a process pool, while this process writes each chunk in one transaction
+together with its checkpoint in ``catalog_loads``. A load that is interrupted
+resumes after the last chunk it committed; ``--restart`` starts over.
+
+The books indexes and the full-text index are dropped for the duration of the
+load and rebuilt once at the end, so run it while the API is not serving
+search traffic. ``--keep-ids`` uses the dump's ``Id`` as the book id and
+upserts on it, which makes reseeding from the same dump idempotent.
+"""
+import argparse
+import csv
+import io
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterator, Optional, TextIO
+from sqlalchemy import delete, insert, select, update, text
+from sqlalchemy.engine import Connection, Engine
+from db import engine as default_engine
+from db.dialects import dialect_insert
+from db.changes import create_change_triggers, drop_change_triggers, record_full_change
+from db.fts import create_search_index, drop_search_index
+from db.models.books import BookModel
+from db.models.catalog_load import CatalogLoadModel
+from services.importer import CSV_COLUMNS, validate_batch
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+LOADER_CHUNK_MB = float(os.environ.get("LOADER_CHUNK_MB", 16))
+LOADER_WORKERS = int(os.environ.get("LOADER_WORKERS", os.cpu_count() or 1))
+
+ID_COLUMN = "Id"
+
+
+@dataclass(frozen=True)
+class Chunk:
+    path: str
+    start: int  # byte offsets, [start, end)
+    end: int
+    line: int  # line number of the chunk's first line
+    lines: int
+
+
+@dataclass
+class ChunkResult:
+    chunk: Chunk
+    rows: list = field(default_factory=list)
+    errors: list = field(default_factory=list)  # (line, message)
+
+
+def read_header(path: str) -> tuple[list[str], int]:
+    """
+    Return the header's column names and the byte offset of the first row.
+    """
+    with open(path, "rb") as file:
+        header = file.readline()
+        return next(csv.reader([header.decode("utf-8-sig")])), file.tell()
+
+
+def split_chunks(path: str, start: int, line: int, chunk_bytes: int) -> Iterator[Chunk]:
+    """
+    Cut ``path`` from ``start`` into chunks of about ``chunk_bytes``. A chunk
+    only ends on a line break outside quotes, so quoted fields that span
+    lines stay in one chunk.
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        size = quotes = lines = 0
+        for raw in file:
+            size += len(raw)
+            quotes += raw.count(b'"')
+            lines += 1
+            if size >= chunk_bytes and quotes % 2 == 0:
+                yield Chunk(path, start, start + size, line, lines)
+                start, line = start + size, line + lines
+                size = quotes = lines = 0
+        if size:
+            yield Chunk(path, start, start + size, line, lines)
+
+
+def parse_chunk(chunk: Chunk, fieldnames: list[str], keep_ids: bool = False) -> ChunkResult:
+    """
+    Parse and validate one chunk; runs in a worker process.
+    """
+    with open(chunk.path, "rb") as file:
+        file.seek(chunk.start)
+        data = file.read(chunk.end - chunk.start).decode("utf-8")
+    positions = {column: fieldnames.index(column) for column in (*CSV_COLUMNS, ID_COLUMN) if column in fieldnames}
+    result = ChunkResult(chunk)
+    batch, ids = [], {}
+    reader = csv.reader(io.StringIO(data, newline=""))
+    for record in reader:
+        if not record:
+            continue
+        line = chunk.line + reader.line_num - 1
+        fields = {
+            name: record[positions[column]] if column in positions and positions[column] < len(record) else None
+            for column, name in CSV_COLUMNS.items()
+        }
+        if keep_ids:
+            try:
+                ids[line] = int(record[positions[ID_COLUMN]])
+            except (KeyError, IndexError, ValueError):
+                result.errors.append((line, f"{ID_COLUMN}: expected an integer"))
+                continue
+        batch.append((line, fields))
+    valid, rejected = validate_batch(batch)
+    result.errors.extend(rejected)
+    result.rows = [{**book, "id": ids[line]} if keep_ids else book for line, book in valid]
+    result.errors.sort()
+    return result
+
+
+def parse_chunks(chunks: Iterator[Chunk], fieldnames: list[str], keep_ids: bool, workers: int) -> Iterator[ChunkResult]:
+    """
+    Parse chunks in a process pool, yielding results in file order. At most
+    two chunks per worker are in flight, so memory stays bounded when the
+    database is the bottleneck.
+    """
+    if workers <= 1:
+        yield from (parse_chunk(chunk, fieldnames, keep_ids) for chunk in chunks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(parse_chunk, chunk, fieldnames, keep_ids))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _insert_statement(dialect: str, keep_ids: bool):
+    if not keep_ids:
+        return insert(BookModel.__table__)
+    stmt = dialect_insert(dialect, BookModel.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=[BookModel.__table__.c.id],
+        set_={column: stmt.excluded[column] for column in CSV_COLUMNS.values()},
+    )
+
+
+def _write_chunk(connection: Connection, result: ChunkResult, source: str, keep_ids: bool) -> None:
+    if result.rows:
+        connection.execute(_insert_statement(connection.dialect.name, keep_ids), result.rows)
+    chunk = result.chunk
+    connection.execute(
+        update(CatalogLoadModel)
+        .where(CatalogLoadModel.source == source)
+        .values(
+            byte_offset=chunk.end,
+            line=chunk.line + chunk.lines,
+            rows_loaded=CatalogLoadModel.rows_loaded + len(result.rows),
+            rows_rejected=CatalogLoadModel.rows_rejected + len(result.errors),
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+
+@contextmanager
+def deferred_indexes(engine: Engine):
+    """
+    Drop the books secondary indexes, full-text index and change triggers,
+    and rebuild them once when the block exits. Readers of the change log
+    are then told to reload everything.
+    """
+    indexes = list(BookModel.__table__.indexes)
+    with engine.begin() as connection:
+        drop_search_index(connection)
+        drop_change_triggers(connection)
+        for index in indexes:
+            index.drop(connection, checkfirst=True)
+    try:
+        yield
+    finally:
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            for index in indexes:
+                index.create(connection, checkfirst=True)
+            create_search_index(connection)
+            create_change_triggers(connection)
+            record_full_change(connection)
+        logger.info(f"Rebuilt books indexes in {time.perf_counter() - started:.1f}s")
+
+
+def load_file(
+    path: str,
+    engine: Engine = default_engine,
+    workers: int = LOADER_WORKERS,
+    chunk_bytes: int = int(LOADER_CHUNK_MB * 1024 * 1024),
+    keep_ids: bool = False,
+    restart: bool = False,
+    errors: Optional[TextIO] = None,
+) -> dict:
+    """
+    Load one dump, resuming from its checkpoint unless ``restart`` is set or
+    the previous load completed. Rejected rows are written to ``errors`` as
+    ``source,line,error`` when given.
+    """
+    source = os.path.abspath(path)
+    file_size = os.path.getsize(path)
+    fieldnames, data_start = read_header(path)
+    missing = [column for column in CSV_COLUMNS if column not in fieldnames]
+    if missing:
+        raise ValueError(f"{path} is missing columns: {', '.join(missing)}")
+    if keep_ids and ID_COLUMN not in fieldnames:
+        raise ValueError(f"{path} has no {ID_COLUMN} column to keep")
+
+    with engine.begin() as connection:
+        checkpoint = connection.execute(select(CatalogLoadModel).where(CatalogLoadModel.source == source)).first()
+        if checkpoint and not checkpoint.completed and not restart:
+            if checkpoint.file_size != file_size:
+                raise ValueError(f"{path} changed since its interrupted load; rerun with --restart")
+            start, line = checkpoint.byte_offset, checkpoint.line
+        else:
+            start, line = data_start, 2
+            connection.execute(delete(CatalogLoadModel).where(CatalogLoadModel.source == source))
+            connection.execute(insert(CatalogLoadModel).values(
+                source=source, file_size=file_size, byte_offset=start, line=line, rows_loaded=0, rows_rejected=0, completed=False,
+            ))
+    if start > data_start:
+        logger.info(f"Resuming {path} at line {line}")
+
+    error_writer = csv.writer(errors) if errors else None
+    started = time.perf_counter()
+    loaded = rejected = 0
+    chunks = split_chunks(path, start, line, chunk_bytes)
+    for result in parse_chunks(chunks, fieldnames, keep_ids, workers):
+        with engine.begin() as connection:
+            _write_chunk(connection, result, source, keep_ids)
+        loaded += len(result.rows)
+        rejected += len(result.errors)
+        if error_writer:
+            error_writer.writerows((path, line, message) for line, message in result.errors)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        logger.info(
+            f"{path}: {result.chunk.end * 100 // max(file_size, 1)}% "
+            f"{loaded} rows loaded, {rejected} rejected, {loaded / elapsed:.0f} rows/s"
+        )
+
+    with engine.begin() as connection:
+        connection.execute(update(CatalogLoadModel).where(CatalogLoadModel.source == source).values(completed=True, updated_at=datetime.utcnow()))
+        if keep_ids and connection.dialect.name == "postgresql":
+            # Explicit ids bypass the sequence; move it past them for later inserts.
+            connection.execute(text("SELECT setval(pg_get_serial_sequence('books', 'id'), (SELECT max(id) FROM books))"))
+    seconds = time.perf_counter() - started
+    return {
+        "source": path,
+        "resumed_at_line": line if start > data_start else None,
+        "rows_loaded": loaded,
+        "rows_rejected": rejected,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(loaded / seconds, 1) if seconds else 0.0,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Load books.csv-format dumps into the catalog.")
+    parser.add_argument("paths", nargs="+", help="CSV files with Id,ISBN,Authors,Publication Year,Title,Language columns")
+    parser.add_argument("--workers", type=int, default=LOADER_WORKERS, help="Parser processes (1 parses in this process)")
+    parser.add_argument("--chunk-mb", type=float, default=LOADER_CHUNK_MB, help="Size of each parsed and committed chunk")
+    parser.add_argument("--keep-ids", action="store_true", help="Use the Id column as the book id, updating existing books")
+    parser.add_argument("--errors", help="Write rejected rows to this CSV file")
+    parser.add_argument("--restart", action="store_true", help="Ignore checkpoints of interrupted loads")
+    args = parser.parse_args(argv)
+
+    errors = open(args.errors, "a", newline="") if args.errors else None
+    started = time.perf_counter()
+    total = 0
+    try:
+        with deferred_indexes(default_engine):
+            for path in args.paths:
+                stats = load_file(
+                    path,
+                    workers=args.workers,
+                    chunk_bytes=int(args.chunk_mb * 1024 * 1024),
+                    keep_ids=args.keep_ids,
+                    restart=args.restart,
+                    errors=errors,
+                )
+                total += stats["rows_loaded"]
+                logger.info(f"Loaded {path}: {stats}")
+    finally:
+        if errors:
+            errors.close()
+    seconds = time.perf_counter() - started
+    logger.info(f"Catalog load finished: {total} rows in {seconds:.1f}s ({total / max(seconds, 1e-9):.0f} rows/s including index builds)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+Compact in-process copy of the catalog for read-heavy endpoints.
+
+Search still asks the database *which* books match (it owns ranking and
+pagination) but selects only their ids; the rows are rendered from this
+snapshot instead of hydrating ``BookModel`` objects. ISBN lookups are served
+from it entirely.
+
+The snapshot is column-oriented and array-backed, ordered by book id:
+
+- ``ids`` (8 bytes), ``years`` (2 bytes) and ``statuses`` (1 byte) are flat arrays;
+- ``authors`` and ``language`` are dictionary-encoded: each distinct value is
+  interned once and rows hold a 4-byte code;
+- ``isbn`` and ``title`` live in append-only UTF-8 heaps, with a start offset
+  and length per row.
+
+It is loaded at startup when ``CATALOG_SNAPSHOT`` is on, and brought up to
+date before each read from the ``catalog_changes`` log (:mod:`db.changes`):
+one query when nothing changed, otherwise a reload of just the
+changed rows. Memory footprint and refresh cost are reported in ``stats()``.
+"""
+import asyncio
+import os
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models.books import BookModel
+from db.models.catalog_change import CatalogChangeModel
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CATALOG_SNAPSHOT = os.environ.get("CATALOG_SNAPSHOT", "false").lower() in ("1", "true", "yes")
+CATALOG_SNAPSHOT_FULL_RELOAD = int(os.environ.get("CATALOG_SNAPSHOT_FULL_RELOAD", 50000))  # changes that trigger a full reload
+# PostgreSQL sequence values can commit out of order, so the log is re-read a
+# little behind the last applied id; SQLite serializes writers.
+CATALOG_CHANGES_OVERLAP = int(os.environ.get("CATALOG_CHANGES_OVERLAP", 1000))
+CATALOG_CHANGES_KEEP = int(os.environ.get("CATALOG_CHANGES_KEEP", 1000000))
+LOAD_BATCH_SIZE = 10000
+
+STATUSES = ("available", "borrowed")
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+DELETED = 255
+
+BOOK_COLUMNS = (BookModel.id, BookModel.isbn, BookModel.authors, BookModel.title, BookModel.language, BookModel.publication_year, BookModel.rental_status)
+
+
+def _status_code(book) -> int:
+    return STATUS_CODES.get(str(getattr(book.rental_status, "value", book.rental_status)), 0)
+
+
+class StringDictionary:
+    """
+    Dictionary encoding for low-cardinality columns.
+    """
+
+    def __init__(self):
+        self.values: list[str] = []
+        self._codes: dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            value = sys.intern(value)
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.values) + sys.getsizeof(self._codes) + sum(sys.getsizeof(value) for value in self.values)
+
+
+class StringHeap:
+    """
+    Append-only UTF-8 storage for high-cardinality columns. Replaced values
+    stay in the heap as garbage until the next full load.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.starts = array("Q")
+        self.lengths = array("H")
+
+    def _write(self, value: str) -> tuple[int, int]:
+        encoded = value.encode("utf-8")
+        start = len(self.data)
+        self.data += encoded
+        return start, len(encoded)
+
+    def insert(self, row: int, value: str) -> None:
+        start, length = self._write(value)
+        self.starts.insert(row, start)
+        self.lengths.insert(row, length)
+
+    def replace(self, row: int, value: str) -> None:
+        self.starts[row], self.lengths[row] = self._write(value)
+
+    def get(self, row: int) -> str:
+        start = self.starts[row]
+        return self.data[start:start + self.lengths[row]].decode("utf-8")
+
+    def nbytes(self) -> int:
+        return len(self.data) + self.starts.itemsize * len(self.starts) + self.lengths.itemsize * len(self.lengths)
+
+
+class CatalogColumns:
+    """
+    The snapshot's columns and ISBN index. A full load builds a new instance
+    and swaps it in, so readers never see a half-built catalog.
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.years = array("h")
+        self.statuses = bytearray()
+        self.isbns = StringHeap()
+        self.titles = StringHeap()
+        self.authors = StringDictionary()
+        self.author_codes = array("I")
+        self.languages = StringDictionary()
+        self.language_codes = array("I")
+        # ISBN index: hash(isbn) and book id, sorted by hash, 16 bytes per book.
+        self._isbn_hashes = array("q")
+        self._isbn_ids = array("q")
+
+    def _row(self, book_id: int) -> Optional[int]:
+        row = bisect_left(self.ids, book_id)
+        return row if row < len(self.ids) and self.ids[row] == book_id else None
+
+    def _index_isbn(self, isbn: str, book_id: int) -> None:
+        key = hash(isbn)
+        position = bisect_right(self._isbn_hashes, key)
+        self._isbn_hashes.insert(position, key)
+        self._isbn_ids.insert(position, book_id)
+
+    def _unindex_isbn(self, isbn: str, book_id: int) -> None:
+        key = hash(isbn)
+        for position in range(bisect_left(self._isbn_hashes, key), bisect_right(self._isbn_hashes, key)):
+            if self._isbn_ids[position] == book_id:
+                del self._isbn_hashes[position]
+                del self._isbn_ids[position]
+                return
+
+    def sort_isbn_index(self) -> None:
+        order = sorted(range(len(self._isbn_hashes)), key=self._isbn_hashes.__getitem__)
+        self._isbn_hashes = array("q", (self._isbn_hashes[position] for position in order))
+        self._isbn_ids = array("q", (self._isbn_ids[position] for position in order))
+
+    def append(self, book) -> None:
+        """
+        Add a book with a higher id than any so far, during a full load. The
+        ISBN index is left unsorted until :meth:`sort_isbn_index`.
+        """
+        self.ids.append(book.id)
+        self.years.append(book.publication_year)
+        self.statuses.append(_status_code(book))
+        self.isbns.insert(len(self.isbns.starts), book.isbn)
+        self.titles.insert(len(self.titles.starts), book.title)
+        self.author_codes.append(self.authors.encode(book.authors))
+        self.language_codes.append(self.languages.encode(book.language))
+        self._isbn_hashes.append(hash(book.isbn))
+        self._isbn_ids.append(book.id)
+
+    def upsert(self, book) -> None:
+        status = _status_code(book)
+        indexed = False
+        row = self._row(book.id)
+        if row is None:
+            row = bisect_left(self.ids, book.id)
+            self.ids.insert(row, book.id)
+            self.years.insert(row, book.publication_year)
+            self.statuses.insert(row, status)
+            self.isbns.insert(row, book.isbn)
+            self.titles.insert(row, book.title)
+            self.author_codes.insert(row, self.authors.encode(book.authors))
+            self.language_codes.insert(row, self.languages.encode(book.language))
+        else:
+            if self.statuses[row] != DELETED:
+                old_isbn = self.isbns.get(row)
+                if old_isbn == book.isbn:
+                    indexed = True
+                else:
+                    self._unindex_isbn(old_isbn, book.id)
+                    self.isbns.replace(row, book.isbn)
+                if self.titles.get(row) != book.title:
+                    self.titles.replace(row, book.title)
+            else:
+                self.isbns.replace(row, book.isbn)
+                self.titles.replace(row, book.title)
+            self.years[row] = book.publication_year
+            self.statuses[row] = status
+            self.author_codes[row] = self.authors.encode(book.authors)
+            self.language_codes[row] = self.languages.encode(book.language)
+        if not indexed:
+            self._index_isbn(book.isbn, book.id)
+
+    def delete(self, book_id: int) -> None:
+        row = self._row(book_id)
+        if row is not None and self.statuses[row] != DELETED:
+            self._unindex_isbn(self.isbns.get(row), book_id)
+            self.statuses[row] = DELETED
+
+    def get(self, book_id: int) -> Optional[dict]:
+        row = self._row(book_id)
+        if row is None or self.statuses[row] == DELETED:
+            return None
+        return {
+            "id": book_id,
+            "isbn": self.isbns.get(row),
+            "authors": self.authors.values[self.author_codes[row]],
+            "publication_year": self.years[row],
+            "title": self.titles.get(row),
+            "language": self.languages.values[self.language_codes[row]],
+            "rental_status": STATUSES[self.statuses[row]],
+        }
+
+    def books(self, book_ids: Iterable[int]) -> dict[int, dict]:
+        """
+        The snapshot rows of ``book_ids`` that it has, by id.
+        """
+        found = {}
+        for book_id in book_ids:
+            book = self.get(book_id)
+            if book is not None:
+                found[book_id] = book
+        return found
+
+    def by_isbn(self, isbn: str) -> list[dict]:
+        key = hash(isbn)
+        books = []
+        for position in range(bisect_left(self._isbn_hashes, key), bisect_right(self._isbn_hashes, key)):
+            book = self.get(self._isbn_ids[position])
+            if book is not None and book["isbn"] == isbn:  # hashes can collide
+                books.append(book)
+        return sorted(books, key=lambda book: book["id"])
+
+    def nbytes(self) -> int:
+        arrays = (self.ids, self.years, self.author_codes, self.language_codes, self._isbn_hashes, self._isbn_ids)
+        return (
+            sum(column.itemsize * len(column) for column in arrays)
+            + len(self.statuses)
+            + self.isbns.nbytes()
+            + self.titles.nbytes()
+            + self.authors.nbytes()
+            + self.languages.nbytes()
+        )
+
+
+class CatalogSnapshot:
+    def __init__(self, full_reload: int = CATALOG_SNAPSHOT_FULL_RELOAD, overlap: int = CATALOG_CHANGES_OVERLAP):
+        self.full_reload = full_reload
+        self.overlap = overlap
+        self.loaded = False
+        self.columns = CatalogColumns()
+        self._cursor = 0  # last change id applied
+        self._applied: set[int] = set()  # change ids applied within the overlap window
+        self._head: Optional[tuple] = None
+        # One coroutine applies changes at a time. Readers that refresh wait
+        # for the one in progress (then usually find nothing left to apply);
+        # lookups that do not refresh read the current columns without waiting.
+        self._lock = asyncio.Lock()
+        self._counters = {"full_loads": 0, "refreshes": 0, "rows_refreshed": 0}
+        self._last_refresh_ms = self._last_load_ms = 0.0
+
+    def get(self, book_id: int) -> Optional[dict]:
+        return self.columns.get(book_id)
+
+    def books(self, book_ids: Iterable[int]) -> dict[int, dict]:
+        return self.columns.books(book_ids)
+
+    def by_isbn(self, isbn: str) -> list[dict]:
+        return self.columns.by_isbn(isbn)
+
+    def nbytes(self) -> int:
+        return self.columns.nbytes()
+
+    # Loading
+
+    async def _log_head(self, session: AsyncSession, cursor: int) -> tuple:
+        floor = max(cursor - self.overlap, 0)
+        # One round trip; each part is a primary key seek or range count.
+        pending = select(func.count()).select_from(CatalogChangeModel).where(CatalogChangeModel.id > floor).scalar_subquery()
+        last, oldest, pending = (await session.execute(
+            select(func.max(CatalogChangeModel.id), func.min(CatalogChangeModel.id), pending)
+        )).one()
+        return last or 0, oldest or 0, pending
+
+    async def load(self, session: AsyncSession) -> None:
+        """
+        Read the whole catalog. The log position is taken first, so changes
+        committed during the load are applied again by the next refresh.
+        """
+        async with self._lock:
+            await self._load(session)
+
+    async def _load(self, session: AsyncSession) -> None:
+        started = time.perf_counter()
+        cursor = (await self._log_head(session, 0))[0]
+        head = await self._log_head(session, cursor)
+        applied = set(await session.scalars(
+            select(CatalogChangeModel.id).where(CatalogChangeModel.id > max(cursor - self.overlap, 0))
+        ))
+        columns = CatalogColumns()
+        result = await session.stream(select(*BOOK_COLUMNS).order_by(BookModel.id).execution_options(yield_per=LOAD_BATCH_SIZE))
+        async for book in result:
+            columns.append(book)
+        columns.sort_isbn_index()
+        # Readers keep the previous columns until this single assignment.
+        self.columns, self._cursor, self._head, self._applied = columns, cursor, head, applied
+        self.loaded = True
+        self._counters["full_loads"] += 1
+        self._last_load_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Catalog snapshot loaded: {len(columns.ids)} books, {columns.nbytes() / 1e6:.1f} MB in {self._last_load_ms:.0f} ms")
+
+    async def refresh(self, session: AsyncSession) -> int:
+        """
+        Apply the changes logged since the last refresh and return how many
+        books were re-read. Costs one query when nothing changed.
+        """
+        async with self._lock:
+            return await self._refresh(session)
+
+    async def _refresh(self, session: AsyncSession) -> int:
+        head = await self._log_head(session, self._cursor)
+        if head == self._head:
+            return 0
+        started = time.perf_counter()
+        last, oldest, _ = head
+        if self._cursor and oldest > self._cursor + 1:
+            # Pruned past our position: the log no longer says what we missed.
+            await self._load(session)
+            return len(self.columns.ids)
+        floor = max(self._cursor - self.overlap, 0)
+        changes = [
+            change for change in await session.execute(
+                select(CatalogChangeModel.id, CatalogChangeModel.book_id).where(CatalogChangeModel.id > floor)
+            )
+            if change.id not in self._applied
+        ]
+        if len(changes) > self.full_reload or any(change.book_id is None for change in changes):
+            await self._load(session)
+            return len(self.columns.ids)
+
+        # Changed rows are applied in place: each upsert completes before the
+        # next await, so readers see every row either before or after it.
+        columns = self.columns
+        book_ids = {change.book_id for change in changes}
+        found = set()
+        for batch in _batches(sorted(book_ids), LOAD_BATCH_SIZE):
+            for book in await session.execute(select(*BOOK_COLUMNS).where(BookModel.id.in_(batch))):
+                columns.upsert(book)
+                found.add(book.id)
+        for book_id in book_ids - found:
+            columns.delete(book_id)
+
+        self._cursor = max(self._cursor, last)
+        self._applied = {change_id for change_id in (*self._applied, *(change.id for change in changes)) if change_id > self._cursor - self.overlap}
+        self._head = head
+        self._counters["refreshes"] += 1
+        self._counters["rows_refreshed"] += len(book_ids)
+        self._last_refresh_ms = (time.perf_counter() - started) * 1000
+        return len(book_ids)
+
+    def stats(self) -> dict:
+        columns = self.columns
+        books = len(columns.ids) - columns.statuses.count(DELETED)
+        nbytes = columns.nbytes()
+        return {
+            "enabled": self.loaded,
+            "books": books,
+            "bytes": nbytes,
+            "bytes_per_book": round(nbytes / books, 1) if books else 0.0,
+            "distinct_authors": len(columns.authors.values),
+            "change_cursor": self._cursor,
+            **self._counters,
+            "last_load_ms": round(self._last_load_ms, 1),
+            "last_refresh_ms": round(self._last_refresh_ms, 1),
+        }
+
+def _batches(values: list, size: int):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+catalog_snapshot = CatalogSnapshot()
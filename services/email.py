@@ -3,6 +3,16 @@ from email.message import EmailMessage
 import smtplib
 from tenacity import retry, wait_fixed, stop_after_attempt, retry_if_exception_type
 
+
+def build_message(subject: str, body: str, to: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = os.environ.get("EMAIL_FROM", "admin@libtrary.com")
+    msg["To"] = to
+    msg.set_content(body)
+    return msg
+
+
 # Retry if SMTP errors occur — try 3 times, wait 2 seconds between
 @retry(
     retry=retry_if_exception_type(smtplib.SMTPException),
@@ -10,11 +20,7 @@ from tenacity import retry, wait_fixed, stop_after_attempt, retry_if_exception_t
     stop=stop_after_attempt(3)
 )
 def send_email(subject: str, body: str, to: str):
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = os.environ.get("EMAIL_FROM", "admin@libtrary.com")
-    msg["To"] = to
-    msg.set_content(body)
+    msg = build_message(subject, body, to)
 
     with smtplib.SMTP(
         host=os.environ.get("EMAIL_HOST", "localhost"),
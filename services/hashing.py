@@ -0,0 +1,195 @@
+"""
+Password hashing in a dedicated process pool.
+
+bcrypt costs 100-300 ms of CPU per call by design. Running it on the request
+path ties up the threadpool (and the GIL) for every login, so hashes and
+verifications are sent to a small pool of worker processes instead. At most
+``HASH_MAX_PENDING`` operations may be queued or running; beyond that callers
+get a 503 rather than waiting behind a login storm.
+
+``BCRYPT_ROUNDS`` fixes the cost factor, or is ``auto`` to calibrate it at
+startup so one hash takes about ``HASH_TARGET_MS`` on this machine. Stored
+hashes with fewer rounds are upgraded transparently the next time their owner
+logs in. To preview the calibration::
+
+    python -m services.hashing --target-ms 250
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+HASH_POOL_SIZE = int(os.environ.get("HASH_POOL_SIZE", min(4, os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", 64))
+HASH_TARGET_MS = float(os.environ.get("HASH_TARGET_MS", 250))
+BCRYPT_ROUNDS = os.environ.get("BCRYPT_ROUNDS", "12")  # or "auto"
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+
+
+@lru_cache
+def crypt_context(rounds: int) -> CryptContext:
+    # min_rounds makes needs_update() flag hashes weaker than the current cost.
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+
+
+# Worker-process entry points; module-level so they can be pickled.
+
+def _hash(password: str, rounds: int) -> str:
+    return crypt_context(rounds).hash(password)
+
+
+def _verify(password: str, hashed: str, rounds: int) -> bool:
+    return crypt_context(rounds).verify(password, hashed)
+
+
+def _verify_and_update(password: str, hashed: str, rounds: int) -> tuple[bool, Optional[str]]:
+    return crypt_context(rounds).verify_and_update(password, hashed)
+
+
+def _timed(fn, *args):
+    # Runs in the worker: the elapsed time excludes the wait for a free worker.
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+
+def calibrate_rounds(target_ms: float = HASH_TARGET_MS, min_rounds: int = MIN_ROUNDS, max_rounds: int = MAX_ROUNDS) -> int:
+    """
+    The highest cost whose hash takes at most ``target_ms`` here, never below
+    ``min_rounds``. Each extra round doubles the work, so one timed hash at
+    ``min_rounds`` is enough to extrapolate.
+    """
+    _hash("calibration", min_rounds)  # warm up
+    started = time.perf_counter()
+    _hash("calibration", min_rounds)
+    base_ms = (time.perf_counter() - started) * 1000
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    return rounds
+
+
+class PasswordHasher:
+    """
+    Async front end to a bounded bcrypt process pool, with queue metrics.
+    """
+
+    def __init__(
+        self,
+        workers: int = HASH_POOL_SIZE,
+        max_pending: int = HASH_MAX_PENDING,
+        rounds: Optional[int] = None,
+        target_ms: float = HASH_TARGET_MS,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.target_ms = target_ms
+        self.rounds = rounds or (int(BCRYPT_ROUNDS) if BCRYPT_ROUNDS != "auto" else None)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._counters = {"completed": 0, "failed": 0, "rejected": 0, "rehashed": 0}
+        self._busy_seconds = 0.0
+        self._bcrypt_seconds = 0.0
+
+    @property
+    def context(self) -> CryptContext:
+        return crypt_context(self.rounds or MIN_ROUNDS)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe.
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def _run(self, fn, *args, counted: bool = True):
+        if self._pending >= self.max_pending:
+            self._counters["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Too many password checks in progress, retry shortly", headers={"Retry-After": "1"})
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            result, bcrypt_seconds = await asyncio.get_running_loop().run_in_executor(self._executor(), _timed, fn, *args)
+        except BaseException:
+            if counted:
+                self._counters["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+        # Only successful calls feed the latency figures.
+        if counted:
+            self._counters["completed"] += 1
+            self._busy_seconds += time.perf_counter() - started
+            self._bcrypt_seconds += bcrypt_seconds
+        return result
+
+    async def start(self) -> None:
+        """
+        Start the workers, calibrating the cost first when it is ``auto``.
+        The pool lives until :meth:`stop` or interpreter exit.
+        """
+        if self.rounds is None:
+            self.rounds = await asyncio.get_running_loop().run_in_executor(self._executor(), calibrate_rounds, self.target_ms)
+        elif self._pool is None:
+            await asyncio.gather(*(self._run(_hash, "warm-up", MIN_ROUNDS, counted=False) for _ in range(self.workers)))
+
+    def stop(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def hash(self, password: str) -> str:
+        if self.rounds is None:
+            await self.start()
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_verify, password, hashed, self.rounds or MIN_ROUNDS)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, Optional[str]]:
+        """
+        Verify ``password``; when it matches a hash weaker than the current
+        cost, also return a replacement hash to store.
+        """
+        if self.rounds is None:
+            await self.start()
+        valid, new_hash = await self._run(_verify_and_update, password, hashed, self.rounds)
+        if new_hash:
+            self._counters["rehashed"] += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        completed = self._counters["completed"]
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "queue_depth": max(self._pending - self.workers, 0),
+            **self._counters,
+            "busy_seconds": round(self._busy_seconds, 3),  # queue wait included
+            "bcrypt_seconds": round(self._bcrypt_seconds, 3),
+            "avg_latency_ms": round(self._busy_seconds * 1000 / completed, 1) if completed else 0.0,
+        }
+
+
+password_hasher = PasswordHasher()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Find the bcrypt cost that hashes in about the target time.")
+    parser.add_argument("--target-ms", type=float, default=HASH_TARGET_MS)
+    args = parser.parse_args(argv)
+    rounds = calibrate_rounds(args.target_ms)
+    started = time.perf_counter()
+    _hash("calibration", rounds)
+    print(f"BCRYPT_ROUNDS={rounds}  # {(time.perf_counter() - started) * 1000:.0f} ms per hash")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+HTTP response cache for catalog reads.
+
+Catalog responses only change when the catalog does: books are imported,
+rented or returned. Every mutation path bumps a catalog version, and cached
+responses are valid only for the version they were rendered at, so nothing
+else needs to be invalidated.
+
+Responses carry a strong ``ETag`` (a digest of the body) and ``Cache-Control``.
+A request whose ``If-None-Match`` matches a cached, current entry is answered
+with 304 before any query runs.
+
+The version is per process by default, so a worker that did not handle a
+mutation would keep serving its copy; entries are therefore also retired
+after ``CATALOG_CACHE_TTL`` seconds, which bounds how stale another worker
+can be. Multi-worker deployments can share the version instead by pointing
+``CATALOG_VERSION_BACKEND`` at a ``module:Class`` implementing
+:class:`VersionBackend` (e.g. a Redis INCR wrapper); the TTL then no longer
+applies.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Protocol
+from fastapi import Request, Response
+from services.principal_cache import load_backend
+
+CATALOG_CACHE_SIZE = int(os.environ.get("CATALOG_CACHE_SIZE", 1024))  # 0 disables the cache
+CATALOG_CACHE_MAX_AGE = int(os.environ.get("CATALOG_CACHE_MAX_AGE", 0))  # seconds clients may skip revalidation
+CATALOG_VERSION_BACKEND = os.environ.get("CATALOG_VERSION_BACKEND", "")
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", 5))  # seconds, with the per-process version; 0 for no limit
+
+
+class VersionBackend(Protocol):
+    def get(self) -> int: ...
+    def incr(self) -> int: ...
+
+
+class MemoryVersionBackend:
+    def __init__(self):
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> int:
+        return self._version
+
+    def incr(self) -> int:
+        with self._lock:
+            self._version += 1
+            return self._version
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    version: int
+    body: bytes
+    etag: str
+    media_type: str = "application/json"
+    headers: dict = field(default_factory=dict)
+    expires_at: Optional[float] = None  # monotonic
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # If-None-Match uses weak comparison, so W/"x" matches "x".
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class CatalogCache:
+    """
+    LRU map of rendered catalog responses, keyed by route and normalized
+    query parameters and stamped with the catalog version.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[VersionBackend] = None,
+        maxsize: int = CATALOG_CACHE_SIZE,
+        max_age: int = CATALOG_CACHE_MAX_AGE,
+        ttl: float = CATALOG_CACHE_TTL,
+    ):
+        self.backend = backend if backend is not None else MemoryVersionBackend()
+        self.maxsize = maxsize
+        self.max_age = max_age
+        # Only a per-process version needs a TTL to reach the other workers.
+        self.ttl = ttl if ttl and isinstance(self.backend, MemoryVersionBackend) else None
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+    @property
+    def version(self) -> int:
+        return self.backend.get()
+
+    def bump(self) -> int:
+        """
+        Mark every cached response stale. Call after committing a change to
+        the catalog.
+        """
+        self._counters["invalidations"] += 1
+        return self.backend.incr()
+
+    @staticmethod
+    def key(route: str, **params) -> tuple:
+        return (route, *sorted((name, value) for name, value in params.items() if value not in (None, "")))
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        if not self.maxsize:
+            return None
+        version = self.version
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.version != version or (entry.expires_at is not None and entry.expires_at <= time.monotonic())):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+        self._counters["hits"] += 1
+        return entry
+
+    def set(self, key: tuple, version: int, body: bytes, headers: Optional[dict] = None, ttl: Optional[float] = None) -> CachedResponse:
+        """
+        Store a response rendered at ``version``, which the caller reads
+        before querying so a concurrent bump is never masked. Responses read
+        from a replica may predate the bump, so they get a ``ttl`` of the
+        replica lag bound as well.
+        """
+        ttls = [limit for limit in (ttl, self.ttl) if limit is not None]
+        expires_at = time.monotonic() + min(ttls) if ttls else None
+        entry = CachedResponse(version=version, body=body, etag=make_etag(body), headers=headers or {}, expires_at=expires_at)
+        if self.maxsize:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def respond(self, request: Request, entry: CachedResponse) -> Response:
+        headers = {
+            **entry.headers,
+            "ETag": entry.etag,
+            "Cache-Control": f"public, max-age={self.max_age}, must-revalidate",
+        }
+        if etag_matches(request, entry.etag):
+            self._counters["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            "backend": type(self.backend).__name__,
+            "version": self.version,
+            "entries": len(self._entries),
+            **self._counters,
+            "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+catalog_cache = CatalogCache(load_backend(CATALOG_VERSION_BACKEND) if CATALOG_VERSION_BACKEND else None)
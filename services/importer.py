@@ -0,0 +1,171 @@
+"""
+Streaming CSV import of books.
+
+The upload is read incrementally from its spooled file, validated a batch at a
+time and written with executemany inserts, so memory stays flat whatever the
+file size. Each batch is committed on its own; rows that fail validation are
+reported with their line number instead of being dropped silently.
+
+Books have no unique ISBN, so duplicates are handled in the importer:
+``on_duplicate="insert"`` (default) adds every row, ``"skip"`` ignores rows
+whose ISBN is already in the catalog (or earlier in the file) and
+``"update"`` overwrites every existing book with that ISBN with the row.
+``updated`` counts the books overwritten; ``skipped`` counts file rows.
+"""
+import csv
+import io
+import os
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterator, List, Literal
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import select, insert, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from db.models.books import BookModel
+from schema.books import BookCreate
+
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+IMPORT_MAX_ERRORS = int(os.environ.get("IMPORT_MAX_ERRORS", 1000))  # errors listed in the report
+
+CSV_COLUMNS = {
+    "ISBN": "isbn",
+    "Authors": "authors",
+    "Publication Year": "publication_year",
+    "Title": "title",
+    "Language": "language",
+}
+
+DuplicateMode = Literal["insert", "skip", "update"]
+# Rental status belongs to the library, not the catalog file.
+UPDATED_COLUMNS = ("authors", "publication_year", "title", "language")
+
+_books_adapter = TypeAdapter(List[BookCreate])
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        seconds = time.perf_counter() - self.started_at
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else 0.0,
+        }
+
+
+def read_batches(file: BinaryIO, batch_size: int = IMPORT_BATCH_SIZE) -> Iterator[list[tuple[int, dict]]]:
+    """
+    Yield ``(line, fields)`` pairs from a CSV file in batches, mapping the
+    ``books.csv`` headers to :class:`BookCreate` fields. Extra columns such as
+    ``Id`` are ignored.
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text)
+        batch = []
+        for row in reader:
+            batch.append((reader.line_num, {name: row.get(column) for column, name in CSV_COLUMNS.items()}))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        # Leave the underlying file open for its owner.
+        text.detach()
+
+
+def validate_batch(batch: list[tuple[int, dict]]) -> tuple[list[tuple[int, dict]], list[tuple[int, str]]]:
+    """
+    Validate a batch in one pass; returns ``(valid, errors)`` where ``errors``
+    holds ``(line, message)`` for each rejected row.
+    """
+    try:
+        books = _books_adapter.validate_python([fields for _, fields in batch])
+        return [(line, book.model_dump()) for (line, _), book in zip(batch, books)], []
+    except ValidationError as exc:
+        messages: dict[int, list[str]] = {}
+        for error in exc.errors():
+            index, *loc = error["loc"]
+            messages.setdefault(index, []).append(f"{'.'.join(map(str, loc))}: {error['msg']}")
+    rejected = [(batch[index][0], "; ".join(errors)) for index, errors in sorted(messages.items())]
+    valid_rows = [row for index, row in enumerate(batch) if index not in messages]
+    valid, _ = validate_batch(valid_rows) if valid_rows else ([], [])
+    return valid, rejected
+
+
+async def _write_batch(session: AsyncSession, books: list[dict], on_duplicate: DuplicateMode, report: ImportReport) -> None:
+    if on_duplicate != "insert":
+        # Last row wins within the batch for updates, first row for skips.
+        by_isbn: dict[str, dict] = {}
+        for book in books:
+            if on_duplicate == "update" or book["isbn"] not in by_isbn:
+                by_isbn[book["isbn"]] = book
+        report.skipped += len(books) - len(by_isbn)
+        # books.isbn is not unique: an ISBN may already name several books.
+        existing: dict[str, list[int]] = {}
+        for isbn, book_id in await session.execute(select(BookModel.isbn, BookModel.id).where(BookModel.isbn.in_(by_isbn))):
+            existing.setdefault(isbn, []).append(book_id)
+        books = [book for isbn, book in by_isbn.items() if isbn not in existing]
+        if on_duplicate == "skip":
+            report.skipped += len(existing)
+        elif existing:
+            await (await session.connection()).execute(
+                update(BookModel.__table__)
+                .where(BookModel.__table__.c.id == bindparam("book_id"))
+                .values({column: bindparam(f"new_{column}") for column in UPDATED_COLUMNS}),
+                [
+                    {"book_id": book_id, **{f"new_{column}": by_isbn[isbn][column] for column in UPDATED_COLUMNS}}
+                    for isbn, book_ids in existing.items()
+                    for book_id in book_ids
+                ],
+            )
+            report.updated += sum(len(book_ids) for book_ids in existing.values())
+    if books:
+        await (await session.connection()).execute(insert(BookModel.__table__), books)
+        report.created += len(books)
+
+
+async def import_books(
+    session: AsyncSession,
+    file: BinaryIO,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_duplicate: DuplicateMode = "insert",
+) -> ImportReport:
+    """
+    Import a books CSV from a binary file object, committing after each batch.
+    Parsing runs in the threadpool so large files never block the event loop.
+    """
+    report = ImportReport()
+    batches = read_batches(file, batch_size)
+    try:
+        while (batch := await run_in_threadpool(next, batches, None)) is not None:
+            report.rows += len(batch)
+            valid, rejected = validate_batch(batch)
+            for line, message in rejected:
+                report.add_error(line, message)
+            if valid:
+                await _write_batch(session, [book for _, book in valid], on_duplicate, report)
+                await session.commit()
+    finally:
+        batches.close()
+    return report
@@ -1,32 +1,280 @@
+"""
+Application logging.
+
+Loggers hand records to a ``QueueHandler``; a ``QueueListener`` thread
+formats them and does the console and rotating-file I/O, so a log call in a
+request costs an enqueue. Output is one JSON object per line
+(``LOG_FORMAT=text`` for the old human-readable lines), carrying the
+``X-Request-ID`` of the request that logged it and any ``extra`` fields.
+
+Hot loggers can be thinned out below WARNING, per logger name prefix:
+
+- ``LOG_SAMPLING="services.auth=0.1"`` keeps a random 10% of records;
+- ``LOG_RATE_LIMIT="services.query_stats=100"`` keeps at most 100 records
+  a second (a one-second burst), dropping the rest.
+
+The listener is started with the first logger and stopped -- draining the
+queue -- by :func:`stop_logging` at app shutdown or interpreter exit.
+"""
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
 
 LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
 LOG_FILE_PATH = os.path.join(LOG_DIR, "app.log")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_SAMPLING = os.environ.get("LOG_SAMPLING", "")
+LOG_RATE_LIMIT = os.environ.get("LOG_RATE_LIMIT", "services.query_stats=100")
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed in ``extra``.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+def extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update(extra_fields(record))
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(levelname)s | %(name)s | %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = extra_fields(record)
+        if getattr(record, "request_id", None):
+            fields = {"request_id": record.request_id, **fields}
+        return line + "".join(f" {key}={value}" for key, value in fields.items()) if fields else line
+
+
+class RequestContextQueueHandler(QueueHandler):
+    """
+    Stamps the request id while still in the request's context, and renders
+    the message and traceback before the record crosses to the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A copy: handlers further up the hierarchy still get the original.
+        record = copy.copy(record)
+        record.request_id = request_id.get()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.getMessage(), None, None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket: ``per_second`` records a second, bursting to one second's worth.
+    """
+
+    def __init__(self, per_second: float, clock=time.monotonic):
+        super().__init__()
+        self.per_second = per_second
+        self.clock = clock
+        self.tokens = per_second
+        self.updated = clock()
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.per_second, self.tokens + (now - self.updated) * self.per_second)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.dropped += 1
+            return False
+
+
+def parse_rules(spec: str) -> dict[str, float]:
+    rules = {}
+    for rule in filter(None, (part.strip() for part in spec.split(","))):
+        name, value = rule.split("=")
+        rules[name.strip()] = float(value)
+    return rules
+
+
+def _rule_for(name: str, rules: dict[str, float]) -> Optional[float]:
+    # The longest configured prefix wins: "services" applies to "services.auth".
+    matches = [prefix for prefix in rules if name == prefix or name.startswith(prefix + ".")]
+    return rules[max(matches, key=len)] if matches else None
+
+
+_SAMPLING_RULES = parse_rules(LOG_SAMPLING)
+_RATE_LIMIT_RULES = parse_rules(LOG_RATE_LIMIT)
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_queue_handler = RequestContextQueueHandler(_queue)
+_listeners: list[QueueListener] = []
+_app_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+
+
+def queue_handler(*handlers: logging.Handler) -> QueueHandler:
+    """
+    A QueueHandler feeding ``handlers`` from a listener thread that
+    :func:`start_logging` and :func:`stop_logging` manage.
+    """
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    with _lock:
+        _listeners.append(listener)
+    listener.start()
+    return RequestContextQueueHandler(log_queue)
+
+
+def _create_app_listener() -> QueueListener:
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+    console_handler = logging.StreamHandler()
+    file_handler = RotatingFileHandler(LOG_FILE_PATH, maxBytes=5_000_000, backupCount=3)
+    for handler in (console_handler, file_handler):
+        handler.setFormatter(formatter)
+    return QueueListener(_queue, console_handler, file_handler, respect_handler_level=True)
+
+
+def start_logging() -> None:
+    global _app_listener
+    with _lock:
+        if _app_listener is None:
+            _app_listener = _create_app_listener()
+            _listeners.append(_app_listener)
+        for listener in _listeners:
+            if listener._thread is None:
+                listener.start()
+
+
+def stop_logging() -> None:
+    """
+    Write out everything queued so far and stop the listener threads. Later
+    records wait in the queue until :func:`start_logging`.
+    """
+    with _lock:
+        for listener in _listeners:
+            if listener._thread is not None:
+                listener.stop()
+
+
+def flush_logging() -> None:
+    """
+    Write out everything queued so far and keep logging.
+    """
+    stop_logging()
+    start_logging()
+
+
+def _restart_in_child() -> None:
+    # A forked worker inherits the listeners but not their threads.
+    for listener in _listeners:
+        listener._thread = None
+    start_logging()
+
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def dropped_records() -> dict[str, int]:
+    """
+    Records dropped by sampling or rate limiting, per logger.
+    """
+    counts = {}
+    for name, logger in logging.Logger.manager.loggerDict.items():
+        for log_filter in getattr(logger, "filters", ()):
+            if isinstance(log_filter, (SamplingFilter, RateLimitFilter)):
+                counts[name] = counts.get(name, 0) + log_filter.dropped
+    return counts
+
 
 def setup_logger(name: str) -> logging.Logger:
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(LOG_LEVEL)
 
     # Avoid duplicate handlers in dev reload
-    if logger.hasHandlers():
+    if _queue_handler in logger.handlers:
         return logger
 
-    formatter = logging.Formatter(
-        "%(levelname)s | %(name)s | %(message)s"
-    )
+    sampling, rate_limit = _rule_for(name, _SAMPLING_RULES), _rule_for(name, _RATE_LIMIT_RULES)
+    if sampling is not None:
+        logger.addFilter(SamplingFilter(sampling))
+    if rate_limit is not None:
+        logger.addFilter(RateLimitFilter(rate_limit))
+    logger.addHandler(_queue_handler)
+    start_logging()
+    return logger
 
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
-    # Rotating file handler
-    file_handler = RotatingFileHandler(LOG_FILE_PATH, maxBytes=5_000_000, backupCount=3)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+class RequestIdMiddleware:
+    """
+    Pure ASGI middleware binding ``X-Request-ID`` (taken from the request,
+    or generated) to the logs of the request, and echoing it back.
+    """
 
-    return logger
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        value = next((value.decode("latin-1") for name, value in scope["headers"] if name == self.header), None)
+        value = value[:128] if value else uuid.uuid4().hex
+        token = request_id.set(value)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (self.header, value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
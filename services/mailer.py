@@ -0,0 +1,240 @@
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from email.message import EmailMessage
+from typing import Optional
+import aiosmtplib
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+MAIL_POOL_SIZE = int(os.environ.get("MAIL_POOL_SIZE", 2))
+MAIL_QUEUE_SIZE = int(os.environ.get("MAIL_QUEUE_SIZE", 1000))
+MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", 3))
+MAIL_RETRY_BACKOFF = float(os.environ.get("MAIL_RETRY_BACKOFF", 2))  # seconds, doubled per attempt
+MAIL_IDLE_TIMEOUT = float(os.environ.get("MAIL_IDLE_TIMEOUT", 30))  # close idle connections after
+MAIL_DRAIN_TIMEOUT = float(os.environ.get("MAIL_DRAIN_TIMEOUT", 10))
+THROUGHPUT_WINDOW = 60  # seconds
+
+
+@dataclass
+class _Delivery:
+    message: EmailMessage
+    future: asyncio.Future
+    attempts: int = 0
+
+
+def _is_permanent(exc: Exception) -> bool:
+    # 5xx replies (unknown mailbox, rejected content, ...) will not succeed on retry.
+    return isinstance(exc, aiosmtplib.SMTPResponseException) and exc.code >= 500
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # Fire-and-forget callers never await their future; failures are logged instead.
+    if not future.cancelled():
+        future.exception()
+
+
+class SMTPDeliveryEngine:
+    """
+    Asynchronous email delivery over a small pool of persistent SMTP connections.
+
+    Messages wait in a bounded queue. Each worker owns one connection, opened on
+    demand and kept across messages until it has been idle for ``idle_timeout``,
+    so sends go back-to-back without a new TCP/EHLO handshake each time. A failed
+    attempt is rescheduled on the event loop with exponential backoff and never
+    holds a worker while it waits.
+    """
+
+    def __init__(
+        self,
+        hostname: Optional[str] = None,
+        port: Optional[int] = None,
+        pool_size: int = MAIL_POOL_SIZE,
+        queue_size: int = MAIL_QUEUE_SIZE,
+        max_attempts: int = MAIL_MAX_ATTEMPTS,
+        backoff: float = MAIL_RETRY_BACKOFF,
+        idle_timeout: float = MAIL_IDLE_TIMEOUT,
+        timeout: float = 30,
+    ):
+        self.hostname = hostname or os.environ.get("EMAIL_HOST", "localhost")
+        self.port = port or int(os.environ.get("EMAIL_PORT", 10251))
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._retries: set[asyncio.Task] = set()
+        self._connections = 0
+        self._in_flight = 0
+        self._counters = {"sent": 0, "failed": 0, "retried": 0, "connections_opened": 0}
+        self._sent_at: deque = deque()
+        self._send_seconds = 0.0
+        self._started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._started_at = time.monotonic()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.pool_size)]
+        logger.info(f"SMTP delivery engine started: {self.pool_size} connections to {self.hostname}:{self.port}")
+
+    async def stop(self, drain_timeout: float = MAIL_DRAIN_TIMEOUT) -> None:
+        """
+        Wait up to ``drain_timeout`` seconds for queued messages and pending
+        retries, then shut the workers and their connections down.
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"SMTP delivery engine stopped with {self.queue_depth} undelivered messages")
+        for task in [*self._retries, *self._workers]:
+            task.cancel()
+        await asyncio.gather(*self._retries, *self._workers, return_exceptions=True)
+        while not self._queue.empty():
+            delivery = self._queue.get_nowait()
+            delivery.future.cancel()
+        self._workers = []
+        self._retries.clear()
+
+    async def _drain(self) -> None:
+        while self._queue.qsize() or self._in_flight or self._retries:
+            await self._queue.join()
+            if self._retries:
+                await asyncio.gather(*self._retries, return_exceptions=True)
+
+    async def enqueue(self, message: EmailMessage) -> asyncio.Future:
+        """
+        Queue a message, waiting for room if the queue is full. The returned
+        future resolves once the message is accepted by the server, or carries
+        the last error once every attempt has failed.
+        """
+        if not self.running:
+            raise RuntimeError("SMTP delivery engine is not running")
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        await self._queue.put(_Delivery(message, future))
+        return future
+
+    async def send(self, message: EmailMessage) -> None:
+        await (await self.enqueue(message))
+
+    @property
+    def queue_depth(self) -> int:
+        return (self._queue.qsize() if self._queue else 0) + len(self._retries)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self._sent_at and now - self._sent_at[0] > THROUGHPUT_WINDOW:
+            self._sent_at.popleft()
+        window = min(THROUGHPUT_WINDOW, now - self._started_at) if self._started_at else 0
+        # Every attempt ends as sent, retried or (finally) failed.
+        attempts = self._counters["sent"] + self._counters["retried"] + self._counters["failed"]
+        return {
+            "running": self.running,
+            "pool_size": self.pool_size,
+            "open_connections": self._connections,
+            "queue_depth": self.queue_depth,
+            "queue_capacity": self.queue_size,
+            "in_flight": self._in_flight,
+            **self._counters,
+            "send_seconds": round(self._send_seconds, 3),
+            "avg_send_ms": round(self._send_seconds * 1000 / attempts, 1) if attempts else 0.0,
+            "throughput_per_sec": round(len(self._sent_at) / window, 2) if window else 0.0,
+        }
+
+    async def _worker(self) -> None:
+        smtp: Optional[aiosmtplib.SMTP] = None
+        try:
+            while True:
+                try:
+                    if smtp is None:
+                        delivery = await self._queue.get()
+                    else:
+                        delivery = await asyncio.wait_for(self._queue.get(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    smtp = await self._disconnect(smtp, quit=True)
+                    continue
+                try:
+                    smtp = await self._deliver(smtp, delivery)
+                finally:
+                    self._queue.task_done()
+        finally:
+            await self._disconnect(smtp, quit=True)
+
+    async def _deliver(self, smtp: Optional[aiosmtplib.SMTP], delivery: _Delivery) -> Optional[aiosmtplib.SMTP]:
+        delivery.attempts += 1
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            if smtp is None or not smtp.is_connected:
+                smtp = await self._disconnect(smtp)
+                client = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, timeout=self.timeout)
+                await client.connect()
+                smtp = client
+                self._connections += 1
+                self._counters["connections_opened"] += 1
+            await smtp.send_message(delivery.message)
+        except (aiosmtplib.SMTPException, OSError) as exc:
+            # The connection state is unknown after an error; start over on a fresh one.
+            smtp = await self._disconnect(smtp)
+            self._failed_attempt(delivery, exc)
+        else:
+            self._counters["sent"] += 1
+            self._sent_at.append(time.monotonic())
+            if not delivery.future.done():
+                delivery.future.set_result(None)
+        finally:
+            self._in_flight -= 1
+            self._send_seconds += time.perf_counter() - started
+        return smtp
+
+    async def _disconnect(self, smtp: Optional[aiosmtplib.SMTP], quit: bool = False) -> None:
+        """Close a pooled connection (politely with QUIT when ``quit``) and return None."""
+        if smtp is None:
+            return None
+        if smtp.is_connected:
+            try:
+                if quit:
+                    await smtp.quit()
+                else:
+                    smtp.close()
+            except (aiosmtplib.SMTPException, OSError):
+                smtp.close()
+        self._connections -= 1
+        return None
+
+    def _failed_attempt(self, delivery: _Delivery, exc: Exception) -> None:
+        to = delivery.message["To"]
+        if _is_permanent(exc) or delivery.attempts >= self.max_attempts:
+            self._counters["failed"] += 1
+            logger.error(f"Giving up on email to {to} after {delivery.attempts} attempt(s): {exc}")
+            if not delivery.future.done():
+                delivery.future.set_exception(exc)
+            return
+        self._counters["retried"] += 1
+        delay = self.backoff * 2 ** (delivery.attempts - 1)
+        logger.warning(f"Email to {to} failed ({exc}); retrying in {delay:.1f}s")
+        task = asyncio.create_task(self._retry_later(delivery, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, delivery: _Delivery, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+            await self._queue.put(delivery)
+        except asyncio.CancelledError:
+            delivery.future.cancel()
+            raise
@@ -0,0 +1,227 @@
+"""
+Transactional email outbox.
+
+Request handlers call :func:`enqueue_email` inside the transaction that makes
+the business change, so an email exists exactly when that change commits.
+A separate dispatcher process claims pending rows in batches, sends them
+through the pooled :class:`~services.mailer.SMTPDeliveryEngine` and records
+the outcome with retry bookkeeping::
+
+    python -m services.outbox [--batch-size 100] [--poll-interval 1] [--once]
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import select, insert, update, delete, or_, and_, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+from db import SessionLocal
+from db.models.outbox import OutboxModel, OutboxStatusEnum
+from services.email import build_message
+from services.mailer import SMTPDeliveryEngine
+from services.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", 1))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_RETRY_BACKOFF = float(os.environ.get("OUTBOX_RETRY_BACKOFF", 30))  # seconds, doubled per attempt
+OUTBOX_LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", 300))  # reclaim rows a dead dispatcher held
+OUTBOX_RETENTION_DAYS = float(os.environ.get("OUTBOX_RETENTION_DAYS", 7))
+
+
+def enqueue_email(session: AsyncSession, subject: str, body: str, to: str) -> OutboxModel:
+    """
+    Add an email to the outbox. Nothing is sent and nothing is committed here:
+    the row becomes visible to the dispatcher when the caller commits.
+    """
+    message = OutboxModel(recipient=to, subject=subject, body=body, status=OutboxStatusEnum.pending, attempts=0)
+    session.add(message)
+    return message
+
+
+async def enqueue_emails(session: AsyncSession, messages: Iterable[dict]) -> int:
+    """
+    Add several emails (dicts with ``subject``, ``body`` and ``to``) in one
+    executemany; the ORM would insert them one row at a time to fetch ids.
+    """
+    rows = [
+        {"recipient": message["to"], "subject": message["subject"], "body": message["body"], "status": OutboxStatusEnum.pending, "attempts": 0}
+        for message in messages
+    ]
+    if rows:
+        await session.execute(insert(OutboxModel), rows)
+    return len(rows)
+
+
+def claim_batch(session: Session, batch_size: int = OUTBOX_BATCH_SIZE, lease_seconds: float = OUTBOX_LEASE_SECONDS) -> list:
+    """
+    Atomically move up to ``batch_size`` due rows to ``sending`` and return them.
+    Rows left in ``sending`` longer than the lease (a crashed dispatcher) are
+    claimable again. Concurrent dispatchers skip each other's locked rows on
+    PostgreSQL; SQLite serializes the claiming UPDATE.
+    """
+    now = datetime.utcnow()
+    claimable = (
+        select(OutboxModel.id)
+        .where(or_(
+            and_(OutboxModel.status == OutboxStatusEnum.pending, OutboxModel.available_at <= now),
+            and_(OutboxModel.status == OutboxStatusEnum.sending, OutboxModel.claimed_at < now - timedelta(seconds=lease_seconds)),
+        ))
+        .order_by(OutboxModel.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = session.execute(
+        update(OutboxModel)
+        .where(OutboxModel.id.in_(claimable.scalar_subquery()))
+        .values(status=OutboxStatusEnum.sending, claimed_at=now, attempts=OutboxModel.attempts + 1)
+        .returning(OutboxModel.id, OutboxModel.recipient, OutboxModel.subject, OutboxModel.body, OutboxModel.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    session.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+def record_results(
+    session: Session,
+    sent_ids: list[int],
+    failures: list[tuple],
+    max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+    backoff: float = OUTBOX_RETRY_BACKOFF,
+) -> None:
+    """
+    Mark ``sent_ids`` as sent, and reschedule each ``(id, attempts, error)`` in
+    ``failures`` with exponential backoff, or mark it failed once it has used
+    ``max_attempts`` attempts.
+    """
+    now = datetime.utcnow()
+    if sent_ids:
+        session.execute(
+            update(OutboxModel)
+            .where(OutboxModel.id.in_(sent_ids))
+            .values(status=OutboxStatusEnum.sent, sent_at=now, last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+    if failures:
+        params = [
+            {
+                "row_id": row_id,
+                "new_status": OutboxStatusEnum.failed if attempts >= max_attempts else OutboxStatusEnum.pending,
+                "retry_at": now + timedelta(seconds=backoff * 2 ** (attempts - 1)),
+                "error": str(error)[:1000],
+            }
+            for row_id, attempts, error in failures
+        ]
+        session.connection().execute(
+            update(OutboxModel.__table__)
+            .where(OutboxModel.__table__.c.id == bindparam("row_id"))
+            .values(status=bindparam("new_status"), available_at=bindparam("retry_at"), last_error=bindparam("error")),
+            params,
+        )
+    session.commit()
+
+
+def purge_sent(session: Session, retention_days: float = OUTBOX_RETENTION_DAYS) -> int:
+    result = session.execute(
+        delete(OutboxModel)
+        .where(OutboxModel.status == OutboxStatusEnum.sent, OutboxModel.sent_at < datetime.utcnow() - timedelta(days=retention_days))
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return result.rowcount
+
+
+class OutboxDispatcher:
+    """
+    Claims outbox rows in batches and delivers them through a pooled SMTP engine.
+    Retries are tracked in the outbox itself, so the engine makes a single attempt
+    per claim and a dispatcher restart loses nothing.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker = SessionLocal,
+        engine: Optional[SMTPDeliveryEngine] = None,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        backoff: float = OUTBOX_RETRY_BACKOFF,
+    ):
+        self.session_factory = session_factory
+        self.engine = engine or SMTPDeliveryEngine(max_attempts=1)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._stop = asyncio.Event()
+
+    def _claim(self) -> list:
+        with self.session_factory() as session:
+            return claim_batch(session, self.batch_size)
+
+    def _record(self, sent_ids: list[int], failures: list[tuple]) -> None:
+        with self.session_factory() as session:
+            record_results(session, sent_ids, failures, self.max_attempts, self.backoff)
+
+    def _purge(self) -> int:
+        with self.session_factory() as session:
+            return purge_sent(session)
+
+    async def dispatch_batch(self) -> int:
+        """
+        Claim, send and record one batch; returns the number of rows claimed.
+        """
+        rows = await asyncio.to_thread(self._claim)
+        if not rows:
+            return 0
+        futures = [await self.engine.enqueue(build_message(row.subject, row.body, row.recipient)) for row in rows]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        sent_ids = [row.id for row, result in zip(rows, results) if not isinstance(result, BaseException)]
+        failures = [(row.id, row.attempts, result) for row, result in zip(rows, results) if isinstance(result, BaseException)]
+        await asyncio.to_thread(self._record, sent_ids, failures)
+        logger.info(f"Outbox batch: {len(sent_ids)} sent, {len(failures)} failed")
+        return len(rows)
+
+    async def run(self, once: bool = False) -> None:
+        self._stop = asyncio.Event()
+        await self.engine.start()
+        try:
+            await asyncio.to_thread(self._purge)
+            while not self._stop.is_set():
+                claimed = await self.dispatch_batch()
+                if once and claimed < self.batch_size:
+                    break
+                if claimed < self.batch_size:
+                    try:
+                        await asyncio.wait_for(self._stop.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            await self.engine.stop()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+outbox_dispatcher = OutboxDispatcher()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Deliver queued emails from the outbox table.")
+    parser.add_argument("--batch-size", type=int, default=OUTBOX_BATCH_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=OUTBOX_POLL_INTERVAL)
+    parser.add_argument("--once", action="store_true", help="Drain the outbox once and exit")
+    args = parser.parse_args(argv)
+    dispatcher = OutboxDispatcher(batch_size=args.batch_size, poll_interval=args.poll_interval)
+    try:
+        asyncio.run(dispatcher.run(once=args.once))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Cache of authenticated principals, so protected requests skip the user lookup.
+
+Entries are keyed by the token subject (the user's email) and hold the fields
+of :class:`~schema.users.LoggedInStaffUser` as a plain dict, so any backend that
+can store JSON can hold them. The default backend is an in-process TTL/LRU map;
+multi-worker deployments can share entries by pointing ``PRINCIPAL_CACHE_BACKEND``
+at a ``module:Class`` implementing :class:`CacheBackend` (e.g. a Redis client
+wrapper).
+
+Entries are invalidated explicitly by the auth flows that change a user and,
+as a safety net, whenever a session commits changes to a ``UserModel``.
+"""
+import importlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Protocol
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from db.models.users import UserModel
+from schema.users import LoggedInStaffUser
+
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", 60))  # seconds; 0 disables the cache
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_BACKEND = os.environ.get("PRINCIPAL_CACHE_BACKEND", "")
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> Optional[dict]: ...
+    def set(self, key: str, value: dict, ttl: float) -> None: ...
+    def delete(self, key: str) -> None: ...
+    def clear(self) -> None: ...
+
+
+class MemoryCacheBackend:
+    """
+    Thread-safe in-process LRU map whose entries expire after their TTL.
+    """
+
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_SIZE, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def load_backend(path: str) -> CacheBackend:
+    module_name, _, class_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class PrincipalCache:
+    def __init__(self, backend: Optional[CacheBackend] = None, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, subject: str) -> Optional[LoggedInStaffUser]:
+        if not self.enabled:
+            return None
+        value = self.backend.get(subject)
+        if value is None:
+            self._counters["misses"] += 1
+            return None
+        self._counters["hits"] += 1
+        return LoggedInStaffUser(**value)
+
+    def set(self, principal: LoggedInStaffUser) -> None:
+        if self.enabled:
+            self.backend.set(principal.email, principal.model_dump(), self.ttl)
+
+    def invalidate(self, subject: str) -> None:
+        self._counters["invalidations"] += 1
+        self.backend.delete(subject)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            "backend": type(self.backend).__name__,
+            "ttl": self.ttl,
+            **self._counters,
+            "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+principal_cache = PrincipalCache(load_backend(PRINCIPAL_CACHE_BACKEND) if PRINCIPAL_CACHE_BACKEND else None)
+
+
+def _cached_subjects(user: UserModel) -> set:
+    # Both the current email and one replaced in this flush may have entries.
+    emails = {user.email, *(inspect(user).attrs.email.history.deleted or ())}
+    return {email for email in emails if email}
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, UserModel):
+            session.info.setdefault("changed_principals", set()).update(_cached_subjects(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for subject in session.info.pop("changed_principals", ()):
+        principal_cache.invalidate(subject)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_principals", None)
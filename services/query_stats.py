@@ -0,0 +1,160 @@
+"""
+Per-request SQL accounting.
+
+Engine events count every statement a request executes and the time spent
+in the database. :class:`QueryStatsMiddleware` reports both in a
+``Server-Timing: db;dur=<ms>;desc="<n> queries"`` header and one structured log
+record per request, and flags statement shapes repeated ``QUERY_REPEAT_THRESHOLD``
+times or more -- the signature of an N+1 loop.
+
+Tests pin a query budget per endpoint with :func:`query_budget` (or the
+``query_budget`` fixture), so a reintroduced N+1 fails the suite.
+"""
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from services.logger import setup_logger
+from services.metrics import route_label
+
+logger = setup_logger(__name__)
+
+QUERY_STATS_ENABLED = os.environ.get("QUERY_STATS_ENABLED", "true").lower() in ("1", "true", "yes")
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", 3))
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s|\$\d+|:\w+|__\[POSTCOMPILE_\w+\])\s*,)+\s*(?:\?|%s|\$\d+|:\w+|__\[POSTCOMPILE_\w+\])\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    """
+    The statement with whitespace collapsed and ``IN`` lists folded, so the
+    same query for different ids has the same shape.
+    """
+    return _PLACEHOLDER_LIST.sub("(?)", _WHITESPACE.sub(" ", statement).strip())
+
+
+class QueryStats:
+    """
+    Statements seen in one scope. Scopes nest: a statement is recorded in
+    the innermost one and every enclosing one, so a test's budget still
+    sees the requests it makes.
+    """
+
+    def __init__(self, parent: Optional["QueryStats"] = None):
+        self.parent = parent
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        shape = statement_shape(statement)
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.seconds += seconds
+            stats.shapes[shape] += 1
+            stats = stats.parent
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> list[tuple[str, int]]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.count} queries"'
+
+
+# The stats object is mutated in place, so statements run in tasks and
+# greenlets spawned by the request are counted too.
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    if current_stats.get() is not None:
+        conn.info.setdefault("query_stats_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    started = conn.info.get("query_stats_started")
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    stats = QueryStats(parent=current_stats.get())
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries: int, repeat_threshold: Optional[int] = QUERY_REPEAT_THRESHOLD) -> Iterator[QueryStats]:
+    """
+    Fail if the block runs more than ``max_queries`` statements, or repeats
+    one statement shape ``repeat_threshold`` times (``None`` allows repeats).
+    """
+    with track_queries() as stats:
+        yield stats
+    shapes = "\n".join(f"  {count}x {shape}" for shape, count in stats.shapes.most_common())
+    assert stats.count <= max_queries, f"{stats.count} queries, budget is {max_queries}:\n{shapes}"
+    if repeat_threshold is not None:
+        assert not stats.repeated(repeat_threshold), f"Repeated statements (N+1?):\n{shapes}"
+
+
+class QueryStatsMiddleware:
+    """
+    Pure ASGI middleware that tracks the statements of each request.
+    Statements run after the response starts (streamed bodies) are logged
+    but cannot be in the header.
+    """
+
+    def __init__(self, app, repeat_threshold: int = QUERY_REPEAT_THRESHOLD):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        with track_queries() as stats:
+            async def send_with_timing(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", stats.server_timing().encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                self.log(scope, status, stats)
+
+    def log(self, scope: dict, status: int, stats: QueryStats) -> None:
+        if not stats.count:
+            return
+        record = {
+            "event": "request_queries",
+            "method": scope["method"],
+            "route": route_label(scope),
+            "status": status,
+            "queries": stats.count,
+            "db_ms": round(stats.seconds * 1000, 2),
+        }
+        repeated = stats.repeated(self.repeat_threshold)
+        if repeated:
+            record["repeated"] = [{"count": count, "statement": shape} for shape, count in repeated]
+            logger.warning("Repeated queries in %s %s", record["method"], record["route"], extra=record)
+        else:
+            logger.info("Queries in %s %s", record["method"], record["route"], extra=record)
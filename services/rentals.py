@@ -0,0 +1,204 @@
+"""
+Rental state transitions for single items and front-desk batches.
+
+Renting and returning are conditional single-statement transitions, so
+concurrent desks never need locks to stay consistent:
+
+- rent: ``UPDATE books SET rental_status='borrowed' WHERE id IN (...) AND
+  rental_status='available' RETURNING id`` -- only the transaction whose
+  update matched the row may insert the rental;
+- return: ``DELETE FROM rentals WHERE (user_id, book_id) IN (...) RETURNING
+  book_id`` -- only the transaction that deleted the rental frees the book.
+
+A unique index on ``rentals.book_id`` backs this up: a book has at most one
+active rental whatever path wrote it, and a violating item is reported as
+unavailable (a 409 for single rentals).
+
+Batches are validated with one ``IN`` query per table, written in one
+transaction and reported item by item: items that cannot be applied are
+skipped with a reason rather than failing the batch. Each patron gets one
+email for the whole batch instead of one per book.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, select, update, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models.books import BookModel, RentalModel, RentalStatusEnum, WishlistModel, wishlist_books
+from db.models.users import UserModel
+from schema.books import RentalRequest
+from services.outbox import enqueue_emails
+
+RENTAL_BATCH_MAX = int(os.environ.get("RENTAL_BATCH_MAX", 100))
+
+
+class RentalConflict(HTTPException):
+    def __init__(self, detail: str = "Book is already rented"):
+        super().__init__(status_code=409, detail=detail)
+
+
+def _due_date(rental_date: datetime) -> datetime:
+    return rental_date + timedelta(days=int(os.environ.get("BOOK_RENTAL_DUE_DAYS", 30)))
+
+
+async def _insert_rentals(session: AsyncSession, accepted: list[dict], rental_date: datetime) -> dict[int, int]:
+    return dict((await session.execute(
+        insert(RentalModel).returning(RentalModel.book_id, RentalModel.id),
+        [{"user_id": result["user"], "book_id": result["book"], "rental_date": rental_date} for result in accepted],
+    )).all())
+
+
+async def rent_books(session: AsyncSession, items: Iterable[RentalRequest]) -> list[dict]:
+    """
+    Rent every available book of the batch to its patron. Returns one result
+    per item with ``status`` ``rented`` (and its ``rental_id``), ``not_found``,
+    ``unavailable`` or ``duplicate``. The caller commits.
+    """
+    items = list(items)
+    users = {
+        row.id: row for row in await session.execute(
+            select(UserModel.id, UserModel.username, UserModel.email).where(UserModel.id.in_({item.user for item in items}))
+        )
+    }
+    first = {}
+    for item in items:
+        if item.user in users:
+            first.setdefault(item.books, item)
+    borrowed = {}
+    if first:
+        borrowed = {
+            row.id: row for row in await session.execute(
+                update(BookModel)
+                .where(BookModel.id.in_(first), BookModel.rental_status == RentalStatusEnum.available)
+                .values(rental_status=RentalStatusEnum.borrowed)
+                .returning(BookModel.id, BookModel.title)
+                .execution_options(synchronize_session=False)
+            )
+        }
+    missed = set(first) - set(borrowed)
+    existing = set((await session.scalars(select(BookModel.id).where(BookModel.id.in_(missed))))) if missed else set()
+
+    results, accepted, seen = [], [], set()
+    for item in items:
+        result = {"user": item.user, "book": item.books}
+        if item.books in seen and item.user in users:
+            result["status"] = "duplicate"
+        elif item.user not in users or (item.books not in borrowed and item.books not in existing):
+            result["status"] = "not_found"
+        elif item.books not in borrowed:
+            result["status"] = "unavailable"
+        else:
+            result["status"] = "rented"
+            accepted.append(result)
+        if item.user in users:
+            seen.add(item.books)
+        results.append(result)
+    if not accepted:
+        return results
+
+    rental_date = datetime.utcnow()
+    try:
+        async with session.begin_nested():
+            rental_ids = await _insert_rentals(session, accepted, rental_date)
+    except IntegrityError:
+        # A rental row without a borrowed book, e.g. written before the status
+        # checks existed; the unique index refuses the second rental. Those
+        # items are unavailable (their books stay borrowed, matching the rental
+        # that holds them) and the rest of the batch goes ahead.
+        held = set(await session.scalars(select(RentalModel.book_id).where(RentalModel.book_id.in_([result["book"] for result in accepted]))))
+        for result in accepted:
+            if result["book"] in held:
+                result["status"] = "unavailable"
+        accepted = [result for result in accepted if result["status"] == "rented"]
+        if not accepted:
+            return results
+        rental_ids = await _insert_rentals(session, accepted, rental_date)
+
+    by_patron = defaultdict(list)
+    for result in accepted:
+        result["rental_id"] = rental_ids[result["book"]]
+        by_patron[result["user"]].append(borrowed[result["book"]])
+    due_date = _due_date(rental_date).strftime('%Y-%m-%d')
+    emails = []
+    for user_id, rented in by_patron.items():
+        user = users[user_id]
+        if len(rented) == 1:
+            subject = f"Book Rental Confirmation: {rented[0].title}"
+            summary = f"You have rented the book '{rented[0].title}' (ID: {rented[0].id}) on {rental_date.strftime('%Y-%m-%d')}.\n"
+        else:
+            subject = f"Book Rental Confirmation: {len(rented)} books"
+            summary = f"You have rented the following books on {rental_date.strftime('%Y-%m-%d')}:\n" + "".join(
+                f"- '{book.title}' (ID: {book.id})\n" for book in rented
+            )
+        body = f"Dear {user.username},\n\n{summary}Your due date is {due_date}.\n\nHappy reading!"
+        emails.append({"subject": subject, "body": body, "to": str(user.email)})
+    await enqueue_emails(session, emails)
+    return results
+
+
+async def return_books(session: AsyncSession, items: Iterable[RentalRequest]) -> list[dict]:
+    """
+    Close the rentals of the batch and mark their books available. Returns
+    one result per item with ``status`` ``returned``, ``not_found`` or
+    ``duplicate``. Patrons who wishlisted any of the returned books get one
+    email listing all of them. The caller commits.
+    """
+    items = list(items)
+    returned = {tuple(row) for row in await session.execute(
+        delete(RentalModel)
+        .where(tuple_(RentalModel.user_id, RentalModel.book_id).in_({(item.user, item.books) for item in items}))
+        .returning(RentalModel.user_id, RentalModel.book_id)
+        .execution_options(synchronize_session=False)
+    )}
+    results, seen = [], set()
+    for item in items:
+        key = (item.user, item.books)
+        if key not in returned:
+            status = "not_found"
+        elif key in seen:
+            status = "duplicate"
+        else:
+            status = "returned"
+        seen.add(key)
+        results.append({"user": item.user, "book": item.books, "status": status})
+    if not returned:
+        return results
+
+    book_ids = {book_id for _, book_id in returned}
+    await session.execute(
+        update(BookModel)
+        .where(BookModel.id.in_(book_ids), BookModel.rental_status == RentalStatusEnum.borrowed)
+        .values(rental_status=RentalStatusEnum.available)
+        .execution_options(synchronize_session=False)
+    )
+    await notify_waiting_users(session, book_ids)
+    return results
+
+
+async def notify_waiting_users(session: AsyncSession, book_ids: Iterable[int]) -> None:
+    """
+    Queue one email per user who wishlisted any of ``book_ids``, listing the
+    ones that became available.
+    """
+    waiting, emails = defaultdict(list), []
+    for email, title in await session.execute(
+        select(UserModel.email, BookModel.title)
+        .join(WishlistModel, WishlistModel.user_id == UserModel.id)
+        .join(wishlist_books, wishlist_books.c.wishlist_id == WishlistModel.id)
+        .join(BookModel, BookModel.id == wishlist_books.c.book_id)
+        .where(BookModel.id.in_(set(book_ids)))
+        .order_by(UserModel.email, BookModel.id)
+    ):
+        waiting[email].append(title)
+    for email, titles in waiting.items():
+        if len(titles) == 1:
+            subject = f"Book '{titles[0]}' is now available"
+            body = f"The book '{titles[0]}' is now available for rental. You can rent it from the library."
+        else:
+            subject = f"{len(titles)} books on your wishlist are now available"
+            body = "The following books are now available for rental:\n" + "".join(f"- '{title}'\n" for title in titles) + "You can rent them from the library."
+        emails.append({"subject": subject, "body": body, "to": email})
+    await enqueue_emails(session, emails)
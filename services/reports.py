@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from typing import Iterable, Iterator, Optional
+from sqlalchemy import Select, select, func, case, cast, Date, Integer, literal
+from db.models.books import BookModel, RentalModel
+from db.models.users import UserModel
+
+REPORT_FIELDS = ["book_id", "title", "rental_status", "rentee", "rented_on", "due_date", "past_due_days"]
+
+
+def _due_date_columns(dialect: str, due_days: int):
+    """
+    Return ``(rented_on, due_date, is_overdue, past_due_days)`` SQL expressions
+    for the rental period, computed by the database in UTC.
+    """
+    rental_date = RentalModel.rental_date
+    if dialect == "postgresql":
+        now = func.timezone("utc", func.now())
+        due_at = rental_date + timedelta(days=due_days)
+        rented_on = cast(rental_date, Date)
+        due_date = cast(due_at, Date)
+        overdue_days = cast(func.date_part("day", now - due_at), Integer)
+        is_overdue = now > due_at
+    else:
+        modifier = f"+{due_days} days"
+        now = func.julianday(literal("now"))
+        due_at = func.julianday(rental_date, modifier)
+        rented_on = func.date(rental_date)
+        due_date = func.date(rental_date, modifier)
+        overdue_days = cast(now - due_at, Integer)
+        is_overdue = now > due_at
+    past_due_days = case(
+        (RentalModel.id.is_(None), None),
+        (is_overdue, overdue_days),
+        else_=0,
+    )
+    return rented_on, due_date, is_overdue, past_due_days
+
+
+def rental_report_statement(
+    dialect: str,
+    due_days: int,
+    overdue_only: bool = False,
+    user_id: Optional[int] = None,
+    username: Optional[str] = None,
+    language: Optional[str] = None,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Select:
+    """
+    One LEFT JOIN over books, rentals and users producing a report row per book,
+    keyset-ordered on ``books.id``. Filtering by user or overdue status drops
+    books that are not currently rented.
+    """
+    rented_on, due_date, is_overdue, past_due_days = _due_date_columns(dialect, due_days)
+    stmt = (
+        select(
+            BookModel.id.label("book_id"),
+            BookModel.title,
+            BookModel.rental_status,
+            UserModel.username.label("rentee"),
+            rented_on.label("rented_on"),
+            due_date.label("due_date"),
+            past_due_days.label("past_due_days"),
+        )
+        .select_from(BookModel)
+        .outerjoin(RentalModel, RentalModel.book_id == BookModel.id)
+        .outerjoin(UserModel, UserModel.id == RentalModel.user_id)
+    )
+    if overdue_only:
+        stmt = stmt.where(is_overdue)
+    if user_id is not None:
+        stmt = stmt.where(RentalModel.user_id == user_id)
+    if username:
+        stmt = stmt.where(UserModel.username == username)
+    if language:
+        stmt = stmt.where(BookModel.language == language)
+    if after is not None:
+        stmt = stmt.where(BookModel.id > after)
+    stmt = stmt.order_by(BookModel.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def report_row(row) -> dict:
+    item = dict(row._mapping)
+    item["rental_status"] = getattr(item["rental_status"], "value", item["rental_status"])
+    for key in ("rented_on", "due_date"):
+        if item[key] is not None:
+            item[key] = str(item[key])
+    return item
+
+
+def iter_ndjson(rows: Iterable) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(report_row(row)) + "\n"
+
+
+def iter_csv(rows: Iterable, header: bool = True) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+    if header:
+        writer.writeheader()
+        yield _drain(buffer)
+    for row in rows:
+        writer.writerow(report_row(row))
+        yield _drain(buffer)
+
+
+def _drain(buffer: io.StringIO) -> str:
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
@@ -0,0 +1,122 @@
+import re
+from typing import Optional
+from sqlalchemy import Select, select, func, table, column, literal_column, tuple_
+from db.models.books import BookModel
+from db.fts import FTS_TABLE, PG_SEARCH_COLUMN
+
+# Mirrors the unicode61 tokenizer: letters and digits, everything else separates.
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+FULL_TEXT_DIALECTS = ("sqlite", "postgresql")
+
+books_fts = table(FTS_TABLE, column("rowid"))
+
+
+def tokenize(value: Optional[str]) -> list[str]:
+    return _TOKEN_RE.findall(value.lower()) if value else []
+
+
+def filter_key(dialect: str, value: Optional[str]) -> Optional[str]:
+    """
+    What :func:`search_books_statement` filters on for ``value``: its tokens
+    when the full-text index applies, else the raw substring. Equal keys run
+    the same query.
+    """
+    if not value:
+        return None
+    tokens = tokenize(value)
+    if dialect in FULL_TEXT_DIALECTS and tokens:
+        return "words:" + " ".join(tokens)
+    return "substring:" + value
+
+
+def fts5_match_expression(author: Optional[str] = None, title: Optional[str] = None) -> Optional[str]:
+    """
+    Build an FTS5 MATCH expression where every token of a filter must prefix-match
+    a word of its own column, e.g. ``authors : ("suz"*) AND title : ("hung"* "gam"*)``.
+    """
+    clauses = []
+    for column_name, value in (("authors", author), ("title", title)):
+        tokens = tokenize(value)
+        if tokens:
+            terms = " ".join(f'"{token}"*' for token in tokens)
+            clauses.append(f"{column_name} : ({terms})")
+    return " AND ".join(clauses) or None
+
+
+def tsquery_expression(author: Optional[str] = None, title: Optional[str] = None) -> Optional[str]:
+    """
+    PostgreSQL counterpart of :func:`fts5_match_expression`; title lexemes carry
+    weight ``A`` and authors ``B`` in ``books.search_vector``.
+    """
+    terms = [f"'{token}':*B" for token in tokenize(author)]
+    terms += [f"'{token}':*A" for token in tokenize(title)]
+    return " & ".join(terms) or None
+
+
+def search_books_statement(
+    dialect: str,
+    author: Optional[str] = None,
+    title: Optional[str] = None,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Select:
+    """
+    Select books whose authors/title match the given filters, best match first.
+
+    Each filter matches words starting with every term it contains, on its own
+    column. A filter without any word characters falls back to the substring
+    match the endpoint has always used.
+
+    Results are keyset-ordered on ``(rank, books.id)`` (``books.id`` alone when
+    no full-text filter applies). ``after`` is the id of the last book of the
+    previous page; the seek resumes from that book's rank for the same query,
+    so no page ever needs an OFFSET.
+    """
+    full_text = dialect in FULL_TEXT_DIALECTS
+    stmt = select(BookModel)
+    # Backends without an index (and filters without words) keep the substring match.
+    if author and not (full_text and tokenize(author)):
+        stmt = stmt.where(BookModel.authors.ilike(f"%{author}%"))
+    if title and not (full_text and tokenize(title)):
+        stmt = stmt.where(BookModel.title.ilike(f"%{title}%"))
+
+    rank = after_rank = None
+    if dialect == "sqlite":
+        match = fts5_match_expression(author, title)
+        if match:
+            matches = literal_column(FTS_TABLE).op("MATCH")(match)
+            rank = func.bm25(literal_column(FTS_TABLE))
+            stmt = stmt.join(books_fts, books_fts.c.rowid == BookModel.id).where(matches)
+            after_rank = (
+                select(rank).select_from(books_fts)
+                .where(matches, books_fts.c.rowid == after)
+                .correlate(None).scalar_subquery()
+            )
+    elif dialect == "postgresql":
+        query = tsquery_expression(author, title)
+        if query:
+            tsquery = func.to_tsquery("simple", query)
+            search_vector = literal_column(f"books.{PG_SEARCH_COLUMN}")
+            # ts_rank grows with relevance; negate it so every keyset sorts ascending.
+            rank = -func.ts_rank(search_vector, tsquery)
+            stmt = stmt.where(search_vector.op("@@")(tsquery))
+            after_book = BookModel.__table__.alias("after_book")
+            after_vector = literal_column(f"after_book.{PG_SEARCH_COLUMN}")
+            after_rank = (
+                select(-func.ts_rank(after_vector, tsquery))
+                .where(after_book.c.id == after)
+                .correlate(None).scalar_subquery()
+            )
+
+    if rank is None:
+        if after is not None:
+            stmt = stmt.where(BookModel.id > after)
+        stmt = stmt.order_by(BookModel.id)
+    else:
+        if after is not None:
+            stmt = stmt.where(tuple_(rank, BookModel.id) > tuple_(after_rank, after))
+        stmt = stmt.order_by(rank, BookModel.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
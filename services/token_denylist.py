@@ -0,0 +1,62 @@
+"""
+Denylist of revoked refresh tokens.
+
+The ``revoked_tokens`` table is the source of truth: revoking inserts the
+token's ``jti`` with ON CONFLICT DO NOTHING, so the insert itself tells
+whether the token had already been used, atomically across workers. Each
+worker also keeps the ids it has seen revoked in memory until they expire,
+so replays of a known token are rejected with a set lookup and no query.
+Expired rows are purged periodically; past its ``exp`` a token fails
+signature validation anyway.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.dialects import dialect_insert
+from db.models.tokens import RevokedTokenModel
+
+DENYLIST_PURGE_INTERVAL = float(os.environ.get("DENYLIST_PURGE_INTERVAL", 3600))  # seconds
+
+
+class TokenDenylist:
+    def __init__(self, purge_interval: float = DENYLIST_PURGE_INTERVAL):
+        self.purge_interval = purge_interval
+        self._revoked: dict[str, float] = {}  # jti -> exp (epoch seconds)
+        self._purged_at = time.time()
+
+    def is_revoked(self, jti: str) -> bool:
+        exp = self._revoked.get(jti)
+        return exp is not None and exp > time.time()
+
+    def _remember(self, jti: str, exp: float) -> None:
+        self._revoked[jti] = exp
+
+    async def revoke(self, session: AsyncSession, jti: str, exp: float) -> bool:
+        """
+        Record ``jti`` as revoked. Returns False when it already was, i.e. the
+        token is being reused. The caller commits.
+        """
+        self._remember(jti, exp)
+        stmt = dialect_insert(session.bind.dialect.name, RevokedTokenModel.__table__).values(
+            jti=jti, expires_at=datetime.fromtimestamp(exp, timezone.utc).replace(tzinfo=None)
+        ).on_conflict_do_nothing(index_elements=["jti"])
+        inserted = (await session.execute(stmt)).rowcount == 1
+        if time.time() - self._purged_at >= self.purge_interval:
+            await self.purge(session)
+        return inserted
+
+    async def purge(self, session: AsyncSession) -> None:
+        now = time.time()
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        await session.execute(
+            delete(RevokedTokenModel).where(RevokedTokenModel.expires_at < datetime.utcnow()).execution_options(synchronize_session=False)
+        )
+        self._purged_at = now
+
+    def stats(self) -> dict:
+        return {"revoked_in_memory": len(self._revoked)}
+
+
+token_denylist = TokenDenylist()
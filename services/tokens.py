@@ -0,0 +1,191 @@
+"""
+Access-token verification with a cache of verified claims.
+
+Clients reuse one access token for every request until it expires, so the
+verified claims are cached under the SHA-256 digest of the token until the
+token's own ``exp``; a cache hit skips the HMAC check and JSON parsing. Only
+successfully verified tokens are cached.
+
+The JWT library is pluggable: ``JWT_BACKEND`` is ``jose`` (python-jose, the
+default), ``pyjwt`` (PyJWT, if installed) or a ``module:Class`` with a
+``decode(token, key, algorithms)`` method. Compare them with::
+
+    python -m services.tokens [--iterations 20000]
+"""
+import argparse
+import hashlib
+import importlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Protocol
+from fastapi import HTTPException
+from pydantic import ValidationError
+from schema.auth import TokenPayload
+
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))  # 0 disables the cache
+JWT_BACKEND = os.environ.get("JWT_BACKEND", "jose")
+
+
+class JWTBackend(Protocol):
+    def decode(self, token: str, key: str, algorithms: list[str]) -> dict: ...
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class JoseBackend:
+    def __init__(self):
+        from jose import jwt
+        from jose.exceptions import JWTError
+        self._jwt, self._error = jwt, JWTError
+
+    def decode(self, token: str, key: str, algorithms: list[str]) -> dict:
+        try:
+            return self._jwt.decode(token, key, algorithms=algorithms)
+        except self._error as exc:
+            raise InvalidToken(str(exc)) from exc
+
+
+class PyJWTBackend:
+    def __init__(self):
+        import jwt  # PyJWT, optional
+        self._jwt = jwt
+
+    def decode(self, token: str, key: str, algorithms: list[str]) -> dict:
+        try:
+            return self._jwt.decode(token, key, algorithms=algorithms)
+        except self._jwt.PyJWTError as exc:
+            raise InvalidToken(str(exc)) from exc
+
+
+BACKENDS = {"jose": JoseBackend, "pyjwt": PyJWTBackend}
+
+
+def load_backend(name: str) -> JWTBackend:
+    if name in BACKENDS:
+        return BACKENDS[name]()
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class TokenVerifier:
+    """
+    Verifies bearer tokens for one key, caching the claims of valid ones.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        algorithms: list[str],
+        backend: Optional[JWTBackend] = None,
+        maxsize: int = TOKEN_CACHE_SIZE,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.key = key
+        self.algorithms = algorithms
+        self.backend = backend if backend is not None else load_backend(JWT_BACKEND)
+        self.maxsize = maxsize
+        self.clock = clock
+        self._cache: OrderedDict = OrderedDict()  # digest -> TokenPayload
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "failures": 0}
+        self._decode_seconds = 0.0
+        self._verify_seconds = 0.0
+
+    def _cached(self, digest: bytes) -> Optional[TokenPayload]:
+        with self._lock:
+            payload = self._cache.get(digest)
+            if payload is None:
+                return None
+            if payload.exp <= self.clock():
+                del self._cache[digest]
+                return None
+            self._cache.move_to_end(digest)
+            return payload
+
+    def _store(self, digest: bytes, payload: TokenPayload) -> None:
+        with self._lock:
+            self._cache[digest] = payload
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def verify(self, token: str) -> TokenPayload:
+        """
+        Return the token's claims, or raise 403 (bad or expired signature)
+        or 401 (expired claims).
+        """
+        started = time.perf_counter()
+        try:
+            digest = hashlib.sha256(token.encode()).digest()
+            payload = self._cached(digest) if self.maxsize else None
+            if payload is not None:
+                self._counters["hits"] += 1
+                return payload
+            self._counters["misses"] += 1
+            decode_started = time.perf_counter()
+            try:
+                payload = TokenPayload(**self.backend.decode(token, self.key, self.algorithms))
+            except (InvalidToken, ValidationError):
+                self._counters["failures"] += 1
+                raise HTTPException(
+                    status_code=403,
+                    detail="Could not validate credentials",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            finally:
+                self._decode_seconds += time.perf_counter() - decode_started
+            if payload.exp < self.clock():
+                raise HTTPException(
+                    status_code=401,
+                    detail="Token expired",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            if self.maxsize:
+                self._store(digest, payload)
+            return payload
+        finally:
+            self._verify_seconds += time.perf_counter() - started
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        calls = self._counters["hits"] + self._counters["misses"]
+        return {
+            "backend": type(self.backend).__name__,
+            "cached": len(self._cache),
+            **self._counters,
+            "hit_rate": round(self._counters["hits"] / calls, 4) if calls else 0.0,
+            "avg_verify_us": round(self._verify_seconds * 1e6 / calls, 1) if calls else 0.0,
+            "avg_decode_us": round(self._decode_seconds * 1e6 / self._counters["misses"], 1) if self._counters["misses"] else 0.0,
+        }
+
+
+def main(argv=None) -> None:
+    from services.auth import create_access_token, JWT_SECRET_KEY, JWT_ALGORITHM
+    parser = argparse.ArgumentParser(description="Compare access-token verification throughput.")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    args = parser.parse_args(argv)
+    token = create_access_token("bench@example.com")
+    for name in args.backends:
+        try:
+            backend = load_backend(name)
+        except ImportError as exc:
+            print(f"{name:>10}: not installed ({exc})")
+            continue
+        for maxsize, label in ((0, "uncached"), (TOKEN_CACHE_SIZE, "cached")):
+            verifier = TokenVerifier(JWT_SECRET_KEY, [JWT_ALGORITHM], backend=backend, maxsize=maxsize)
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                verifier.verify(token)
+            seconds = time.perf_counter() - started
+            print(f"{name:>10} {label:>9}: {args.iterations / seconds:>10.0f} verifications/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Opt-in capture of production traffic for replay.
+
+With ``TRAFFIC_CAPTURE=true``, :class:`TrafficCaptureMiddleware` writes one
+JSON line per request (a sampled ``TRAFFIC_CAPTURE_SAMPLE`` fraction) to a
+rotating file: method, path, route, query, a digest of the body, status and
+server time. Credentials are never kept:
+
+- the ``Authorization`` header is reduced to whether it was present;
+- query parameters and JSON/form fields named like credentials (``password``,
+  ``token``, ...) are replaced by ``"REDACTED"``;
+- JSON and form bodies are digested after that redaction, so the digest
+  cannot be brute-forced back to a password; other bodies (file uploads) are
+  digested as sent;
+- bodies themselves are only kept with ``TRAFFIC_CAPTURE_BODIES=true``, for
+  JSON and form requests up to ``TRAFFIC_CAPTURE_MAX_BODY`` bytes, and
+  redacted the same way.
+
+Other personal data is not redacted: emails, usernames and ids in paths and
+queries (``?username=`` on the rental report) are kept as sent, and so are
+those in bodies when bodies are captured. Treat capture files as personal
+data.
+
+``python -m bench.replay`` re-issues a capture against another instance.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlencode
+from services.logger import LOG_DIR, queue_handler
+from services.metrics import route_label
+
+TRAFFIC_CAPTURE = os.environ.get("TRAFFIC_CAPTURE", "false").lower() in ("1", "true", "yes")
+TRAFFIC_CAPTURE_PATH = os.environ.get("TRAFFIC_CAPTURE_PATH", os.path.join(LOG_DIR, "traffic.jsonl"))
+TRAFFIC_CAPTURE_MAX_BYTES = int(os.environ.get("TRAFFIC_CAPTURE_MAX_BYTES", 50_000_000))
+TRAFFIC_CAPTURE_BACKUPS = int(os.environ.get("TRAFFIC_CAPTURE_BACKUPS", 5))
+TRAFFIC_CAPTURE_SAMPLE = float(os.environ.get("TRAFFIC_CAPTURE_SAMPLE", 1.0))
+TRAFFIC_CAPTURE_BODIES = os.environ.get("TRAFFIC_CAPTURE_BODIES", "false").lower() in ("1", "true", "yes")
+TRAFFIC_CAPTURE_MAX_BODY = int(os.environ.get("TRAFFIC_CAPTURE_MAX_BODY", 65536))
+
+REDACTED = "REDACTED"
+SENSITIVE_NAMES = ("password", "token", "secret", "authorization", "api_key")
+TEXT_BODY_TYPES = ("application/json", "application/x-www-form-urlencoded")
+
+
+def is_sensitive(name: str) -> bool:
+    name = name.lower()
+    return any(word in name for word in SENSITIVE_NAMES)
+
+
+def redact_query(query: str) -> str:
+    return urlencode([(name, REDACTED if is_sensitive(name) else value) for name, value in parse_qsl(query, keep_blank_values=True)])
+
+
+def redact_json(value):
+    if isinstance(value, dict):
+        return {key: REDACTED if is_sensitive(key) else redact_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact_json(item) for item in value]
+    return value
+
+
+def redact_body(body: bytes, content_type: str) -> Optional[str]:
+    """
+    The body with credentials redacted, or None if it cannot be kept.
+    """
+    try:
+        if content_type.startswith("application/json"):
+            return json.dumps(redact_json(json.loads(body)))
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            return redact_query(body.decode())
+    except (ValueError, UnicodeDecodeError):
+        pass
+    return None
+
+
+def capture_logger(path: str = TRAFFIC_CAPTURE_PATH, max_bytes: int = TRAFFIC_CAPTURE_MAX_BYTES, backups: int = TRAFFIC_CAPTURE_BACKUPS) -> logging.Logger:
+    logger = logging.getLogger(f"traffic_capture.{path}")
+    if not logger.handlers:
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(queue_handler(handler))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+class TrafficCaptureMiddleware:
+    """
+    Pure ASGI middleware; bodies are digested or buffered as the app reads
+    them.
+    """
+
+    def __init__(
+        self,
+        app,
+        logger: Optional[logging.Logger] = None,
+        sample: float = TRAFFIC_CAPTURE_SAMPLE,
+        bodies: bool = TRAFFIC_CAPTURE_BODIES,
+        max_body: int = TRAFFIC_CAPTURE_MAX_BODY,
+        exclude: Iterable[str] = ("/api/v1/metrics", "/api/v1/health"),
+    ):
+        self.app = app
+        self.logger = logger or capture_logger()
+        self.sample = sample
+        self.bodies = bodies
+        self.max_body = max_body
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude or random.random() >= self.sample:
+            await self.app(scope, receive, send)
+            return
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        content_type = headers.get("content-type", "")
+        # JSON and form bodies may carry credentials: they are buffered (up to
+        # max_body) and digested once redacted, never as sent.
+        redactable = content_type.startswith(TEXT_BODY_TYPES)
+        digest, size, chunks = hashlib.sha256(), 0, []
+        status = 500
+
+        async def receive_and_digest():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                size += len(body)
+                if not redactable:
+                    digest.update(body)
+                elif size <= self.max_body:
+                    chunks.append(body)
+            return message
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        timestamp, started = time.time(), time.perf_counter()
+        try:
+            await self.app(scope, receive_and_digest, send_with_status)
+        finally:
+            record = {
+                "ts": round(timestamp, 6),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route_label(scope),
+                "query": redact_query(scope["query_string"].decode("latin-1")),
+                "content_type": content_type or None,
+                "auth": "authorization" in headers,
+                "body_bytes": size,
+                "body_sha256": None,
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+            if size and not redactable:
+                record["body_sha256"] = digest.hexdigest()
+            elif size and size <= self.max_body:
+                body = redact_body(b"".join(chunks), content_type)
+                if body is not None:
+                    record["body_sha256"] = hashlib.sha256(body.encode()).hexdigest()
+                if self.bodies:
+                    record["body"] = body
+            self.logger.info(json.dumps(record))
+
+
+def read_capture(paths: Iterable[str]) -> list[dict]:
+    """
+    Records from capture files (rotated ones included), in request order.
+    """
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return sorted(records, key=lambda record: record["ts"])
@@ -0,0 +1,60 @@
+"""
+Wishlist operations as set operations on the ``wishlist_books`` association
+table. Nothing here loads ``WishlistModel.books``: membership is checked,
+added and removed with one statement each, whatever the wishlist's size.
+"""
+from typing import Iterable, Optional
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.dialects import dialect_insert
+from db.models.books import BookModel, WishlistModel, wishlist_books
+
+
+async def wishlist_id(session: AsyncSession, user_id: int, create: bool = False) -> Optional[int]:
+    """
+    The id of the user's wishlist, created (flushed, not committed) when
+    ``create`` is set and the user has none yet.
+    """
+    found = await session.scalar(select(WishlistModel.id).where(WishlistModel.user_id == user_id).limit(1))
+    if found is None and create:
+        found = (await session.execute(insert(WishlistModel).values(user_id=user_id).returning(WishlistModel.id))).scalar_one()
+    return found
+
+
+async def wishlist_book_ids(session: AsyncSession, wishlist: int) -> list[int]:
+    stmt = select(wishlist_books.c.book_id).where(wishlist_books.c.wishlist_id == wishlist).order_by(wishlist_books.c.book_id)
+    return list((await session.scalars(stmt)).all())
+
+
+async def existing_book_ids(session: AsyncSession, book_ids: Iterable[int]) -> set[int]:
+    return set((await session.scalars(select(BookModel.id).where(BookModel.id.in_(set(book_ids))))).all())
+
+
+async def add_books(session: AsyncSession, wishlist: int, book_ids: Iterable[int]) -> int:
+    """
+    Add books to a wishlist, ignoring ones already on it. Returns how many
+    were added; the caller commits.
+    """
+    book_ids = set(book_ids)
+    present = set((await session.scalars(
+        select(wishlist_books.c.book_id).where(wishlist_books.c.wishlist_id == wishlist, wishlist_books.c.book_id.in_(book_ids))
+    )).all())
+    new = sorted(book_ids - present)
+    if new:
+        # ON CONFLICT keeps a concurrent add of the same book from failing the request.
+        stmt = dialect_insert(session.bind.dialect.name, wishlist_books).on_conflict_do_nothing(index_elements=["wishlist_id", "book_id"])
+        await session.execute(stmt, [{"wishlist_id": wishlist, "book_id": book_id} for book_id in new])
+    return len(new)
+
+
+async def remove_books(session: AsyncSession, wishlist: int, book_ids: Iterable[int]) -> list[int]:
+    """
+    Remove books from a wishlist. Returns the ids that were on it; the
+    caller commits.
+    """
+    stmt = (
+        delete(wishlist_books)
+        .where(wishlist_books.c.wishlist_id == wishlist, wishlist_books.c.book_id.in_(set(book_ids)))
+        .returning(wishlist_books.c.book_id)
+    )
+    return sorted((await session.scalars(stmt)).all())
@@ -147,3 +147,181 @@ def test_rental_report_with_username(client, staff_auth_headers):
     response = client.get("/api/v1/admin/rental/report?username=2", headers=staff_auth_headers)
     assert response.status_code == 200
     assert "Rental report for user" in response.text or "report" in response.json()
+
+
+@pytest.fixture
+def staff_db_client(db_client):
+    from services.auth import get_current_staff_user
+    from schema.users import LoggedInStaffUser
+    app.dependency_overrides[get_current_staff_user] = lambda: LoggedInStaffUser(
+        id=1, username="staffuser", email="staff@example.com", is_active=True, is_staff=True
+    )
+    return db_client
+
+
+def test_rental_report_streams_csv(staff_db_client, db_engine):
+    from sqlalchemy import insert
+    from db.models.books import BookModel
+    with db_engine.begin() as connection:
+        connection.execute(insert(BookModel), [
+            {"isbn": str(n), "authors": "A", "publication_year": 2000, "title": f"Book {n}", "language": "eng", "rental_status": "available"}
+            for n in range(3)
+        ])
+    response = staff_db_client.get("/api/v1/admin/rental/report?format=csv")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert len(response.text.splitlines()) == 4
+
+
+def test_rental_report_pagination(staff_db_client, db_engine):
+    from sqlalchemy import insert
+    from db.models.books import BookModel
+    with db_engine.begin() as connection:
+        connection.execute(insert(BookModel), [
+            {"isbn": str(n), "authors": "A", "publication_year": 2000, "title": f"Book {n}", "language": "eng", "rental_status": "available"}
+            for n in range(3)
+        ])
+    response = staff_db_client.get("/api/v1/admin/rental/report?limit=2")
+    assert [row["book_id"] for row in response.json()["report"]] == [1, 2]
+    response = staff_db_client.get(response.links["next"]["url"])
+    assert [row["book_id"] for row in response.json()["report"]] == [3]
+
+
+def test_rent_book_queues_confirmation_in_outbox(staff_db_client, db_engine):
+    from sqlalchemy import insert, select
+    from db.models.books import BookModel
+    from db.models.users import UserModel
+    from db.models.outbox import OutboxModel
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel).values(id=2, username="reader", email="reader@example.com", password="x", is_active=True))
+        connection.execute(insert(BookModel).values(id=1, isbn="1", authors="A", publication_year=2000, title="Queued", language="eng", rental_status="available"))
+    response = staff_db_client.post("/api/v1/admin/rental", json={"user": 2, "books": 1})
+    assert response.status_code == 200
+    with db_engine.connect() as connection:
+        outbox = connection.execute(select(OutboxModel.recipient, OutboxModel.subject, OutboxModel.status)).all()
+    assert outbox == [("reader@example.com", "Book Rental Confirmation: Queued", "pending")]
+
+
+def test_return_rental_notifies_wishlisted_users(staff_db_client, db_engine):
+    from sqlalchemy import insert, select
+    from db.models.books import BookModel, RentalModel, WishlistModel, wishlist_books
+    from db.models.users import UserModel
+    from db.models.outbox import OutboxModel
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel), [
+            {"id": 2, "username": "reader", "email": "reader@example.com", "password": "x", "is_active": True},
+            {"id": 3, "username": "waiter", "email": "waiter@example.com", "password": "x", "is_active": True},
+        ])
+        connection.execute(insert(BookModel).values(id=1, isbn="1", authors="A", publication_year=2000, title="Returned", language="eng", rental_status="borrowed"))
+        connection.execute(insert(RentalModel).values(user_id=2, book_id=1))
+        connection.execute(insert(WishlistModel).values(id=1, user_id=3))
+        connection.execute(insert(wishlist_books).values(wishlist_id=1, book_id=1))
+    response = staff_db_client.post("/api/v1/admin/rental/return", json={"user": 2, "books": 1})
+    assert response.status_code == 200
+    with db_engine.connect() as connection:
+        assert connection.execute(select(RentalModel)).all() == []
+        assert connection.execute(select(BookModel.rental_status)).scalar() == "available"
+        assert connection.execute(select(OutboxModel.recipient)).scalars().all() == ["waiter@example.com"]
+
+
+def test_bulk_upload_reports_rejected_rows(staff_db_client):
+    csv_content = "ISBN,Authors,Publication Year,Title,Language\n1,A,2000,Good,eng\n2,B,,Missing year,eng\n"
+    response = staff_db_client.post(
+        "/api/v1/admin/books/bulk-create?batch_size=1",
+        files={"file": ("books.csv", csv_content, "text/csv")},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["rows"], body["created"], body["error_count"]) == (2, 1, 1)
+    assert body["errors"][0]["line"] == 3
+    assert "rows_per_second" in body
+
+
+def test_rental_batches_coalesce_emails(staff_db_client, db_engine):
+    from sqlalchemy import insert, select
+    from db.models.books import BookModel, RentalModel, WishlistModel, wishlist_books
+    from db.models.users import UserModel
+    from db.models.outbox import OutboxModel
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel), [
+            {"id": 2, "username": "reader", "email": "reader@example.com", "password": "x", "is_active": True},
+            {"id": 3, "username": "waiter", "email": "waiter@example.com", "password": "x", "is_active": True},
+        ])
+        connection.execute(insert(BookModel), [
+            {"id": n, "isbn": str(n), "authors": "A", "publication_year": 2000, "title": f"Book {n}", "language": "eng", "rental_status": "available"}
+            for n in range(1, 4)
+        ])
+        connection.execute(insert(WishlistModel).values(id=1, user_id=3))
+        connection.execute(insert(wishlist_books), [{"wishlist_id": 1, "book_id": 1}, {"wishlist_id": 1, "book_id": 2}])
+
+    batch = [{"user": 2, "books": 1}, {"user": 2, "books": 2}, {"user": 2, "books": 2}, {"user": 2, "books": 99}]
+    response = staff_db_client.post("/api/v1/admin/rental/batch", json=batch)
+    assert response.status_code == 200
+    assert response.json()["rented"] == 2
+    assert [result["status"] for result in response.json()["results"]] == ["rented", "rented", "duplicate", "not_found"]
+    response = staff_db_client.post("/api/v1/admin/rental/batch", json=[{"user": 3, "books": 1}, {"user": 3, "books": 3}])
+    assert [result["status"] for result in response.json()["results"]] == ["unavailable", "rented"]
+
+    response = staff_db_client.post("/api/v1/admin/rental/return/batch", json=[{"user": 2, "books": 1}, {"user": 2, "books": 2}, {"user": 3, "books": 2}])
+    assert [result["status"] for result in response.json()["results"]] == ["returned", "returned", "not_found"]
+    with db_engine.connect() as connection:
+        assert connection.execute(select(RentalModel.book_id)).scalars().all() == [3]
+        assert connection.execute(select(BookModel.rental_status).order_by(BookModel.id)).scalars().all() == ["available", "available", "borrowed"]
+        outbox = connection.execute(select(OutboxModel.recipient, OutboxModel.subject).order_by(OutboxModel.id)).all()
+    assert outbox == [
+        ("reader@example.com", "Book Rental Confirmation: 2 books"),
+        ("waiter@example.com", "Book Rental Confirmation: Book 3"),
+        ("waiter@example.com", "2 books on your wishlist are now available"),
+    ]
+    assert staff_db_client.post("/api/v1/admin/rental/batch", json=[]).status_code == 422
+
+
+def test_renting_a_borrowed_book_conflicts(staff_db_client, db_engine):
+    from sqlalchemy import insert
+    from db.models.books import BookModel
+    from db.models.users import UserModel
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel), [
+            {"id": 2, "username": "reader", "email": "reader@example.com", "password": "x", "is_active": True},
+            {"id": 3, "username": "other", "email": "other@example.com", "password": "x", "is_active": True},
+        ])
+        connection.execute(insert(BookModel).values(id=1, isbn="1", authors="A", publication_year=2000, title="Popular", language="eng", rental_status="available"))
+    assert staff_db_client.post("/api/v1/admin/rental", json={"user": 2, "books": 1}).status_code == 200
+    response = staff_db_client.post("/api/v1/admin/rental", json={"user": 3, "books": 1})
+    assert response.status_code == 409
+    assert staff_db_client.post("/api/v1/admin/rental", json={"user": 3, "books": 7}).status_code == 404
+    assert staff_db_client.post("/api/v1/admin/rental/return", json={"user": 2, "books": 1}).status_code == 200
+    assert staff_db_client.post("/api/v1/admin/rental/return", json={"user": 2, "books": 1}).status_code == 404
+    assert staff_db_client.post("/api/v1/admin/rental", json={"user": 3, "books": 1}).status_code == 200
+
+
+def test_rental_endpoints_stay_within_query_budgets(staff_db_client, db_engine, query_budget):
+    from sqlalchemy import insert
+    from db.models.books import BookModel, WishlistModel, wishlist_books
+    from db.models.users import UserModel
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel), [
+            {"id": n, "username": f"reader{n}", "email": f"reader{n}@example.com", "password": "x", "is_active": True}
+            for n in range(2, 8)
+        ])
+        connection.execute(insert(BookModel), [
+            {"id": n, "isbn": str(n), "authors": "A", "publication_year": 2000, "title": f"Book {n}", "language": "eng", "rental_status": "available"}
+            for n in range(1, 7)
+        ])
+        connection.execute(insert(WishlistModel), [{"id": n, "user_id": n} for n in range(2, 8)])
+        connection.execute(insert(wishlist_books), [{"wishlist_id": w, "book_id": b} for w in range(2, 8) for b in range(1, 7)])
+    items = [{"user": n, "books": n - 1} for n in range(2, 8)]
+
+    # Renting includes a SAVEPOINT and RELEASE around the rental insert.
+    with query_budget(8) as stats:
+        response = staff_db_client.post("/api/v1/admin/rental/batch", json=items)
+    assert response.json()["rented"] == 6
+    assert response.headers["server-timing"].startswith("db;dur=")
+    assert f'desc="{stats.count} queries"' in response.headers["server-timing"]
+    with query_budget(3):
+        assert len(staff_db_client.get("/api/v1/admin/rental/report").json()["report"]) == 6
+    with query_budget(6):
+        assert staff_db_client.post("/api/v1/admin/rental/return/batch", json=items).json()["returned"] == 6
+    with query_budget(10):
+        staff_db_client.post("/api/v1/admin/rental", json=items[0])
+        staff_db_client.post("/api/v1/admin/rental/return", json=items[0])
@@ -37,3 +37,57 @@ def test_confirm_email_no_token(client):
 def test_resend_confirmation_missing_fields(client):
     response = client.post("/api/v1/auth/resend-confirmation", json={})
     assert response.status_code == 422
+
+
+def test_login_rehashes_outdated_password(db_client, db_engine):
+    from sqlalchemy import insert, select
+    from db.models.users import UserModel
+    from services.hashing import crypt_context, password_hasher
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel).values(
+            username="legacy", email="legacy@example.com", password=crypt_context(4).hash("legacypass"), is_active=True
+        ))
+    response = db_client.post("/api/v1/auth/login", data={"username": "legacy@example.com", "password": "legacypass"})
+    assert response.status_code == 200
+    with db_engine.connect() as connection:
+        stored = connection.execute(select(UserModel.password)).scalar()
+    assert stored.startswith(f"$2b${password_hasher.rounds:02d}$")
+
+
+@pytest.fixture
+def active_user(db_engine):
+    from sqlalchemy import insert
+    from db.models.users import UserModel
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel).values(username="refresher", email="refresher@example.com", password="x", is_active=True))
+    return "refresher@example.com"
+
+
+def test_refresh_rotates_tokens(db_client, active_user):
+    from services.auth import create_refresh_token
+    first = create_refresh_token(active_user)
+    response = db_client.post("/api/v1/auth/refresh", json={"refresh_token": first})
+    assert response.status_code == 200
+    second = response.json()["refresh_token"]
+    assert second != first and response.json()["access_token"]
+    # A refresh token works once.
+    assert db_client.post("/api/v1/auth/refresh", json={"refresh_token": first}).status_code == 401
+    assert db_client.post("/api/v1/auth/refresh", json={"refresh_token": second}).status_code == 200
+
+
+def test_refresh_rejects_replay_known_only_to_the_table(db_client, active_user):
+    from services.auth import create_refresh_token
+    from services.token_denylist import token_denylist
+    token = create_refresh_token(active_user)
+    assert db_client.post("/api/v1/auth/refresh", json={"refresh_token": token}).status_code == 200
+    token_denylist._revoked.clear()  # as seen by another worker
+    assert db_client.post("/api/v1/auth/refresh", json={"refresh_token": token}).status_code == 401
+
+
+def test_refresh_rejects_access_tokens_and_logged_out_tokens(db_client, active_user):
+    from services.auth import create_access_token, create_refresh_token
+    access = create_access_token(active_user)
+    assert db_client.post("/api/v1/auth/refresh", json={"refresh_token": access}).status_code == 401
+    token = create_refresh_token(active_user)
+    assert db_client.post("/api/v1/auth/logout", json={"refresh_token": token}).status_code == 200
+    assert db_client.post("/api/v1/auth/refresh", json={"refresh_token": token}).status_code == 401
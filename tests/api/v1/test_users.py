@@ -1,3 +1,4 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
 from main import app
@@ -65,3 +66,166 @@ def test_request_staff_access(auth_headers, register_user):
     response = client.post("/api/v1/user/request-staff-access", headers=auth_headers)
     assert response.status_code == 200
     assert "Staff access request" in response.text
+
+
+def upload_books(db_engine, count):
+    from sqlalchemy import insert
+    from db.models.books import BookModel
+    with db_engine.begin() as connection:
+        connection.execute(insert(BookModel), [
+            {"isbn": f"{n:010d}", "authors": "Author Paged", "publication_year": 2000, "title": f"Paged Book {n}", "language": "EN", "rental_status": "available"}
+            for n in range(count)
+        ])
+
+
+def test_search_books_keyset_pagination(db_client, db_engine):
+    upload_books(db_engine, 5)
+    response = db_client.get("/api/v1/user/search?author=paged&limit=2")
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+    titles = [book["title"] for book in response.json()]
+    while "next" in response.links:
+        response = db_client.get(response.links["next"]["url"])
+        titles += [book["title"] for book in response.json()]
+    assert sorted(titles) == sorted(f"Paged Book {n}" for n in range(5))
+
+
+def test_search_books_ndjson_stream(db_client, db_engine):
+    upload_books(db_engine, 3)
+    response = db_client.get("/api/v1/user/search?author=paged&format=ndjson")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 3
+    assert all("id" in row for row in rows)
+
+
+def test_wishlist_round_trip(db_client, db_engine):
+    from services.auth import get_current_user
+    from schema.users import LoggedInUser
+    upload_books(db_engine, 2)
+    app.dependency_overrides[get_current_user] = lambda: LoggedInUser(id=1, username="reader", email="reader@example.com", is_active=True)
+    assert db_client.get("/api/v1/user/wishlist").status_code == 404
+    assert db_client.post("/api/v1/user/wishlist?book_id=1").status_code == 200
+    assert db_client.post("/api/v1/user/wishlist?book_id=2").status_code == 200
+    assert db_client.get("/api/v1/user/wishlist").json()["book_ids"] == [1, 2]
+    assert db_client.delete("/api/v1/user/wishlist/1").status_code == 200
+    assert db_client.delete("/api/v1/user/wishlist/1").status_code == 404
+    assert db_client.get("/api/v1/user/wishlist").json()["book_ids"] == [2]
+
+
+def test_wishlist_bulk_add_and_remove(db_client, db_engine):
+    from services.auth import get_current_user
+    from schema.users import LoggedInUser
+    upload_books(db_engine, 4)
+    app.dependency_overrides[get_current_user] = lambda: LoggedInUser(id=1, username="reader", email="reader@example.com", is_active=True)
+    assert db_client.post("/api/v1/user/wishlist?book_id=2").status_code == 200
+
+    response = db_client.post("/api/v1/user/wishlist/bulk-add", json={"book_ids": [1, 2, 3, 99]})
+    assert response.status_code == 404
+    assert "99" in response.json()["detail"]
+    assert db_client.get("/api/v1/user/wishlist").json()["book_ids"] == [2]
+
+    response = db_client.post("/api/v1/user/wishlist/bulk-add", json={"book_ids": [1, 2, 3, 3]})
+    assert response.json()["added"] == 2
+    assert response.json()["already_in_wishlist"] == 1
+    assert db_client.get("/api/v1/user/wishlist").json()["book_ids"] == [1, 2, 3]
+
+    response = db_client.post("/api/v1/user/wishlist/bulk-remove", json={"book_ids": [1, 3, 4]})
+    assert response.json()["removed"] == [1, 3]
+    assert response.json()["not_in_wishlist"] == [4]
+    assert db_client.get("/api/v1/user/wishlist").json()["book_ids"] == [2]
+    assert db_client.post("/api/v1/user/wishlist/bulk-remove", json={"book_ids": []}).status_code == 422
+
+
+def test_search_is_cached_until_the_catalog_changes(db_client, db_engine):
+    from sqlalchemy import insert
+    from db.models.users import UserModel
+    from services.auth import get_current_staff_user
+    from services.http_cache import catalog_cache
+    from schema.users import LoggedInStaffUser
+    upload_books(db_engine, 2)
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel).values(id=1, username="reader", email="reader@example.com", password="x", is_active=True))
+
+    response = db_client.get("/api/v1/user/search?author=paged")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "must-revalidate" in response.headers["Cache-Control"]
+    # Same tokens, same entry: answered from the cache.
+    response = db_client.get("/api/v1/user/search?author=PAGED", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert catalog_cache.stats()["not_modified"] >= 1
+
+    app.dependency_overrides[get_current_staff_user] = lambda: LoggedInStaffUser(
+        id=9, username="staff", email="staff@example.com", is_active=True, is_staff=True
+    )
+    assert db_client.post("/api/v1/admin/rental", json={"user": 1, "books": 1}).status_code == 200
+    response = db_client.get("/api/v1/user/search?author=paged", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert sorted(book["rental_status"] for book in response.json()) == ["available", "borrowed"]
+
+
+def test_punctuation_filters_do_not_share_the_unfiltered_entry(db_client, db_engine):
+    upload_books(db_engine, 2)
+    assert len(db_client.get("/api/v1/user/search").json()) == 2
+    # No words to match, so these run a substring match of their own.
+    assert db_client.get("/api/v1/user/search?title='").json() == []
+    assert db_client.get("/api/v1/user/search?author=-").json() == []
+    assert len(db_client.get("/api/v1/user/search").json()) == 2
+
+
+def test_catalog_snapshot_serves_search_and_isbn_lookups(db_client, db_engine, monkeypatch):
+    import asyncio
+    from sqlalchemy import update
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+    import api.v1.users as users
+    from db import async_database_url
+    from db.models.books import BookModel
+    from services.catalog_snapshot import CatalogSnapshot
+    upload_books(db_engine, 3)
+    snapshot = CatalogSnapshot()
+
+    async def load():
+        engine = create_async_engine(async_database_url(str(db_engine.url)), poolclass=NullPool)
+        async with AsyncSession(engine) as session:
+            await snapshot.load(session)
+        await engine.dispose()
+
+    asyncio.run(load())
+    monkeypatch.setattr(users, "catalog_snapshot", snapshot)
+    assert [book["title"] for book in db_client.get("/api/v1/user/search?author=paged&limit=2").json()] == ["Paged Book 0", "Paged Book 1"]
+    with db_engine.begin() as connection:
+        connection.execute(update(BookModel).where(BookModel.id == 2).values(rental_status="borrowed"))
+    response = db_client.get("/api/v1/user/books/isbn/0000000001")
+    assert response.status_code == 200
+    assert response.json() == [{"id": 2, "isbn": "0000000001", "authors": "Author Paged", "publication_year": 2000,
+                                "title": "Paged Book 1", "language": "EN", "rental_status": "borrowed"}]
+    assert db_client.get("/api/v1/user/books/isbn/missing").status_code == 404
+    assert snapshot.stats()["refreshes"] == 1
+
+
+def test_metrics_are_exposed_in_prometheus_format(db_client):
+    db_client.get("/api/v1/health")
+    response = db_client.get("/api/v1/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/v1/health"}' in response.text
+    assert "db_statement_duration_seconds_bucket" in response.text
+    assert 'cache_lookups_total{cache="principal",result="hit"}' in response.text
+    assert "email_outbox_pending 0" in response.text
+    assert "/api/v1/metrics" not in response.text
+
+
+def test_catalog_reads_stay_within_query_budgets(db_client, db_engine, query_budget):
+    from services.auth import get_current_user
+    from schema.users import LoggedInUser
+    upload_books(db_engine, 20)
+    app.dependency_overrides[get_current_user] = lambda: LoggedInUser(id=1, username="reader", email="reader@example.com", is_active=True)
+    assert db_client.post("/api/v1/user/wishlist/bulk-add", json={"book_ids": list(range(1, 21))}).status_code == 200
+    with query_budget(2):
+        assert len(db_client.get("/api/v1/user/wishlist").json()["book_ids"]) == 20
+    with query_budget(2):
+        assert len(db_client.get("/api/v1/user/search?author=paged&limit=20").json()) == 20
@@ -1,9 +1,125 @@
 # tests/conftest.py
+import socket
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from main import app  # or from app.main import app if your app is in app/main.py
+from db import get_session, get_async_session, async_database_url
+from db.models import Base
+from db.models.users import UserModel  # noqa: F401 - registers the users table
+from db.models.books import BookModel  # noqa: F401 - registers the books tables
+from db.models.outbox import OutboxModel  # noqa: F401 - registers the outbox table
+from db.models.catalog_load import CatalogLoadModel  # noqa: F401 - registers the loader checkpoints
+from db.models.tokens import RevokedTokenModel  # noqa: F401 - registers the token denylist
+from db.models.catalog_change import CatalogChangeModel  # noqa: F401 - registers the catalog change log
+from db.changes import create_change_triggers
+from db.fts import create_search_index
+from services.smtpd import SMTPConsoleServer
+from services.hashing import password_hasher
+from services.http_cache import catalog_cache
+from services.query_stats import query_budget as _query_budget
+
+
+@pytest.fixture(autouse=True, scope="session")
+def shared_password_pool():
+    """
+    Every TestClient runs the app lifespan, which stops the password hashing
+    pool on exit; keep one pool for the session instead of spawning one per test.
+    """
+    stop = password_hasher.stop
+    password_hasher.stop = lambda: None
+    yield
+    password_hasher.stop = stop
+    stop()
+
 
 @pytest.fixture
 def client():
     with TestClient(app) as c:
-        yield c
\ No newline at end of file
+        yield c
+
+
+@pytest.fixture
+def db_engine(tmp_path):
+    """
+    A throwaway SQLite database with the full schema, including the search
+    index and the catalog change triggers.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'library.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        create_search_index(connection)
+        create_change_triggers(connection)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_client(db_engine):
+    """
+    A TestClient whose requests run against ``db_engine`` instead of library.db.
+    """
+    TestingSession = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+
+    def get_test_session():
+        db = TestingSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # Connections are not pooled: module-level clients run each request on a fresh event loop.
+    async_engine = create_async_engine(async_database_url(str(db_engine.url)), poolclass=NullPool)
+    TestingAsyncSession = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_test_async_session():
+        async with TestingAsyncSession() as db:
+            yield db
+
+    app.dependency_overrides[get_session] = get_test_session
+    app.dependency_overrides[get_async_session] = get_test_async_session
+    # Responses cached against another test's database would be served here.
+    catalog_cache.clear()
+    with TestClient(app) as c:
+        yield c
+    app.dependency_overrides.clear()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_port(monkeypatch):
+    """
+    Run the bundled console SMTP server on a free port for the test.
+    """
+    port = free_port()
+    monkeypatch.setenv("EMAIL_HOST", "localhost")
+    monkeypatch.setenv("EMAIL_PORT", str(port))
+    server = SMTPConsoleServer()
+    server.start()
+    yield port
+    server.stop()
+
+
+@pytest.fixture
+def closed_port():
+    """
+    A free port with nothing listening on it, for delivery failures.
+    """
+    return free_port()
+
+
+@pytest.fixture
+def query_budget():
+    """
+    ``with query_budget(3): client.get(...)`` fails the test if the block
+    runs more than 3 statements or repeats one (an N+1).
+    """
+    return _query_budget
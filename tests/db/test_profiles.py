@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from db.profiles import get_profile
+
+
+def test_prod_sqlite_profile_applies_pragmas(tmp_path):
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    profile = get_profile("prod-sqlite")
+    engine = create_engine(url, **profile.engine_options(url))
+    profile.install(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    assert engine.pool.size() == 5
+    engine.dispose()
+
+
+def test_pragmas_apply_to_async_engines(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'profile.db'}"
+    profile = get_profile("prod-sqlite")
+    engine = create_async_engine(url, **profile.engine_options(url))
+    profile.install(engine.sync_engine)
+
+    async def run():
+        async with engine.connect() as connection:
+            mode = (await connection.execute(text("PRAGMA journal_mode"))).scalar()
+        await engine.dispose()
+        return mode
+
+    assert asyncio.run(run()) == "wal"
+
+
+def test_profile_must_match_the_backend():
+    with pytest.raises(ValueError):
+        get_profile("prod-postgres").engine_options("sqlite:///./library.db")
+    with pytest.raises(ValueError):
+        get_profile("staging")
+
+
+def test_environment_overrides_the_profile(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_ECHO", "false")
+    profile = get_profile("dev")
+    assert (profile.pool_size, profile.echo) == (3, False)
+    assert profile.engine_options("sqlite:///./library.db")["pool_size"] == 3
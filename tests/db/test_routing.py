@@ -0,0 +1,60 @@
+import asyncio
+import shutil
+import pytest
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+import db
+from db import async_database_url
+from db.models.books import BookModel
+from db.routing import ReplicaSet, RoutingSession
+from services.http_cache import catalog_cache
+
+
+def add_books(engine, *titles):
+    with engine.begin() as connection:
+        connection.execute(insert(BookModel), [
+            {"isbn": title, "authors": "Author Routed", "publication_year": 2000, "title": title, "language": "EN", "rental_status": "available"}
+            for title in titles
+        ])
+
+
+@pytest.fixture
+def replica_engine(db_engine, tmp_path):
+    """
+    A read replica made by copying the primary, which then falls behind it.
+    """
+    add_books(db_engine, "Replicated 1", "Replicated 2")
+    shutil.copy(tmp_path / "library.db", tmp_path / "replica.db")
+    add_books(db_engine, "Primary only")
+    return create_async_engine(async_database_url(f"sqlite:///{tmp_path / 'replica.db'}"), poolclass=NullPool)
+
+
+def test_read_routes_use_a_replica_until_it_lags(db_client, replica_engine, monkeypatch):
+    lag = {"seconds": 0.0}
+
+    async def probe(engine):
+        return lag["seconds"]
+
+    monkeypatch.setattr(db, "read_replicas", ReplicaSet([replica_engine], max_lag=5, check_interval=0, lag_probe=probe))
+    monkeypatch.setattr(catalog_cache, "maxsize", 0)
+    assert len(db_client.get("/api/v1/user/search?author=routed").json()) == 2
+    lag["seconds"] = 30
+    assert len(db_client.get("/api/v1/user/search?author=routed").json()) == 3
+    assert db.read_replicas.stats()["primary_fallbacks"] == 1
+
+
+def test_read_session_sticks_to_primary_after_a_write(db_engine, replica_engine):
+    primary_engine = create_async_engine(async_database_url(str(db_engine.url)), poolclass=NullPool)
+    count = select(func.count()).select_from(BookModel)
+
+    async def run():
+        async with AsyncSession(primary_engine) as primary, AsyncSession(
+            bind=replica_engine, sync_session_class=RoutingSession, info={"primary": primary.sync_session}
+        ) as reader:
+            before = await reader.scalar(count)
+            primary.add(BookModel(isbn="4", authors="A", publication_year=2000, title="Fresh", language="EN"))
+            await primary.commit()
+            return before, await reader.scalar(count)
+
+    assert asyncio.run(run()) == (2, 4)
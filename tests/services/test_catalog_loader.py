@@ -0,0 +1,80 @@
+import shutil
+from pathlib import Path
+import pytest
+from sqlalchemy import func, inspect, select, text
+from db.models.books import BookModel
+from db.models.catalog_load import CatalogLoadModel
+import services.catalog_loader as catalog_loader
+from services.catalog_loader import deferred_indexes, load_file, read_header, split_chunks
+
+BOOKS_CSV = Path(__file__).resolve().parents[2] / "books.csv"
+
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / "books.csv"
+    shutil.copy(BOOKS_CSV, path)
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('1000001,123,"Quoted\nAuthor",1999,Multiline,eng\n')
+        file.write("1000002,124,Author,unknown,Bad Year,eng\n")
+    return path
+
+
+def count(engine, model=BookModel):
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(model)).scalar()
+
+
+def test_split_chunks_keeps_quoted_newlines_together(dump):
+    _, start = read_header(dump)
+    chunks = list(split_chunks(str(dump), start, 2, chunk_bytes=512))
+    assert len(chunks) > 1
+    assert chunks[0].start == start and chunks[-1].end == dump.stat().st_size
+    assert all(a.end == b.start and a.line + a.lines == b.line for a, b in zip(chunks, chunks[1:]))
+    assert dump.read_bytes()[chunks[-1].start:].count(b'"') % 2 == 0
+
+
+def test_load_file_in_parallel(db_engine, dump, tmp_path):
+    with open(tmp_path / "rejected.csv", "w", newline="") as errors:
+        stats = load_file(str(dump), engine=db_engine, workers=2, chunk_bytes=1024, keep_ids=True, errors=errors)
+    assert (stats["rows_loaded"], stats["rows_rejected"]) == (100, 1)
+    assert "Bad Year" not in (tmp_path / "rejected.csv").read_text()
+    assert ",103,\"publication_year:" in (tmp_path / "rejected.csv").read_text()
+    with db_engine.connect() as connection:
+        assert connection.execute(select(BookModel.authors).where(BookModel.id == 1000001)).scalar() == "Quoted\nAuthor"
+    # Reseeding from the same dump upserts on the kept ids.
+    load_file(str(dump), engine=db_engine, workers=1, keep_ids=True)
+    assert count(db_engine) == 100
+
+
+def test_interrupted_load_resumes_after_last_chunk(db_engine, dump, monkeypatch):
+    write_chunk = catalog_loader._write_chunk
+    calls = []
+
+    def crash_on_third_chunk(*args):
+        calls.append(args)
+        if len(calls) == 3:
+            raise RuntimeError("killed")
+        write_chunk(*args)
+
+    monkeypatch.setattr(catalog_loader, "_write_chunk", crash_on_third_chunk)
+    with pytest.raises(RuntimeError):
+        load_file(str(dump), engine=db_engine, workers=1, chunk_bytes=1024)
+    loaded_before_crash = count(db_engine)
+    assert 0 < loaded_before_crash < 100
+
+    monkeypatch.setattr(catalog_loader, "_write_chunk", write_chunk)
+    stats = load_file(str(dump), engine=db_engine, workers=1, chunk_bytes=1024)
+    assert stats["resumed_at_line"] is not None
+    assert count(db_engine) == 100
+    with db_engine.connect() as connection:
+        assert connection.execute(select(CatalogLoadModel.completed, CatalogLoadModel.rows_loaded)).one() == (True, 100)
+
+
+def test_deferred_indexes_are_rebuilt(db_engine, dump):
+    with deferred_indexes(db_engine):
+        assert "ix_books_isbn" not in {index["name"] for index in inspect(db_engine).get_indexes("books")}
+        load_file(str(dump), engine=db_engine, workers=1)
+    assert "ix_books_isbn" in {index["name"] for index in inspect(db_engine).get_indexes("books")}
+    with db_engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM books_fts WHERE books_fts MATCH 'multiline'")).scalar() == 1
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from sqlalchemy import delete, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+from db import async_database_url
+from db.changes import record_full_change
+from db.models.books import BookModel
+from services.catalog_snapshot import CatalogSnapshot
+from services.query_stats import track_queries
+
+
+def book(n, **fields):
+    return {"id": n, "isbn": f"isbn-{n}", "authors": "Shared Author", "publication_year": 2000, "title": f"Title {n}",
+            "language": "eng", "rental_status": "available", **fields}
+
+
+@pytest.fixture
+def run(db_engine):
+    """
+    Run ``coroutine_fn(session)`` against ``db_engine`` in a fresh session.
+    """
+    engine = create_async_engine(async_database_url(str(db_engine.url)), poolclass=NullPool)
+
+    def run(coroutine_fn):
+        async def main():
+            async with AsyncSession(engine) as session:
+                return await coroutine_fn(session)
+        return asyncio.run(main())
+
+    yield run
+    asyncio.run(engine.dispose())
+
+
+def test_snapshot_tracks_changes_incrementally(db_engine, run):
+    with db_engine.begin() as connection:
+        connection.execute(insert(BookModel), [book(n) for n in range(1, 4)])
+    snapshot = CatalogSnapshot()
+    run(snapshot.load)
+    assert snapshot.get(2)["title"] == "Title 2"
+    assert snapshot.columns.authors.values == ["Shared Author"]
+    with track_queries() as stats:
+        assert run(snapshot.refresh) == 0  # nothing changed
+    assert stats.count == 1
+
+    with db_engine.begin() as connection:
+        connection.execute(update(BookModel).where(BookModel.id == 2).values(rental_status="borrowed", isbn="isbn-new"))
+        connection.execute(delete(BookModel).where(BookModel.id == 3))
+        connection.execute(insert(BookModel).values(book(10, title="Late arrival")))
+    assert run(snapshot.refresh) == 3
+    assert snapshot.get(2)["rental_status"] == "borrowed"
+    assert snapshot.get(3) is None
+    assert snapshot.get(10)["title"] == "Late arrival"
+    assert [found["id"] for found in snapshot.by_isbn("isbn-new")] == [2]
+    assert snapshot.by_isbn("isbn-2") == []
+    stats = snapshot.stats()
+    assert (stats["books"], stats["full_loads"], stats["refreshes"]) == (3, 1, 1)
+    assert stats["bytes_per_book"] > 0
+
+
+def test_full_change_marker_reloads_everything(db_engine, run):
+    with db_engine.begin() as connection:
+        connection.execute(insert(BookModel), [book(n) for n in range(1, 3)])
+    snapshot = CatalogSnapshot()
+    run(snapshot.load)
+    with db_engine.begin() as connection:
+        record_full_change(connection)
+    assert run(snapshot.refresh) == 2
+    assert snapshot.stats()["full_loads"] == 2
+
+
+def test_readers_see_the_old_catalog_during_a_full_reload(db_engine, run):
+    with db_engine.begin() as connection:
+        connection.execute(insert(BookModel), [book(n) for n in range(1, 501)])
+    snapshot = CatalogSnapshot()
+    run(snapshot.load)
+    with db_engine.begin() as connection:
+        record_full_change(connection)
+
+    async def reload_while_reading(session):
+        misses = polls = 0
+        reload = asyncio.ensure_future(asyncio.gather(snapshot.refresh(session), snapshot.refresh(session)))
+        while not reload.done():
+            polls += 1
+            misses += snapshot.by_isbn("isbn-250") == []
+            await asyncio.sleep(0)
+        return await reload, polls, misses
+
+    (reloaded, repeated), polls, misses = run(reload_while_reading)
+    assert (reloaded, repeated) == (500, 0)  # the second refresh waited and found nothing new
+    assert polls > 1 and misses == 0
+    assert [found["id"] for found in snapshot.by_isbn("isbn-250")] == [250]
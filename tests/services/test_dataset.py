@@ -0,0 +1,41 @@
+from datetime import datetime
+from sqlalchemy import func, select
+from bench.dataset import CatalogModel, DatasetGenerator, isbn10, write_database
+from db.models.books import BookModel, RentalModel, wishlist_books
+from db.models.catalog_change import CatalogChangeModel
+
+AS_OF = datetime(2026, 10, 1)
+
+
+def generator(seed=0, **options):
+    return DatasetGenerator(CatalogModel.from_csv(), books=500, users=50, seed=seed, as_of=AS_OF, **options)
+
+
+def test_isbns_have_valid_check_digits():
+    assert isbn10(30640615) == "0306406152"
+    assert isbn10(6) == "000000006X"
+
+
+def test_same_seed_same_rows():
+    assert list(generator().books()) == list(generator().books())
+    assert list(generator().wishlist_entries()) == list(generator().wishlist_entries())
+    assert list(generator().books()) != list(generator(seed=1).books())
+
+
+def test_rentals_match_book_statuses_and_some_are_overdue():
+    data = generator(rental_rate=0.2)
+    borrowed = {book["id"] for book in data.books() if book["rental_status"] == "borrowed"}
+    rentals = list(data.rental_rows())
+    assert borrowed == {rental["book_id"] for rental in rentals} and len(borrowed) == 100
+    overdue = [rental for rental in rentals if (AS_OF - rental["rental_date"]).days > data.due_days]
+    assert 0 < len(overdue) < len(rentals)
+
+
+def test_written_to_the_database(db_engine):
+    counts = write_database(generator(), db_engine, "x")
+    with db_engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(BookModel)) == counts["books"] == 500
+        assert connection.scalar(select(func.count()).select_from(RentalModel)) == counts["rentals"]
+        assert connection.scalar(select(func.count()).select_from(wishlist_books)) == counts["wishlist_books"]
+        # One full-reload marker instead of a change per book.
+        assert connection.execute(select(CatalogChangeModel.book_id)).scalars().all() == [None]
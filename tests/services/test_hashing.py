@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from services.hashing import PasswordHasher, calibrate_rounds, crypt_context
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, rounds=4)
+    yield hasher
+    hasher.stop()
+
+
+def test_hash_and_verify_in_the_pool(hasher):
+    async def run():
+        hashed = await hasher.hash("secret")
+        return hashed, await hasher.verify("secret", hashed), await hasher.verify("wrong", hashed)
+
+    hashed, valid, invalid = asyncio.run(run())
+    assert hashed.startswith("$2b$04$")
+    assert (valid, invalid) == (True, False)
+    stats = hasher.stats()
+    assert stats["completed"] == 3
+    assert 0 < hasher._bcrypt_seconds <= hasher._busy_seconds
+
+
+def test_warm_up_and_failures_are_not_counted_as_completed(hasher):
+    async def run():
+        await hasher.start()
+        with pytest.raises(ValueError):
+            await hasher.verify("secret", "not a bcrypt hash")
+
+    asyncio.run(run())
+    stats = hasher.stats()
+    assert (stats["completed"], stats["failed"], stats["busy_seconds"]) == (0, 1, 0)
+
+
+def test_weaker_hashes_are_upgraded(hasher):
+    old_hash = crypt_context(4).hash("secret")
+    hasher.rounds = 5
+    valid, new_hash = asyncio.run(hasher.verify_and_update("secret", old_hash))
+    assert valid and new_hash.startswith("$2b$05$")
+    assert asyncio.run(hasher.verify_and_update("secret", new_hash)) == (True, None)
+    assert hasher.stats()["rehashed"] == 1
+
+
+def test_full_queue_is_rejected():
+    hasher = PasswordHasher(workers=1, max_pending=0, rounds=4)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(hasher.hash("secret"))
+    assert exc.value.status_code == 503
+    assert hasher.stats()["rejected"] == 1
+
+
+def test_calibration_respects_the_minimum():
+    assert calibrate_rounds(target_ms=0, min_rounds=4) == 4
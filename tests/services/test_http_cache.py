@@ -0,0 +1,57 @@
+from starlette.requests import Request
+from services.http_cache import CatalogCache
+
+
+def make_request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_entries_expire_when_the_version_is_bumped():
+    cache = CatalogCache(maxsize=2)
+    key = cache.key("search", author="tolkien", title=None)
+    assert key == cache.key("search", author="tolkien", title="")
+    assert cache.get(key) is None
+    cache.set(key, cache.version, b"[]")
+    assert cache.get(key).body == b"[]"
+    cache.bump()
+    assert cache.get(key) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_entries_rendered_before_a_bump_are_never_served():
+    cache = CatalogCache()
+    key = cache.key("search")
+    version = cache.version
+    cache.bump()  # a mutation commits while the query runs
+    cache.set(key, version, b"[]")
+    assert cache.get(key) is None
+
+
+def test_if_none_match_is_answered_with_304():
+    cache = CatalogCache()
+    entry = cache.set(cache.key("search"), cache.version, b"[1]")
+    assert cache.respond(make_request(), entry).status_code == 200
+    assert cache.respond(make_request(f'W/{entry.etag}, "other"'), entry).status_code == 304
+    assert cache.respond(make_request('"other"'), entry).status_code == 200
+
+
+def test_per_process_versions_expire_after_the_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("services.http_cache.time.monotonic", lambda: now[0])
+    cache = CatalogCache(ttl=5)
+    key = cache.key("search")
+    cache.set(key, cache.version, b"[]")
+    now[0] += 4
+    assert cache.get(key) is not None
+    now[0] += 2  # another worker's bump never reached this one
+    assert cache.get(key) is None
+
+    class SharedVersion:
+        def get(self):
+            return 0
+
+        def incr(self):
+            return 1
+
+    assert CatalogCache(backend=SharedVersion(), ttl=5).ttl is None
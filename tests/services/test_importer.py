@@ -0,0 +1,72 @@
+import asyncio
+import io
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+from db import async_database_url
+from db.models.books import BookModel
+from services.importer import read_batches, validate_batch, import_books
+
+CSV = (
+    "Id,ISBN,Authors,Publication Year,Title,Language\n"
+    "1,111,Author A,2001,\"Multi\nline\",eng\n"
+    "2,222,Author B,not-a-year,Bad Year,eng\n"
+    "3,333,Author C,2003,Third,eng\n"
+)
+
+
+def test_read_batches_streams_rows_with_line_numbers():
+    batches = list(read_batches(io.BytesIO(CSV.encode()), batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 1]
+    line, fields = batches[0][0]
+    assert line == 3  # the quoted title spans two lines
+    assert fields == {"isbn": "111", "authors": "Author A", "publication_year": "2001", "title": "Multi\nline", "language": "eng"}
+
+
+def test_validate_batch_reports_each_bad_row():
+    batch = [row for batch in read_batches(io.BytesIO(CSV.encode())) for row in batch]
+    valid, rejected = validate_batch(batch)
+    assert [book["isbn"] for _, book in valid] == ["111", "333"]
+    assert valid[0][1]["publication_year"] == 2001
+    assert len(rejected) == 1
+    assert rejected[0][0] == 4
+    assert rejected[0][1].startswith("publication_year:")
+
+
+def run_import(db_engine, data: str, **options):
+    engine = create_async_engine(async_database_url(str(db_engine.url)), poolclass=NullPool)
+
+    async def run():
+        async with AsyncSession(engine) as session:
+            return (await import_books(session, io.BytesIO(data.encode()), **options)).as_dict()
+
+    return asyncio.run(run())
+
+
+def test_import_books_inserts_in_batches(db_engine):
+    report = run_import(db_engine, CSV, batch_size=1)
+    assert (report["rows"], report["created"], report["error_count"]) == (3, 2, 1)
+    with db_engine.connect() as connection:
+        assert connection.execute(select(BookModel.title).order_by(BookModel.id)).scalars().all() == ["Multi\nline", "Third"]
+
+
+def test_import_books_dedupes_by_isbn(db_engine):
+    run_import(db_engine, CSV)
+    again = "ISBN,Authors,Publication Year,Title,Language\n111,Author A,2001,Renamed,eng\n444,D,2004,New,eng\n444,D,2004,New again,eng\n"
+    report = run_import(db_engine, again, on_duplicate="skip")
+    assert (report["created"], report["skipped"], report["updated"]) == (1, 2, 0)
+    report = run_import(db_engine, again, on_duplicate="update")
+    assert (report["created"], report["skipped"], report["updated"]) == (0, 1, 2)
+    with db_engine.connect() as connection:
+        titles = dict(connection.execute(select(BookModel.isbn, BookModel.title)).all())
+    assert titles == {"111": "Renamed", "333": "Third", "444": "New again"}
+
+
+def test_update_overwrites_every_book_sharing_an_isbn(db_engine):
+    run_import(db_engine, CSV)
+    run_import(db_engine, CSV)  # the default mode inserts the duplicates
+    report = run_import(db_engine, "ISBN,Authors,Publication Year,Title,Language\n111,Author A,2001,Renamed,eng\n", on_duplicate="update")
+    assert (report["created"], report["updated"]) == (0, 2)
+    with db_engine.connect() as connection:
+        titles = connection.execute(select(BookModel.title).where(BookModel.isbn == "111")).scalars().all()
+    assert titles == ["Renamed", "Renamed"]
@@ -0,0 +1,122 @@
+import json
+import logging
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from services.logger import (
+    JsonFormatter,
+    RateLimitFilter,
+    RequestIdMiddleware,
+    SamplingFilter,
+    flush_logging,
+    parse_rules,
+    queue_handler,
+    _rule_for,
+)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_logger(name, *handlers):
+    logger = logging.getLogger(name)
+    logger.handlers = [queue_handler(*handlers)]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def test_records_are_json_with_request_id_and_extras():
+    sink = ListHandler()
+    sink.setFormatter(JsonFormatter())
+    logger = make_logger("tests.logger.json", sink)
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        logger.info("Pinged %s", "twice", extra={"route": "/ping", "queries": 2})
+        return {}
+
+    app.add_middleware(RequestIdMiddleware)
+    with TestClient(app) as client:
+        response = client.get("/ping", headers={"X-Request-ID": "abc123"})
+        generated = client.get("/ping").headers["x-request-id"]
+    flush_logging()
+
+    assert response.headers["x-request-id"] == "abc123"
+    first, second = (json.loads(sink.format(record)) for record in sink.records)
+    assert first["message"] == "Pinged twice" and first["level"] == "INFO"
+    assert first["request_id"] == "abc123"
+    assert (first["route"], first["queries"]) == ("/ping", 2)
+    assert second["request_id"] == generated and len(generated) == 32
+
+
+def test_exceptions_are_rendered_before_crossing_the_queue():
+    sink = ListHandler()
+    sink.setFormatter(JsonFormatter())
+    logger = make_logger("tests.logger.exception", sink)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("Failed")
+    flush_logging()
+    entry = json.loads(sink.format(sink.records[0]))
+    assert "request_id" not in entry
+    assert "ValueError: boom" in entry["exception"]
+
+
+def test_propagated_records_keep_their_traceback():
+    sink, parent = ListHandler(), ListHandler()
+    logging.getLogger("tests.logger.propagate").addHandler(parent)
+    logger = make_logger("tests.logger.propagate.child", sink)
+    logger.propagate = True
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("Failed %s", "once")
+    flush_logging()
+    [original] = parent.records
+    assert original.exc_info[0] is ValueError
+    assert (original.msg, original.args) == ("Failed %s", ("once",))
+    assert sink.records[0].msg == "Failed once"
+    logging.getLogger("tests.logger.propagate").removeHandler(parent)
+
+
+def test_stop_flushes_everything_queued():
+    sink = ListHandler()
+    logger = make_logger("tests.logger.flush", sink)
+    for index in range(1000):
+        logger.info("Record %d", index)
+    flush_logging()
+    assert len(sink.records) == 1000
+
+
+def test_rate_limit_keeps_a_burst_per_second_and_all_warnings():
+    now = [0.0]
+    rate_limit = RateLimitFilter(5, clock=lambda: now[0])
+    info = logging.LogRecord("hot", logging.INFO, "", 0, "hot", None, None)
+    warning = logging.LogRecord("hot", logging.WARNING, "", 0, "hot", None, None)
+    assert sum(rate_limit.filter(info) for _ in range(20)) == 5
+    assert rate_limit.filter(warning)
+    now[0] = 0.4
+    assert sum(rate_limit.filter(info) for _ in range(20)) == 2
+    assert rate_limit.dropped == 33
+
+
+def test_sampling_keeps_a_fraction_below_warning():
+    sampling = SamplingFilter(0.0)
+    assert not sampling.filter(logging.LogRecord("hot", logging.INFO, "", 0, "hot", None, None))
+    assert sampling.filter(logging.LogRecord("hot", logging.ERROR, "", 0, "hot", None, None))
+    assert sampling.dropped == 1
+
+
+def test_longest_prefix_rule_applies():
+    rules = parse_rules("services=0.5, services.auth=0.1")
+    assert _rule_for("services.auth", rules) == 0.1
+    assert _rule_for("services.rentals", rules) == 0.5
+    assert _rule_for("servicesx", rules) is None
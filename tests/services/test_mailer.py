@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+import aiosmtplib
+from services.email import build_message
+from services.mailer import SMTPDeliveryEngine
+
+
+def test_engine_reuses_pooled_connections(smtp_port):
+    async def run():
+        engine = SMTPDeliveryEngine(hostname="localhost", port=smtp_port, pool_size=2)
+        await engine.start()
+        futures = [await engine.enqueue(build_message(f"Subject {n}", "Body", "reader@example.com")) for n in range(10)]
+        await asyncio.gather(*futures)
+        stats = engine.stats()
+        await engine.stop()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["sent"] == 10
+    assert stats["failed"] == 0
+    assert stats["connections_opened"] <= 2
+    assert stats["queue_depth"] == 0
+    assert stats["send_seconds"] > 0 and stats["avg_send_ms"] > 0
+
+
+def test_engine_retries_with_backoff_then_fails(closed_port):
+    async def run():
+        engine = SMTPDeliveryEngine(hostname="localhost", port=closed_port, pool_size=1, max_attempts=3, backoff=0.01)
+        await engine.start()
+        future = await engine.enqueue(build_message("Subject", "Body", "reader@example.com"))
+        with pytest.raises((aiosmtplib.SMTPException, OSError)):
+            await future
+        stats = engine.stats()
+        await engine.stop()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["retried"] == 2
+    assert stats["failed"] == 1
+    assert stats["sent"] == 0
@@ -0,0 +1,48 @@
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from services.metrics import Counter, Histogram, MetricsMiddleware, http_in_flight, http_latency, http_requests
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/books")
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/books",le="0.1"} 2',
+        'latency_seconds_bucket{route="/books",le="1.0"} 3',
+        'latency_seconds_bucket{route="/books",le="+Inf"} 4',
+        'latency_seconds_sum{route="/books"} 3.65',
+        'latency_seconds_count{route="/books"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = Counter("requests_total", "Requests.", ("path",))
+    counter.inc('a"b\\c')
+    assert counter.render()[-1] == 'requests_total{path="a\\"b\\\\c"} 1'
+
+
+def test_middleware_labels_requests_by_route_template():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=404)
+        return {"id": item_id}
+
+    app.add_middleware(MetricsMiddleware)
+    before = {
+        status: http_requests._values.get(("GET", "/items/{item_id}", status), 0) for status in ("200", "404")
+    }
+    with TestClient(app) as client:
+        for item_id in (1, 2, 0):
+            client.get(f"/items/{item_id}")
+        client.get("/missing")
+    assert http_requests._values[("GET", "/items/{item_id}", "200")] == before["200"] + 2
+    assert http_requests._values[("GET", "/items/{item_id}", "404")] == before["404"] + 1
+    assert ("GET", "unmatched", "404") in http_requests._values
+    assert ("GET", "/items/1") not in http_latency._values
+    assert http_in_flight._values[()] == 0
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.orm import sessionmaker
+from db.models.outbox import OutboxModel, OutboxStatusEnum
+from services.mailer import SMTPDeliveryEngine
+from services.outbox import enqueue_email, claim_batch, OutboxDispatcher
+
+
+@pytest.fixture
+def session_factory(db_engine):
+    return sessionmaker(bind=db_engine)
+
+
+def add_emails(session_factory, count):
+    with session_factory() as session:
+        for n in range(count):
+            enqueue_email(session, subject=f"Subject {n}", body="Body", to=f"reader{n}@example.com")
+        session.commit()
+
+
+def statuses(session_factory):
+    with session_factory() as session:
+        return [(row.status, row.attempts) for row in session.execute(select(OutboxModel).order_by(OutboxModel.id)).scalars()]
+
+
+def test_enqueue_is_part_of_the_callers_transaction(session_factory):
+    with session_factory() as session:
+        enqueue_email(session, subject="Subject", body="Body", to="reader@example.com")
+        session.rollback()
+    assert statuses(session_factory) == []
+
+
+def test_claim_batch_claims_each_row_once(session_factory):
+    add_emails(session_factory, 5)
+    with session_factory() as session:
+        first = claim_batch(session, batch_size=3)
+        second = claim_batch(session, batch_size=3)
+        third = claim_batch(session, batch_size=3)
+    assert [row.id for row in first] == [1, 2, 3]
+    assert [row.id for row in second] == [4, 5]
+    assert third == []
+
+
+def test_claim_batch_reclaims_expired_leases(session_factory):
+    add_emails(session_factory, 1)
+    with session_factory() as session:
+        claim_batch(session)
+        session.execute(update(OutboxModel).values(claimed_at=datetime.utcnow() - timedelta(hours=1)))
+        session.commit()
+        reclaimed = claim_batch(session, lease_seconds=60)
+    assert [(row.id, row.attempts) for row in reclaimed] == [(1, 2)]
+
+
+def test_dispatcher_sends_and_marks_rows(session_factory, smtp_port):
+    add_emails(session_factory, 4)
+    dispatcher = OutboxDispatcher(session_factory, SMTPDeliveryEngine(hostname="localhost", port=smtp_port, max_attempts=1), batch_size=3)
+    asyncio.run(dispatcher.run(once=True))
+    assert statuses(session_factory) == [(OutboxStatusEnum.sent, 1)] * 4
+
+
+def test_dispatcher_reschedules_then_fails(session_factory, closed_port):
+    add_emails(session_factory, 1)
+    dispatcher = OutboxDispatcher(
+        session_factory, SMTPDeliveryEngine(hostname="localhost", port=closed_port, max_attempts=1),
+        max_attempts=2, backoff=0,
+    )
+    asyncio.run(dispatcher.run(once=True))
+    assert statuses(session_factory) == [(OutboxStatusEnum.pending, 1)]
+    asyncio.run(dispatcher.run(once=True))
+    with session_factory() as session:
+        row = session.execute(select(OutboxModel)).scalar_one()
+    assert row.status == OutboxStatusEnum.failed
+    assert row.attempts == 2
+    assert row.last_error
@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from db.models.users import UserModel
+from schema.users import LoggedInStaffUser
+from db import async_database_url
+from services.auth import load_principal
+from services.principal_cache import PrincipalCache, MemoryCacheBackend, principal_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def principal(n=1, **overrides):
+    fields = dict(id=n, username=f"user{n}", email=f"user{n}@example.com", is_active=True, is_staff=False)
+    return LoggedInStaffUser(**{**fields, **overrides})
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = PrincipalCache(MemoryCacheBackend(clock=clock), ttl=10)
+    cache.set(principal())
+    clock.now = 9
+    assert cache.get("user1@example.com") == principal()
+    clock.now = 10
+    assert cache.get("user1@example.com") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PrincipalCache(MemoryCacheBackend(maxsize=2), ttl=60)
+    cache.set(principal(1))
+    cache.set(principal(2))
+    cache.get("user1@example.com")
+    cache.set(principal(3))
+    assert cache.get("user2@example.com") is None
+    assert cache.get("user1@example.com") is not None
+
+
+@pytest.fixture
+def async_engine(db_engine):
+    principal_cache.clear()
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel).values(id=1, username="user1", email="user1@example.com", password="x", is_active=False, is_staff=False))
+    yield create_async_engine(async_database_url(str(db_engine.url)))
+    principal_cache.clear()
+
+
+def test_load_principal_uses_the_cache(async_engine):
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    async def run():
+        async with AsyncSession(async_engine) as session:
+            assert (await load_principal("user1@example.com", session)).is_active is False
+            assert (await load_principal("user1@example.com", session)).is_active is False
+        await async_engine.dispose()
+
+    asyncio.run(run())
+    assert len(statements) == 1
+
+
+def test_committed_user_changes_invalidate_the_cache(async_engine):
+    async def run():
+        async with AsyncSession(async_engine) as session:
+            await load_principal("user1@example.com", session)
+            user = await session.get(UserModel, 1)
+            user.is_staff = True
+            await session.flush()
+            assert principal_cache.get("user1@example.com").is_staff is False  # not committed yet
+            await session.commit()
+            assert principal_cache.get("user1@example.com") is None
+            assert (await load_principal("user1@example.com", session)).is_staff is True
+        await async_engine.dispose()
+
+    asyncio.run(run())
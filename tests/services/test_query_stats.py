@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import create_engine, text
+from services.query_stats import query_budget, statement_shape, track_queries
+
+
+def test_in_lists_fold_to_one_shape():
+    assert statement_shape("SELECT * FROM books\n  WHERE id IN (?, ?, ?)") == statement_shape("SELECT * FROM books WHERE id IN (?)")
+    assert statement_shape("SELECT * FROM books WHERE id IN (%s, %s)") == "SELECT * FROM books WHERE id IN (?)"
+    assert statement_shape("SELECT * FROM books WHERE id = ?") != statement_shape("SELECT * FROM users WHERE id = ?")
+
+
+def test_nested_scopes_all_see_statements():
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection, track_queries() as outer:
+        connection.execute(text("SELECT 1"))
+        with track_queries() as inner:
+            connection.execute(text("SELECT 2"))
+    assert (outer.count, inner.count) == (2, 1)
+    assert outer.seconds >= inner.seconds > 0
+
+
+def test_query_budget_fails_on_overruns_and_repeats():
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection:
+        with pytest.raises(AssertionError, match="2 queries, budget is 1"):
+            with query_budget(1):
+                connection.execute(text("SELECT 1"))
+                connection.execute(text("SELECT 2"))
+        with pytest.raises(AssertionError, match="N\\+1"):
+            with query_budget(10):
+                for book_id in range(3):
+                    connection.execute(text("SELECT :id"), {"id": book_id})
+        with query_budget(10, repeat_threshold=None):
+            for book_id in range(3):
+                connection.execute(text("SELECT :id"), {"id": book_id})
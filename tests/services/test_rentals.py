@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+from db import async_database_url
+from db.models.books import BookModel, RentalModel
+from db.models.users import UserModel
+from schema.books import RentalRequest
+from services.rentals import rent_books, return_books
+
+BOOKS = 4
+PATRONS = 10
+
+
+@pytest.fixture
+def library(db_engine):
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel), [
+            {"id": n, "username": f"patron{n}", "email": f"patron{n}@example.com", "password": "x", "is_active": True}
+            for n in range(1, PATRONS + 1)
+        ])
+        connection.execute(insert(BookModel), [
+            {"id": n, "isbn": str(n), "authors": "A", "publication_year": 2000, "title": f"Book {n}", "language": "eng", "rental_status": "available"}
+            for n in range(1, BOOKS + 1)
+        ])
+    return db_engine
+
+
+async def _attempt(engine, transition, user, book):
+    async with AsyncSession(engine) as session:
+        [result] = await transition(session, [RentalRequest(user=user, books=book)])
+        await session.commit()
+        return result["status"]
+
+
+def test_concurrent_rentals_never_double_rent(library):
+    async def run():
+        # Every patron tries to rent every book at once, then returns race too.
+        engine = create_async_engine(async_database_url(str(library.url)), poolclass=NullPool, connect_args={"timeout": 30})
+        try:
+            attempts = [(user, book) for user in range(1, PATRONS + 1) for book in range(1, BOOKS + 1)]
+            rented = await asyncio.gather(*(_attempt(engine, rent_books, user, book) for user, book in attempts))
+            async with AsyncSession(engine) as session:
+                winners = (await session.execute(select(RentalModel.user_id, RentalModel.book_id))).all()
+            returned = await asyncio.gather(*(_attempt(engine, return_books, user, book) for user, book in winners * 3))
+            return rented, winners, returned
+        finally:
+            await engine.dispose()
+
+    rented, winners, returned = asyncio.run(run())
+    assert rented.count("rented") == BOOKS
+    assert rented.count("unavailable") == len(rented) - BOOKS
+    assert sorted(book for _, book in winners) == list(range(1, BOOKS + 1))
+    assert returned.count("returned") == BOOKS
+    with library.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(RentalModel)).scalar() == 0
+        assert set(connection.execute(select(BookModel.rental_status)).scalars()) == {"available"}
+
+
+def test_unique_index_refuses_a_second_active_rental(library):
+    with library.begin() as connection:
+        # A rental left behind with its book marked available.
+        connection.execute(insert(RentalModel).values(user_id=1, book_id=1))
+        with pytest.raises(IntegrityError):
+            with connection.begin_nested():
+                connection.execute(insert(RentalModel).values(user_id=2, book_id=1))
+
+    async def run():
+        engine = create_async_engine(async_database_url(str(library.url)), poolclass=NullPool)
+        try:
+            async with AsyncSession(engine) as session:
+                results = await rent_books(session, [RentalRequest(user=2, books=1), RentalRequest(user=2, books=2)])
+                await session.commit()
+                return results
+        finally:
+            await engine.dispose()
+
+    held, rented = asyncio.run(run())
+    assert held["status"] == "unavailable"
+    assert rented["status"] == "rented" and rented["rental_id"]
+    with library.connect() as connection:
+        rentals = dict(connection.execute(select(RentalModel.book_id, RentalModel.user_id)).all())
+    assert (rentals[1], rentals[2]) == (1, 2)
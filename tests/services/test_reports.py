@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from db.models.books import BookModel, RentalModel
+from db.models.users import UserModel
+from services.reports import rental_report_statement, report_row, iter_csv
+
+DUE_DAYS = 30
+
+
+@pytest.fixture
+def connection(db_engine):
+    now = datetime.utcnow()
+    with db_engine.begin() as connection:
+        connection.execute(insert(UserModel), [
+            {"id": 1, "username": "alice", "email": "alice@example.com", "password": "x", "is_active": True},
+            {"id": 2, "username": "bob", "email": "bob@example.com", "password": "x", "is_active": True},
+        ])
+        connection.execute(insert(BookModel), [
+            {"id": n, "isbn": str(n), "authors": "A", "publication_year": 2000, "title": f"Book {n}",
+             "language": "fre" if n == 3 else "eng", "rental_status": "borrowed" if n < 3 else "available"}
+            for n in (1, 2, 3)
+        ])
+        connection.execute(insert(RentalModel), [
+            {"user_id": 1, "book_id": 1, "rental_date": now - timedelta(days=DUE_DAYS + 5, hours=1)},
+            {"user_id": 2, "book_id": 2, "rental_date": now - timedelta(days=2)},
+        ])
+    with db_engine.connect() as connection:
+        yield connection
+
+
+def report(connection, **filters):
+    stmt = rental_report_statement(connection.dialect.name, DUE_DAYS, **filters)
+    return [report_row(row) for row in connection.execute(stmt)]
+
+
+def test_report_computes_due_dates_in_sql(connection):
+    rows = report(connection)
+    assert [row["book_id"] for row in rows] == [1, 2, 3]
+    overdue, current, free = rows
+    assert overdue["rentee"] == "alice"
+    assert overdue["past_due_days"] == 5
+    assert overdue["rental_status"] == "borrowed"
+    assert current["past_due_days"] == 0
+    expected_due = (datetime.utcnow() - timedelta(days=2) + timedelta(days=DUE_DAYS)).date()
+    assert current["due_date"] == str(expected_due)
+    assert free == {"book_id": 3, "title": "Book 3", "rental_status": "available", "rentee": None,
+                    "rented_on": None, "due_date": None, "past_due_days": None}
+
+
+def test_report_filters_and_keyset(connection):
+    assert [row["book_id"] for row in report(connection, overdue_only=True)] == [1]
+    assert [row["book_id"] for row in report(connection, user_id=2)] == [2]
+    assert [row["book_id"] for row in report(connection, username="alice")] == [1]
+    assert [row["book_id"] for row in report(connection, language="fre")] == [3]
+    assert [row["book_id"] for row in report(connection, after=1, limit=1)] == [2]
+
+
+def test_report_csv(connection):
+    stmt = rental_report_statement(connection.dialect.name, DUE_DAYS, overdue_only=True)
+    lines = "".join(iter_csv(connection.execute(stmt))).splitlines()
+    assert lines[0] == "book_id,title,rental_status,rentee,rented_on,due_date,past_due_days"
+    assert lines[1].startswith("1,Book 1,borrowed,alice,")
+    assert len(lines) == 2
@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from db.models.books import BookModel
+from services.search import filter_key, fts5_match_expression, tsquery_expression, search_books_statement
+
+BOOKS = [
+    {"isbn": "439023483", "authors": "Suzanne Collins", "publication_year": 2008, "title": "The Hunger Games", "language": "eng"},
+    {"isbn": "439554934", "authors": "J.K. Rowling, Mary GrandPré", "publication_year": 1997, "title": "Harry Potter and the Philosopher's Stone", "language": "eng"},
+    {"isbn": "316015849", "authors": "Stephenie Meyer", "publication_year": 2005, "title": "Twilight", "language": "en-US"},
+    {"isbn": "399226907", "authors": "Eric Carle", "publication_year": 1969, "title": "The Very Hungry Caterpillar", "language": "eng"},
+]
+
+
+@pytest.fixture
+def session(db_engine):
+    with db_engine.begin() as connection:
+        connection.execute(insert(BookModel), [dict(book, rental_status="available") for book in BOOKS])
+    with Session(db_engine) as session:
+        yield session
+
+
+def search(session, **filters):
+    stmt = search_books_statement(session.get_bind().dialect.name, **filters)
+    return [book.title for book in session.execute(stmt).scalars()]
+
+
+def test_match_expression_is_column_scoped_and_prefixed():
+    assert fts5_match_expression(author="suz col", title="Hunger") == 'authors : ("suz"* "col"*) AND title : ("hunger"*)'
+    assert fts5_match_expression() is None
+    assert tsquery_expression(author="rowling", title="harry") == "'rowling':*B & 'harry':*A"
+
+
+def test_prefix_multi_term_search(session):
+    assert sorted(search(session, title="hung")) == ["The Hunger Games", "The Very Hungry Caterpillar"]
+    assert search(session, title="harry stone") == ["Harry Potter and the Philosopher's Stone"]
+    assert search(session, author="grandpre") == ["Harry Potter and the Philosopher's Stone"]
+
+
+def test_author_and_title_filters_are_combined(session):
+    assert search(session, author="carle", title="hungry") == ["The Very Hungry Caterpillar"]
+    assert search(session, author="collins", title="twilight") == []
+
+
+def test_filter_without_words_falls_back_to_substring(session):
+    assert search(session, title="'") == ["Harry Potter and the Philosopher's Stone"]
+
+
+def test_index_follows_writes(session):
+    session.execute(update(BookModel).where(BookModel.title == "Twilight").values(title="New Moon"))
+    session.commit()
+    assert search(session, title="twilight") == []
+    assert search(session, title="moon") == ["New Moon"]
+
+
+def test_keyset_pages_cover_every_match_once(session):
+    session.execute(insert(BookModel), [
+        {"isbn": str(n), "authors": "Anon", "publication_year": 2000, "title": f"Hunger {'and more ' * (n % 4)}", "language": "eng", "rental_status": "available"}
+        for n in range(30)
+    ])
+    session.commit()
+    dialect = session.get_bind().dialect.name
+    expected = [book.id for book in session.execute(search_books_statement(dialect, title="hunger")).scalars()]
+
+    seen, after = [], None
+    while True:
+        stmt = search_books_statement(dialect, title="hunger", after=after, limit=7)
+        page = [book.id for book in session.execute(stmt).scalars()]
+        if not page:
+            break
+        seen += page
+        after = page[-1]
+    assert seen == expected
+    assert len(expected) == 31
+
+
+def test_filter_key_follows_the_query_that_runs():
+    assert filter_key("sqlite", "Hunger  GAMES") == filter_key("sqlite", "hunger games")
+    assert filter_key("sqlite", "'") == "substring:'"
+    assert filter_key("sqlite", "'") != filter_key("sqlite", None)
+    assert filter_key("mysql", "Hunger") != filter_key("mysql", "hunger!")
@@ -0,0 +1,74 @@
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+from services.tokens import TokenVerifier, JoseBackend
+
+KEY = "test-key"
+
+
+class CountingBackend(JoseBackend):
+    def __init__(self):
+        super().__init__()
+        self.decodes = 0
+
+    def decode(self, token, key, algorithms):
+        self.decodes += 1
+        return super().decode(token, key, algorithms)
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_token(sub="reader@example.com", exp=1_000_060, key=KEY):
+    return jwt.encode({"sub": sub, "exp": exp}, key, "HS256")
+
+
+@pytest.fixture
+def backend():
+    return CountingBackend()
+
+
+def test_verified_claims_are_cached_until_exp(backend):
+    clock = Clock()
+    verifier = TokenVerifier(KEY, ["HS256"], backend=backend, clock=clock)
+    # jose checks exp against the real clock, so the token must be valid now.
+    token = make_token(exp=int(2e9))
+    clock.now = 2e9 - 10
+
+    assert verifier.verify(token).sub == "reader@example.com"
+    assert verifier.verify(token).sub == "reader@example.com"
+    assert backend.decodes == 1
+    assert verifier.stats()["hits"] == 1
+
+    clock.now = 2e9 + 1
+    with pytest.raises(HTTPException) as exc:
+        verifier.verify(token)
+    assert exc.value.status_code == 401
+    assert backend.decodes == 2
+    assert verifier.stats()["cached"] == 0
+
+
+def test_invalid_tokens_are_rejected_and_not_cached(backend):
+    verifier = TokenVerifier(KEY, ["HS256"], backend=backend)
+    token = make_token(exp=int(2e9), key="other-key")
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            verifier.verify(token)
+        assert exc.value.status_code == 403
+    assert backend.decodes == 2
+    assert verifier.stats()["failures"] == 2
+
+
+def test_cache_is_bounded(backend):
+    verifier = TokenVerifier(KEY, ["HS256"], backend=backend, maxsize=2)
+    tokens = [make_token(sub=f"user{i}@example.com", exp=int(2e9)) for i in range(3)]
+    for token in tokens:
+        verifier.verify(token)
+    verifier.verify(tokens[0])  # evicted as least recently used
+    assert backend.decodes == 4
+    assert verifier.stats()["cached"] == 2
@@ -0,0 +1,58 @@
+import asyncio
+import hashlib
+import json
+import httpx
+from fastapi import Body, FastAPI
+from fastapi.testclient import TestClient
+from bench.replay import replay, replayable, summarize
+from services.logger import flush_logging
+from services.traffic import TrafficCaptureMiddleware, capture_logger, read_capture
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login(payload: dict = Body(...)):
+        return {"ok": True}
+
+    @app.get("/books/{book_id}")
+    async def get_book(book_id: int):
+        return {"id": book_id}
+
+    return app
+
+
+def test_capture_is_sanitized(tmp_path):
+    sent = json.dumps({"email": "reader@example.com", "password": "hunter2"}).encode()
+    path = tmp_path / "traffic.jsonl"
+    app = make_app()
+    app.add_middleware(TrafficCaptureMiddleware, logger=capture_logger(str(path)), bodies=True)
+    with TestClient(app) as client:
+        client.get("/books/7?token=abc&format=json", headers={"Authorization": "Bearer secret"})
+        client.post("/login", content=sent, headers={"Content-Type": "application/json"})
+    flush_logging()
+    first, second = read_capture([str(path)])
+    assert first["route"] == "/books/{book_id}"
+    assert first["query"] == "token=REDACTED&format=json"
+    assert first["auth"] is True and first["status"] == 200
+    assert "secret" not in path.read_text() and "hunter2" not in path.read_text()
+    assert json.loads(second["body"]) == {"email": "reader@example.com", "password": "REDACTED"}
+    assert second["body_sha256"] and second["body_bytes"] > 0
+    assert second["body_sha256"] != hashlib.sha256(sent).hexdigest()
+    assert second["body_sha256"] == hashlib.sha256(second["body"].encode()).hexdigest()
+    assert not replayable(second)
+
+
+def test_replay_compares_with_the_capture():
+    records = [
+        {"ts": 100.0, "method": "GET", "path": "/books/1", "route": "/books/{book_id}", "query": "", "content_type": None,
+         "auth": False, "body_bytes": 0, "status": 200, "duration_ms": 1.0},
+        {"ts": 100.05, "method": "GET", "path": "/books/x", "route": "/books/{book_id}", "query": "", "content_type": None,
+         "auth": False, "body_bytes": 0, "status": 200, "duration_ms": 1.0},
+    ]
+    results = asyncio.run(replay(records, "http://test", speed=10, transport=httpx.ASGITransport(app=make_app())))
+    summary = summarize(results)
+    assert summary["requests"] == 2
+    assert summary["status_mismatches"] == 1  # /books/x is now a 422
+    assert summary["replayed_errors"] == 0